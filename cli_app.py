@@ -1,8 +1,18 @@
-from typing import List
+import json
+from dataclasses import asdict
+from pathlib import Path
 
 import click
 
+import profiles
+import query as qlang
+import recommend
+import resultcache
+import search
+import similarity
 import storage
+from io_utils import format_for_path, iter_records
+from utils import parse_csv_list
 
 
 def _fmt_line(p: dict) -> str:
@@ -33,21 +43,84 @@ def seed_30_cmd():
     click.echo(f"Seeded {n} perfumes")
 
 
+@app.command("seed-n")
+@click.option("--count", required=True, type=click.IntRange(min=0), help="How many perfumes")
+@click.option("--seed", default=0, show_default=True, type=int, help="Random seed")
+def seed_n_cmd(count: int, seed: int):
+    """Write N synthetic perfumes for load testing (overwrites current DB)."""
+    n = storage.seed_n(count, seed)
+    click.echo(f"Seeded {n} perfumes")
+
+
 # ---------- List ----------
 @app.command("list")
-def list_cmd():
-    """List all perfumes (with header)."""
-    items = storage.list_perfumes()
-    click.echo(f"Perfumes ({len(items)})")
+@click.option("--brand", multiple=True, help="Only this brand (repeat to allow several)")
+@click.option("--family", multiple=True, help="Only this family (repeatable)")
+@click.option("--concentration", multiple=True, help="Only this concentration (repeatable)")
+@click.option("--note", multiple=True, help="Must have this note (repeatable: any of them)")
+@click.option("--allergen", multiple=True, help="Must list this allergen (repeatable)")
+@click.option("--exclude-allergen", multiple=True, help="Drop perfumes with this allergen")
+@click.option("--min-price", type=float, default=None, help="Lowest price (inclusive)")
+@click.option("--max-price", type=float, default=None, help="Highest price (inclusive)")
+@click.option(
+    "--sort",
+    type=click.Choice(sorted(search.SORTABLE)),
+    default=None,
+    help="Sort by field (price ascending; rating and stock descending)",
+)
+@click.option("--desc/--asc", "descending", default=None, help="Override the sort direction")
+@click.option("--limit", type=click.IntRange(min=0), default=None, help="Show at most N")
+@click.option("--facets", "show_facets", is_flag=True, help="Also print per-facet counts")
+def list_cmd(
+    brand,
+    family,
+    concentration,
+    note,
+    allergen,
+    exclude_allergen,
+    min_price,
+    max_price,
+    sort,
+    descending,
+    limit,
+    show_facets,
+):
+    """List all perfumes (with header), optionally filtered, sorted and limited."""
+    include = {
+        "brand": brand,
+        "family": family,
+        "concentration": concentration,
+        "note": note,
+        "allergen": allergen,
+    }
+    include = {k: list(v) for k, v in include.items() if v}
+    exclude = {"allergen": list(exclude_allergen)} if exclude_allergen else {}
+    ranges = (
+        {"price": (min_price, max_price)} if min_price is not None or max_price is not None else {}
+    )
+    if not (include or exclude or ranges or sort or limit is not None or show_facets):
+        items = storage.load_perfumes()  # one parse; the header needs the count first
+        click.echo(f"Perfumes ({len(items)})")
+        for p in items:
+            click.echo(_fmt_line(p))
+        return
+    total, items, counts = search.browse(
+        include, exclude, ranges, sort=sort, descending=descending, limit=limit, facets=show_facets
+    )
+    click.echo(f"Perfumes ({total})")
     for p in items:
         click.echo(_fmt_line(p))
+    if show_facets:
+        for facet, values in counts.items():
+            if values:
+                click.echo(f"{facet}: " + ", ".join(f"{v} ({n})" for v, n in values.items()))
 
 
 # Some tests/environments expect this alias. Keep both.
 @app.command("list-perfumes-cmd")
 def list_perfumes_cmd():
     """Alias: list all perfumes (with header)."""
-    items = storage.list_perfumes()
+    items = storage.load_perfumes()
     click.echo(f"Perfumes ({len(items)})")
     for p in items:
         click.echo(_fmt_line(p))
@@ -61,7 +134,7 @@ def list_perfumes_cmd():
 @click.option("--notes", default="", type=str, help='Comma-separated notes e.g. "rose,musk"')
 def add_perf_cmd(name: str, brand: str, price: float, notes: str):
     """Add a perfume with minimal fields used in tests."""
-    notes_list: List[str] = [n.strip() for n in notes.split(",") if n.strip()] if notes else []
+    notes_list: list[str] = [n.strip() for n in notes.split(",") if n.strip()] if notes else []
     payload = {
         "name": name,
         "brand": brand,
@@ -76,39 +149,250 @@ def add_perf_cmd(name: str, brand: str, price: float, notes: str):
 
 
 # ---------- Find ----------
-@app.command("find")
-@click.argument("query", type=str)
-def find_cmd(query: str):
-    """Find by name/brand/notes (case-insensitive)."""
-    q = query.lower().strip()
-    items = storage.list_perfumes()
-    hits = []
-    for p in items:
-        if q in (p.get("name", "").lower()) or q in (p.get("brand", "").lower()):
-            hits.append(p)
-            continue
-        notes = [str(n).lower() for n in (p.get("notes") or [])]
-        if any(q in n for n in notes):
-            hits.append(p)
+@app.command("find", context_settings={"ignore_unknown_options": True})
+@click.argument("query", nargs=-1, type=str)
+@click.option("--any", "any_term", is_flag=True, help="Match any term instead of all terms")
+@click.option("--explain", is_flag=True, help="Show the query plan and candidate counts")
+@click.option(
+    "--exclude-allergen", multiple=True, help="Drop perfumes with this allergen (repeatable)"
+)
+def find_cmd(query, any_term: bool, explain: bool, exclude_allergen):
+    """Find by name/brand/notes/family (case-insensitive, all terms must match).
+
+    Also takes structured queries, e.g. notes:rose brand:"Tom Ford" price<120 -allergen:citral
+    """
+    query = " ".join(query)
+    if not query.strip():
+        return
+    try:
+        node = qlang.parse(query)
+    except ValueError as e:
+        if qlang.has_fields(query):
+            click.echo(f"Invalid query: {e}")
+            raise SystemExit(1)
+        # plain words with a stray ( ) " or OR: match them the way find always did
+        node = None
+    if any_term or node is None or not qlang.is_structured(node):
+        hits = search.find(
+            query, mode="or" if any_term else "and", exclude_allergens=exclude_allergen
+        )
+        steps = [("index", "token + substring match", len(hits), len(hits))]
+    else:
+        # exclusions become -allergen: terms, so the planner applies them as bitmaps;
+        # built as nodes, since the query syntax cannot quote a value containing "
+        if exclude_allergen:
+            terms = node.children if isinstance(node, qlang.And) else [node]
+            node = qlang.And(
+                [*terms, *(qlang.Not(qlang.Facet("allergen", a)) for a in exclude_allergen)]
+            )
+        hits, steps = qlang.run(node)
+    if explain:
+        click.echo(f"Plan for: {query if node is None else node}")
+        for i, (action, pred, est, left) in enumerate(steps, 1):
+            click.echo(f"  {i}. {action:<6} {pred}  (estimate {est}, {left} left)")
     for p in hits:
         click.echo(_fmt_line(p))
 
 
+# ---------- Fuzzy find ----------
+@app.command("fuzzy-find")
+@click.argument("query", type=str)
+@click.option("--limit", default=10, show_default=True, type=click.IntRange(min=1))
+@click.option(
+    "--cutoff",
+    default=60.0,
+    show_default=True,
+    type=click.FloatRange(0, 100),
+    help="Minimum score (0-100)",
+)
+@click.option(
+    "--exclude-allergen", multiple=True, help="Drop perfumes with this allergen (repeatable)"
+)
+def fuzzy_find_cmd(query: str, limit: int, cutoff: float, exclude_allergen):
+    """Typo-tolerant search over name and brand, best match first."""
+    hits = search.fuzzy(query, limit=limit, score_cutoff=cutoff, exclude_allergens=exclude_allergen)
+    if not hits:
+        click.echo("Not found")
+        return
+    for p, score in hits:
+        click.echo(f"{score:5.1f}  {_fmt_line(p)}")
+
+
+# ---------- Complete ----------
+@app.command("complete")
+@click.argument("prefix", type=str)
+@click.option("--limit", default=10, show_default=True, type=click.IntRange(min=1))
+def complete_cmd(prefix: str, limit: int):
+    """Suggest names, brands and notes starting with PREFIX (any word of them)."""
+    for s in search.suggest(prefix, limit):
+        click.echo(f"{s['text']}  ({s['kind']})")
+
+
+# ---------- Similar ----------
+@app.command("similar")
+@click.argument("token", type=str)
+@click.option("-k", "k", default=10, show_default=True, type=click.IntRange(min=1))
+def similar_cmd(token: str, k: int):
+    """Perfumes most like TOKEN (exact id or name): shared notes, family, concentration."""
+    hit = storage.get_perfume(token) or storage.find_perfume(token)
+    hits = similarity.similar(str(hit.get("id")), k) if hit else None
+    if hits is None:
+        click.echo("Not found")
+        return
+    for p in hits:
+        click.echo(f"{p['score']:.3f}  {_fmt_line(p)}")
+
+
+# ---------- Recommend ----------
+@app.command("recommend")
+@click.option(
+    "--profile",
+    "profile_file",
+    type=click.File("r", encoding="utf-8"),
+    default=None,
+    help='JSON profile: {"preferred_notes": [...], "avoid_allergens": [...]}',
+)
+@click.option("--user", "user_id", default=None, help="Id of a stored profile (see profile-add)")
+@click.option("--notes", default="", help='Comma-separated preferred notes e.g. "rose,amber"')
+@click.option("--avoid", default="", help="Comma-separated allergens to exclude")
+@click.option("-k", "k", default=10, show_default=True, type=click.IntRange(min=1))
+def recommend_cmd(profile_file, user_id, notes: str, avoid: str, k: int):
+    """Recommend perfumes for a profile (preferred notes, avoided allergens)."""
+    profile = {"preferred_notes": [], "avoid_allergens": []}
+    if user_id is not None:
+        stored = profiles.get_profile(user_id)
+        if stored is None:
+            click.echo("Profile not found")
+            raise SystemExit(1)
+        profile.update(asdict(stored))
+    if profile_file is not None:
+        try:
+            data = json.load(profile_file)
+        except ValueError as e:
+            click.echo(f"Invalid JSON: {e}")
+            raise SystemExit(1)
+        if not isinstance(data, dict):
+            click.echo("Invalid profile: expected a JSON object")
+            raise SystemExit(1)
+        profile.update(data)
+    for field, extra in (("preferred_notes", notes), ("avoid_allergens", avoid)):
+        value = profile[field]
+        if isinstance(value, str):
+            value = [value]
+        if isinstance(value, list):
+            profile[field] = value + parse_csv_list(extra)
+    try:
+        hits = recommend.recommend(profile, k)
+    except ValueError as e:
+        click.echo(f"Invalid profile: {e}")
+        raise SystemExit(1)
+    if not hits:
+        click.echo("No recommendations")
+        return
+    for p in hits:
+        click.echo(f"{p['score']:.3f}  {_fmt_line(p)}")
+
+
+@app.command("recommend-batch")
+@click.argument("profiles", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--output",
+    type=click.File("w", encoding="utf-8"),
+    default="-",
+    help="NDJSON destination (default: stdout)",
+)
+@click.option("-k", "k", default=10, show_default=True, type=click.IntRange(min=1))
+@click.option(
+    "--memory-mb",
+    default=256,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Approximate scoring memory budget",
+)
+@click.option(
+    "--workers",
+    default=0,
+    show_default=True,
+    type=click.IntRange(min=0),
+    help="Score chunks in this many processes (0/1: in-process)",
+)
+def recommend_batch_cmd(profiles, output, k: int, memory_mb: int, workers: int):
+    """Recommend for every profile in PROFILES (JSON array or NDJSON); writes NDJSON."""
+    try:
+        for pid, hits in recommend.batch(iter_records(Path(profiles)), k, memory_mb, workers):
+            output.write(json.dumps({"profile": pid, "items": hits}, ensure_ascii=False) + "\n")
+    except ValueError as e:
+        click.echo(str(e), err=True)
+        raise SystemExit(1)
+
+
+# ---------- Profiles ----------
+@app.command("profile-add")
+@click.argument("name", type=str)
+@click.option("--notes", default="", help='Comma-separated preferred notes e.g. "rose,oud"')
+@click.option("--avoid", default="", help="Comma-separated allergens to avoid")
+def profile_add_cmd(name: str, notes: str, avoid: str):
+    """Save a user profile and print its id."""
+    try:
+        p = profiles.add_profile(name, parse_csv_list(notes), parse_csv_list(avoid))
+    except ValueError as e:
+        click.echo(str(e))
+        raise SystemExit(1)
+    click.echo(p.id)
+
+
+@app.command("profile-list")
+def profile_list_cmd():
+    """List stored user profiles."""
+    stored = profiles.list_profiles()
+    if not stored:
+        click.echo("No profiles")
+        return
+    for p in stored:
+        notes = ", ".join(p.preferred_notes) or "-"
+        avoid = ", ".join(p.avoid_allergens) or "-"
+        click.echo(f"{p.id}  {p.name} | likes: {notes} | avoids: {avoid}")
+
+
+@app.command("profile-delete")
+@click.argument("pid", type=str)
+def profile_delete_cmd(pid: str):
+    """Delete a stored profile by id."""
+    if not profiles.delete_profile(pid):
+        click.echo("Not found")
+        raise SystemExit(1)
+    click.echo("Deleted")
+
+
+@app.command("notify")
+@click.argument("token", type=str)
+def notify_cmd(token: str):
+    """Profiles to notify about perfume TOKEN: they like one of its notes and avoid none of its allergens."""
+    hit = storage.get_perfume(token) or storage.find_perfume(token)
+    if not hit:
+        click.echo("Not found")
+        raise SystemExit(1)
+    stored = profiles.to_notify(hit)
+    if not stored:
+        click.echo("No matching profiles")
+        return
+    for p in stored:
+        click.echo(f"{p.id}  {p.name}")
+
+
 # ---------- Show ----------
 @app.command("show")
 @click.argument("token", type=str)
 def show_cmd(token: str):
     """Show a single perfume by id (exact) or name substring (case-insensitive)."""
-    items = storage.list_perfumes()
-    t = token.lower().strip()
-    for p in items:
-        if str(p.get("id")) == token:
-            click.echo(_fmt_line(p))
-            return
-    for p in items:
-        if t in str(p.get("name", "")).lower():
-            click.echo(_fmt_line(p))
-            return
+    hit = storage.get_perfume(token) or storage.find_perfume(token)
+    if hit:
+        click.echo(_fmt_line(hit))
+        return
+    hits = search.name_contains(token)
+    if hits:
+        click.echo(_fmt_line(hits[0]))
+        return
     click.echo("Not found")
 
 
@@ -117,13 +401,8 @@ def show_cmd(token: str):
 @click.argument("token", type=str)
 def delete_cmd(token: str):
     """Delete by exact id or exact name (case-insensitive)."""
-    token_l = token.lower().strip()
-    items = storage.list_perfumes()
-    target_id = None
-    for p in items:
-        if str(p.get("id")) == token or str(p.get("name", "")).lower() == token_l:
-            target_id = str(p.get("id"))
-            break
+    hit = storage.find_perfume(token)
+    target_id = str(hit.get("id")) if hit else None
     if not target_id:
         click.echo("Not found")
         raise SystemExit(1)
@@ -134,7 +413,7 @@ def delete_cmd(token: str):
     elif hasattr(storage, "delete_perfume"):
         ok = storage.delete_perfume(target_id)  # type: ignore[attr-defined]
     else:
-        data = [p for p in items if str(p.get("id")) != target_id]
+        data = [p for p in storage.list_perfumes() if str(p.get("id")) != target_id]
         storage.write_db(data)
         ok = True
 
@@ -143,3 +422,86 @@ def delete_cmd(token: str):
     else:
         click.echo("Not found")
         raise SystemExit(1)
+
+
+# ---------- Bulk ----------
+@app.command("bulk")
+@click.argument("path", type=click.File("r", encoding="utf-8"))
+def bulk_cmd(path):
+    """Apply a JSON batch file: {"add": [...], "update": {id: {...}}, "delete": [ids]}."""
+    try:
+        batch = json.load(path)
+    except ValueError as e:
+        click.echo(f"Invalid JSON: {e}")
+        raise SystemExit(1)
+    try:
+        results = storage.apply_bulk(batch)
+    except ValueError as e:
+        click.echo(str(e))
+        raise SystemExit(1)
+    failed = 0
+    for part, rows in results.items():
+        good = sum(1 for r in rows if r["ok"])
+        click.echo(f"{part}: {good} ok, {len(rows) - good} failed")
+        for r in rows:
+            if not r["ok"]:
+                failed += 1
+                click.echo(f"  {r.get('id', r.get('index'))}: {r['error']}")
+    if failed:
+        raise SystemExit(1)
+
+
+# ---------- Maintenance ----------
+@app.command("compact")
+def compact_cmd():
+    """Fold the write journal (db.json.log) back into db.json."""
+    n = storage.compact()
+    click.echo(f"Compacted {n} perfumes")
+
+
+@app.command("cache-stats")
+def cache_stats_cmd():
+    """Show this process's query result cache size and hit/miss/eviction counters.
+
+    The cache lives in memory, so a fresh shell always starts at zero. Run it
+    from the web terminal, or GET /api/admin/cache, to see the web app's cache.
+    """
+    for k, v in resultcache.stats().items():
+        click.echo(f"{k}: {v}")
+
+
+@app.command("convert")
+@click.option("--to", "fmt", default=None, help="json-pretty, json or ndjson, optionally .gz/.zst")
+@click.option("--output", default=None, type=click.Path(dir_okay=False), help="Write here instead")
+def convert_cmd(fmt, output):
+    """Rewrite the database in another on-disk format."""
+    if not fmt:
+        if not output:
+            click.echo("Give --to FORMAT or an --output path with a known extension")
+            raise SystemExit(1)
+        fmt = format_for_path(Path(output))
+    try:
+        n = storage.convert(fmt, output)
+    except ValueError as e:
+        click.echo(str(e))
+        raise SystemExit(1)
+    click.echo(f"Converted {n} perfumes to {fmt}")
+
+
+@app.command("export-records")
+def export_records_cmd():
+    """Write db.rec, an id-indexed binary copy for fast point lookups."""
+    try:
+        n = storage.export_records()
+    except ValueError as e:
+        click.echo(str(e))
+        raise SystemExit(1)
+    click.echo(f"Exported {n} perfumes")
+
+
+@app.command("migrate-sqlite")
+@click.option("--source", default=None, type=click.Path(dir_okay=False), help="JSON db to import")
+def migrate_sqlite_cmd(source):
+    """Import db.json into the SQLite backend (AROMAVAULT_BACKEND=sqlite)."""
+    n = storage.migrate_to_sqlite(source)
+    click.echo(f"Migrated {n} perfumes to SQLite")
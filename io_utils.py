@@ -1,19 +1,264 @@
+import gzip
+import io
 import json
+import os
+from collections.abc import Iterable, Iterator
+from itertools import islice
 from pathlib import Path
+from typing import BinaryIO, TextIO
+
+try:  # zstd is optional: Python 3.14+ ships it, older versions need "zstandard"
+    from compression import zstd as _zstd  # type: ignore[import-not-found]
+except ImportError:
+    try:
+        import zstandard as _zstandard  # type: ignore[import-not-found]
+    except ImportError:
+        _zstandard = None
+    _zstd = None
+
+# On-disk formats: "json-pretty" (indent=2, the historical default), "json"
+# (minified) and "ndjson" (one record per line), each optionally compressed
+# as "<format>.gz" or "<format>.zst".
+FORMATS = ("json-pretty", "json", "ndjson")
+COMPRESSIONS = ("gz", "zst")
+_GZIP_MAGIC = b"\x1f\x8b"
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def parse_format(fmt: str) -> tuple[str, str | None]:
+    """Split "ndjson.gz" into ("ndjson", "gz"); raises ValueError for unknown formats."""
+    base, _, comp = fmt.strip().lower().partition(".")
+    if base not in FORMATS or (comp and comp not in COMPRESSIONS):
+        choices = ", ".join(FORMATS)
+        raise ValueError(f"Unknown format {fmt!r}; use one of {choices} (optionally .gz/.zst)")
+    return base, comp or None
+
+
+def format_for_path(path: Path) -> str:
+    """Guess a format from the file extension, e.g. catalog.ndjson.gz -> "ndjson.gz"."""
+    suffixes = [s.lstrip(".").lower() for s in path.suffixes]
+    comp = suffixes.pop() if suffixes and suffixes[-1] in COMPRESSIONS else None
+    base = "ndjson" if suffixes and suffixes[-1] in ("ndjson", "jsonl") else "json-pretty"
+    return f"{base}.{comp}" if comp else base
+
+
+def _compression_of(head: bytes) -> str | None:
+    if head.startswith(_GZIP_MAGIC):
+        return "gz"
+    if head.startswith(_ZSTD_MAGIC):
+        return "zst"
+    return None
+
+
+def _zstd_missing() -> ValueError:
+    return ValueError("zstd compression needs Python 3.14+ or the 'zstandard' package")
+
+
+def open_text(path: Path) -> TextIO:
+    """Open ``path`` for reading text, transparently decompressing gzip/zstd by magic bytes."""
+    raw = path.open("rb")
+    comp = _compression_of(raw.read(4))
+    raw.seek(0)
+    stream: BinaryIO = raw
+    if comp == "gz":
+        stream = gzip.GzipFile(fileobj=raw, mode="rb")  # type: ignore[assignment]
+    elif comp == "zst":
+        if _zstd is not None:
+            stream = _zstd.ZstdFile(raw, mode="rb")
+        elif _zstandard is not None:
+            stream = _zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+        else:
+            raw.close()
+            raise _zstd_missing()
+    return io.TextIOWrapper(stream, encoding="utf-8")
+
+
+def detect_format(path: Path) -> str | None:
+    """Sniff the format of an existing file from its header; None if missing or empty.
+
+    An empty array says nothing about pretty vs minified, so it counts as empty
+    too (compressed, it keeps its compression with the json-pretty default).
+    """
+    try:
+        with open_text(path) as f:
+            head = f.read(64).lstrip()
+        with path.open("rb") as raw:
+            comp = _compression_of(raw.read(4))
+    except FileNotFoundError:
+        return None
+    if not head:
+        return None
+    if head[0] == "{":
+        base = "ndjson"
+    elif head[1:].lstrip().startswith("]"):
+        return f"json-pretty.{comp}" if comp else None
+    else:
+        base = "json-pretty" if head[1:2] in ("\n", "\r", " ") else "json"
+    return f"{base}.{comp}" if comp else base
 
 
 def read_json(path: Path) -> list[dict]:
     try:
         if not path.exists():
             return []
-        with path.open("r", encoding="utf-8") as f:
-            return json.load(f)
+        with open_text(path) as f:
+            text = f.read()
+    except (OSError, EOFError) as e:
+        raise ValueError(f"Unreadable data in {path.name}: {e}") from e
+    try:
+        stripped = text.lstrip()
+        if stripped.startswith("{"):
+            return [json.loads(line) for line in stripped.splitlines() if line.strip()]
+        return json.loads(text) if stripped else []
     except json.JSONDecodeError as e:
         raise ValueError(f"Invalid JSON in {path.name}: {e}") from e
 
 
-def write_json(path: Path, data: list[dict]) -> None:
+def write_records(path: Path, data: Iterable[dict], fmt: str = "json-pretty") -> os.stat_result:
+    """Write ``data`` in ``fmt`` atomically via a temp file; returns the stat of the new file.
+
+    ``data`` may be any iterable and is consumed one record at a time.
+    """
+    base, comp = parse_format(fmt)
+    if comp == "zst" and _zstd is None and _zstandard is None:
+        raise _zstd_missing()
     tmp = path.with_suffix(path.suffix + ".tmp")
-    with tmp.open("w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    with tmp.open("wb") as raw:
+        stream: BinaryIO = raw
+        if comp == "gz":
+            stream = gzip.GzipFile(fileobj=raw, mode="wb", mtime=0)  # type: ignore[assignment]
+        elif comp == "zst":
+            if _zstd is not None:
+                stream = _zstd.ZstdFile(raw, mode="wb")
+            else:
+                stream = _zstandard.ZstdCompressor().stream_writer(raw, closefd=False)
+        f = io.TextIOWrapper(stream, encoding="utf-8")
+        _write_text(f, data, base)
+        f.flush()
+        f.detach()
+        if stream is not raw:
+            stream.close()  # writes the compression trailer, leaves raw open
+        raw.flush()
+        st = os.fstat(raw.fileno())
     tmp.replace(path)
+    return st
+
+
+# Records per json.dumps call: big enough that the encoder, not Python, does
+# the work, small enough that memory stays bounded for iterators.
+WRITE_BATCH = 4096
+
+
+def _write_text(f: TextIO, data: Iterable[dict], base: str) -> None:
+    it = iter(data)
+    if base == "ndjson":
+        while batch := list(islice(it, WRITE_BATCH)):
+            f.write(
+                "".join(
+                    json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n" for r in batch
+                )
+            )
+        return
+    # Each batch is dumped as a list and its brackets are dropped, so the
+    # output is byte-for-byte what one json.dumps(list) would have written.
+    pretty = base == "json-pretty"
+    opts: dict = {"indent": 2} if pretty else {"separators": (",", ":")}
+    start, end, sep = ("[\n", "\n]", ",\n") if pretty else ("[", "]", ",")
+    first = True
+    while batch := list(islice(it, WRITE_BATCH)):
+        body = json.dumps(batch, ensure_ascii=False, **opts)[len(start) : -len(end)]
+        f.write((start if first else sep) + body)
+        first = False
+    f.write("[]" if first else end)
+
+
+def write_json(path: Path, data: list[dict]) -> os.stat_result:
+    """Write pretty JSON atomically via a temp file; returns the stat of the file now at ``path``."""
+    return write_records(path, data, "json-pretty")
+
+
+def iter_records(path: Path, chunk_size: int = 1 << 16) -> Iterator[dict]:
+    """Yield records from a JSON array or NDJSON file (optionally compressed) one at a time."""
+    with open_text(path) as f:
+        head = f.read(chunk_size)
+        if head.lstrip().startswith("{"):
+            pending = head
+            while True:
+                *lines, pending = pending.split("\n")
+                for line in lines:
+                    if line.strip():
+                        yield _ndjson_line(line, path)
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                pending += chunk
+            if pending.strip():
+                yield _ndjson_line(pending, path)
+            return
+        yield from _iter_array(f, path.name, chunk_size, head)
+
+
+def _ndjson_line(line: str, path: Path) -> dict:
+    try:
+        return json.loads(line)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON in {path.name}: {e}") from e
+
+
+def _iter_array(f: TextIO, name: str, chunk_size: int, buf: str) -> Iterator[dict]:
+    decoder = json.JSONDecoder()
+    pos, eof = 0, False
+
+    def more() -> bool:
+        nonlocal buf, pos, eof
+        chunk = f.read(chunk_size)
+        if not chunk:
+            eof = True
+            return False
+        buf = buf[pos:] + chunk
+        pos = 0
+        return True
+
+    def next_char() -> str:
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n":
+                pos += 1
+            if pos < len(buf):
+                return buf[pos]
+            if not more():
+                return ""
+
+    first = next_char()
+    if first == "":
+        return
+    if first != "[":
+        raise ValueError(f"Invalid JSON in {name}: expected a top-level array")
+    pos += 1
+    expect_value = True
+    while True:
+        c = next_char()
+        if c == "]":
+            return
+        if not expect_value:
+            if c != ",":
+                raise ValueError(f"Invalid JSON in {name}: expected ',' at offset {pos}")
+            pos += 1
+            next_char()
+        while True:
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+                # only trust the value once its delimiter is in the buffer;
+                # otherwise it may be a number cut off at the chunk edge
+                j = end
+                while j < len(buf) and buf[j] in " \t\r\n":
+                    j += 1
+                if eof or (j < len(buf) and buf[j] in ",]"):
+                    break
+            except json.JSONDecodeError as e:
+                if eof:
+                    raise ValueError(f"Invalid JSON in {name}: {e}") from e
+            more()
+        pos = end
+        expect_value = False
+        yield obj
@@ -0,0 +1,181 @@
+"""Persistent store for models.UserProfile, next to the perfume db.
+
+Profiles live in ``profiles.json`` beside storage.DEFAULT_DB (or at
+AROMAVAULT_PROFILES) and every write goes through io_utils.write_json, so
+the file is replaced atomically. In memory the store keeps inverted indexes
+from each folded preferred note and avoided allergen to profile ids, kept in
+step on every write, so "who wants to hear about this new perfume" is a few
+set unions instead of a scan over all profiles.
+"""
+
+from __future__ import annotations
+
+import os
+from collections.abc import Iterable
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any
+
+import storage
+from io_utils import read_json, write_json
+from models import UserProfile
+from textnorm import fold
+
+# Overrides the default location (profiles.json next to the perfume db).
+PROFILES_DB = os.environ.get("AROMAVAULT_PROFILES") or None
+
+# Keyed on the path and (mtime_ns, size, inode), like storage's catalog cache,
+# so writes from another process are picked up on the next read.
+_CACHE: dict[str, Any] = {"path": None, "sig": None, "profiles": None, "index": None}
+
+
+def _path() -> Path:
+    return Path(PROFILES_DB) if PROFILES_DB else Path(storage.DEFAULT_DB).with_name("profiles.json")
+
+
+def _keys(values: Iterable[Any]) -> set[str]:
+    return {fold(v) for v in values or []} - {""}
+
+
+class _ProfileIndex:
+    """Folded note -> profile ids and folded allergen -> profile ids."""
+
+    def __init__(self, profiles: Iterable[UserProfile]):
+        self.notes: dict[str, set[str]] = {}
+        self.allergens: dict[str, set[str]] = {}
+        for p in profiles:
+            self.add(p)
+
+    @staticmethod
+    def _put(index: dict[str, set[str]], keys: set[str], pid: str) -> None:
+        for k in keys:
+            index.setdefault(k, set()).add(pid)
+
+    @staticmethod
+    def _pop(index: dict[str, set[str]], keys: set[str], pid: str) -> None:
+        for k in keys:
+            bucket = index.get(k)
+            if bucket is not None:
+                bucket.discard(pid)
+                if not bucket:
+                    del index[k]
+
+    def add(self, p: UserProfile) -> None:
+        self._put(self.notes, _keys(p.preferred_notes), p.id)
+        self._put(self.allergens, _keys(p.avoid_allergens), p.id)
+
+    def drop(self, p: UserProfile) -> None:
+        self._pop(self.notes, _keys(p.preferred_notes), p.id)
+        self._pop(self.allergens, _keys(p.avoid_allergens), p.id)
+
+    def lookup(self, index: dict[str, set[str]], values: Iterable[Any]) -> set[str]:
+        out: set[str] = set()
+        for k in _keys(values):
+            out |= index.get(k, set())
+        return out
+
+
+def _from_record(rec: dict[str, Any]) -> UserProfile | None:
+    if not isinstance(rec, dict) or not rec.get("id"):
+        return None
+    return UserProfile(
+        id=str(rec["id"]),
+        name=str(rec.get("name") or ""),
+        preferred_notes=list(rec.get("preferred_notes") or []),
+        avoid_allergens=list(rec.get("avoid_allergens") or []),
+    )
+
+
+def _store() -> dict[str, UserProfile]:
+    """id -> profile in file order, reloaded only when the file changed. Do not mutate."""
+    path = _path()
+    sig = storage._file_sig(path)
+    if _CACHE["profiles"] is not None and _CACHE["path"] == path and _CACHE["sig"] == sig:
+        return _CACHE["profiles"]
+    try:
+        data = read_json(path) if sig is not None else []
+    except ValueError:
+        data = []
+    profiles: dict[str, UserProfile] = {}
+    for rec in data if isinstance(data, list) else []:
+        p = _from_record(rec)
+        if p is not None:
+            profiles[p.id] = p
+    _CACHE.update(path=path, sig=sig, profiles=profiles, index=_ProfileIndex(profiles.values()))
+    return profiles
+
+
+def _index() -> _ProfileIndex:
+    _store()
+    return _CACHE["index"]
+
+
+def _write(
+    profiles: dict[str, UserProfile], added: list[UserProfile], dropped: list[UserProfile]
+) -> None:
+    """Persist ``profiles`` atomically, then bring the cache and indexes in step."""
+    index = _index()  # before the write, which would otherwise trigger a full reload
+    st = write_json(_path(), [asdict(p) for p in profiles.values()])
+    for p in dropped:
+        index.drop(p)
+    for p in added:
+        index.add(p)
+    _CACHE.update(profiles=profiles, sig=(st.st_mtime_ns, st.st_size, st.st_ino))
+
+
+def list_profiles() -> list[UserProfile]:
+    return list(_store().values())
+
+
+def get_profile(pid: str) -> UserProfile | None:
+    return _store().get(pid)
+
+
+def add_profile(name: str, preferred_notes: list[str], avoid_allergens: list[str]) -> UserProfile:
+    """Create and persist a profile; raises ValueError on an empty name."""
+    if not name or not name.strip():
+        raise ValueError("Profile name must not be empty")
+    profile = UserProfile.new(name, preferred_notes, avoid_allergens)
+    return save_profile(profile)
+
+
+def save_profile(profile: UserProfile) -> UserProfile:
+    """Insert or replace ``profile`` by id."""
+    profiles = dict(_store())
+    old = profiles.get(profile.id)
+    profiles[profile.id] = profile
+    _write(profiles, [profile], [old] if old is not None else [])
+    return profile
+
+
+def delete_profile(pid: str) -> bool:
+    profiles = dict(_store())
+    old = profiles.pop(pid, None)
+    if old is None:
+        return False
+    _write(profiles, [], [old])
+    return True
+
+
+def profiles_for_notes(notes: Iterable[Any]) -> list[UserProfile]:
+    """Profiles preferring any of ``notes``, by name."""
+    return _resolve(_index().lookup(_index().notes, notes))
+
+
+def profiles_avoiding(allergens: Iterable[Any]) -> list[UserProfile]:
+    """Profiles avoiding any of ``allergens``, by name."""
+    return _resolve(_index().lookup(_index().allergens, allergens))
+
+
+def to_notify(perfume: dict[str, Any]) -> list[UserProfile]:
+    """Profiles that prefer one of ``perfume``'s notes and avoid none of its allergens, by name."""
+    index = _index()
+    ids = index.lookup(index.notes, perfume.get("notes") or [])
+    if ids:
+        ids -= index.lookup(index.allergens, perfume.get("allergens") or [])
+    return _resolve(ids)
+
+
+def _resolve(ids: set[str]) -> list[UserProfile]:
+    profiles = _store()
+    return sorted((profiles[pid] for pid in ids), key=lambda p: (fold(p.name), p.id))
@@ -0,0 +1,383 @@
+"""Structured queries for ``find``: parser, predicate tree and planner.
+
+Syntax (terms are AND-ed; ``OR`` and parentheses group; ``-`` negates)::
+
+    notes:rose brand:"Tom Ford" price<120 rating>=4 -allergen:citral
+    (family:woody OR family:amber) name:noir vanilla
+
+``field:value`` on brand, family, concentration, note(s) and allergen(s) is
+an exact (folded) facet match; ``name:`` is a substring match; price, rating
+and stock take ``< <= > >= =``; bare words match like plain ``find``.
+
+Every predicate can be answered from the search indexes. The planner starts
+an AND from its most selective positive predicate and, once the candidate
+set is small, checks the remaining predicates record by record instead of
+materialising their (larger) bitmaps.
+"""
+
+from __future__ import annotations
+
+import re
+from abc import ABC, abstractmethod
+from bisect import bisect_left, bisect_right
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+import resultcache
+import search
+from textnorm import fold
+
+# query field -> facet name in search.FACETS
+FIELDS = {
+    "brand": "brand",
+    "family": "family",
+    "concentration": "concentration",
+    "note": "note",
+    "notes": "note",
+    "allergen": "allergen",
+    "allergens": "allergen",
+}
+_TOKEN = re.compile(
+    r"""\s*(?:
+        (?P<lparen>\() | (?P<rparen>\)) |
+        (?P<neg>-)?(?P<field>[A-Za-z_]+)(?P<op><=|>=|<|>|=|:)(?P<value>"[^"]*"|[^\s()"]+) |
+        (?P<neg2>-)?(?P<word>"[^"]*"|[^\s()"]+)
+    )""",
+    re.VERBOSE,
+)
+# a field term anywhere in the text, e.g. notes:rose, -allergen:citral or price<120
+_FIELD = re.compile(r"(?:^|[\s(])-?[A-Za-z_]+(?:<=|>=|<|>|=|:)")
+# once this few candidates remain, checking records beats building bitmaps
+VERIFY_LIMIT = 256
+
+
+class _Ctx:
+    """The catalog and its indexes for one query (one catalog version).
+
+    Also remembers what each node has computed, so a predicate estimated
+    while planning does not look its positions up again to build its bitmap.
+    """
+
+    def __init__(self) -> None:
+        self.items = search._indexes()["items"]
+        self.facets = search._index("facets")
+        self.size = self.facets.size
+        self._memo: dict[tuple[int, str], Any] = {}
+
+    def memo[T](self, node: Node, what: str, compute: Callable[[], T]) -> T:
+        # nodes are unhashable dataclasses but outlive the context, so id() is stable
+        key = (id(node), what)
+        if key not in self._memo:
+            self._memo[key] = compute()
+        return self._memo[key]
+
+
+@dataclass
+class Node(ABC):
+    def estimate(self, ctx: _Ctx) -> int:
+        return ctx.size
+
+    @abstractmethod
+    def bitmap(self, ctx: _Ctx) -> int:
+        """Bitset of the catalog positions matching this predicate."""
+
+    @abstractmethod
+    def matches(self, item: dict[str, Any]) -> bool:
+        """Whether one record matches, for verifying a few candidates directly."""
+
+
+@dataclass
+class Facet(Node):
+    facet: str
+    value: str
+
+    def bitmap(self, ctx: _Ctx) -> int:
+        return ctx.memo(self, "bitmap", lambda: ctx.facets.bitmap(self.facet, [self.value]))
+
+    def estimate(self, ctx: _Ctx) -> int:
+        return self.bitmap(ctx).bit_count()
+
+    def matches(self, item: dict[str, Any]) -> bool:
+        value = item.get(search.FACETS[self.facet])
+        values = value if isinstance(value, list) else [value]
+        return fold(self.value) in {fold(v) for v in values}
+
+    def __str__(self) -> str:
+        return f'{self.facet}:"{self.value}"'
+
+
+@dataclass
+class Range(Node):
+    field: str
+    op: str
+    number: float
+
+    def _span(self, ctx: _Ctx) -> list[int]:
+        return ctx.memo(self, "positions", self._lookup)
+
+    def _lookup(self) -> list[int]:
+        index = search._index(f"sorted:{self.field}")
+        vals, x = index.values, self.number
+        lo, hi = 0, len(vals)
+        if self.op in (">", ">="):
+            lo = (bisect_right if self.op == ">" else bisect_left)(vals, x)
+        elif self.op in ("<", "<="):
+            hi = (bisect_left if self.op == "<" else bisect_right)(vals, x)
+        else:
+            lo, hi = bisect_left(vals, x), bisect_right(vals, x)
+        return index.order[lo:hi]
+
+    def estimate(self, ctx: _Ctx) -> int:
+        return len(self._span(ctx))
+
+    def bitmap(self, ctx: _Ctx) -> int:
+        return ctx.memo(self, "bitmap", lambda: search._bitmap(self._span(ctx), ctx.size))
+
+    def matches(self, item: dict[str, Any]) -> bool:
+        v = search._number(item.get(self.field))
+        if v is None:
+            return False
+        return {
+            "<": v < self.number,
+            "<=": v <= self.number,
+            ">": v > self.number,
+            ">=": v >= self.number,
+            "=": v == self.number,
+        }[self.op]
+
+    def __str__(self) -> str:
+        return f"{self.field}{self.op}{self.number:g}"
+
+
+@dataclass
+class Text(Node):
+    """A bare word (token substring, like plain find) or ``name:`` substring."""
+
+    text: str
+    name_only: bool = False
+
+    def _positions(self, ctx: _Ctx) -> list[int]:
+        return ctx.memo(self, "positions", self._lookup)
+
+    def _lookup(self) -> list[int]:
+        if self.name_only:
+            return search._index("name_trigrams").search(self.text)
+        words = search.tokenize(self.text)
+        if not words:
+            return []
+        if len(words) == 1:
+            return search._index("tokens").term(words[0])
+        return search._index("trigrams").search(self.text)  # quoted phrase
+
+    def estimate(self, ctx: _Ctx) -> int:
+        return len(self._positions(ctx))
+
+    def bitmap(self, ctx: _Ctx) -> int:
+        return ctx.memo(self, "bitmap", lambda: search._bitmap(self._positions(ctx), ctx.size))
+
+    def matches(self, item: dict[str, Any]) -> bool:
+        # the same three cases as _lookup, so verifying agrees with the index
+        words = search.tokenize(self.text)
+        if self.name_only or len(words) > 1:
+            q = fold(self.text)
+            keys = search.substring_keys(item, names_only=self.name_only)
+            return bool(q) and any(q in k for k in keys)
+        if not words:
+            return False
+        return any(words[0] in t for t in search.record_tokens(item))
+
+    def __str__(self) -> str:
+        return f'name:"{self.text}"' if self.name_only else f'"{self.text}"'
+
+
+@dataclass
+class Not(Node):
+    child: Node
+
+    def estimate(self, ctx: _Ctx) -> int:
+        return ctx.size - self.child.estimate(ctx)
+
+    def bitmap(self, ctx: _Ctx) -> int:
+        return ctx.memo(self, "bitmap", lambda: ctx.facets.all & ~self.child.bitmap(ctx))
+
+    def matches(self, item: dict[str, Any]) -> bool:
+        return not self.child.matches(item)
+
+    def __str__(self) -> str:
+        return f"-{self.child}"
+
+
+@dataclass
+class Or(Node):
+    children: list[Node] = field(default_factory=list)
+
+    def estimate(self, ctx: _Ctx) -> int:
+        return min(ctx.size, sum(c.estimate(ctx) for c in self.children))
+
+    def bitmap(self, ctx: _Ctx) -> int:
+        return ctx.memo(self, "bitmap", lambda: self._union(ctx))
+
+    def _union(self, ctx: _Ctx) -> int:
+        mask = 0
+        for c in self.children:
+            mask |= c.bitmap(ctx)
+        return mask
+
+    def matches(self, item: dict[str, Any]) -> bool:
+        return any(c.matches(item) for c in self.children)
+
+    def __str__(self) -> str:
+        return "(" + " OR ".join(map(str, self.children)) + ")"
+
+
+@dataclass
+class And(Node):
+    children: list[Node] = field(default_factory=list)
+
+    def estimate(self, ctx: _Ctx) -> int:
+        return min((c.estimate(ctx) for c in self.children), default=ctx.size)
+
+    def bitmap(self, ctx: _Ctx) -> int:
+        return ctx.memo(self, "bitmap", lambda: search._bitmap(plan(self, ctx)[0], ctx.size))
+
+    def matches(self, item: dict[str, Any]) -> bool:
+        return all(c.matches(item) for c in self.children)
+
+    def __str__(self) -> str:
+        return " ".join(map(str, self.children))
+
+
+def _value(raw: str) -> str:
+    return raw[1:-1] if raw.startswith('"') and raw.endswith('"') else raw
+
+
+def _term(m: re.Match) -> Node:
+    if m.group("word") is not None:
+        word = _value(m.group("word"))
+        node: Node = Text(word)
+        neg = m.group("neg2")
+    else:
+        name, op, value = m.group("field").lower(), m.group("op"), _value(m.group("value"))
+        neg = m.group("neg")
+        if name in search.SORTABLE:
+            if op == ":":
+                op = "="
+            try:
+                node = Range(name, op, float(value))
+            except ValueError:
+                raise ValueError(f"{name} needs a number, got {value!r}") from None
+        elif op != ":":
+            raise ValueError(f"{name}{op} only works on {', '.join(search.SORTABLE)}")
+        elif name in FIELDS:
+            node = Facet(FIELDS[name], value)
+        elif name == "name":
+            node = Text(value, name_only=True)
+        else:
+            raise ValueError(f"Unknown field {name!r}")
+    return Not(node) if neg else node
+
+
+def parse(text: str) -> Node:
+    """Parse a query string into a predicate tree; raises ValueError on bad syntax."""
+    tokens: list[Any] = []
+    pos, text = 0, text.strip()
+    while pos < len(text):
+        m = _TOKEN.match(text, pos)
+        if not m or m.end() == pos:
+            raise ValueError(f"Cannot parse query at {text[pos:]!r}")
+        pos = m.end()
+        if m.group("lparen") or m.group("rparen"):
+            tokens.append(m.group(0).strip())
+        elif m.group("word") == "OR" and not m.group("neg2"):
+            tokens.append("OR")
+        else:
+            tokens.append(_term(m))
+    node, rest = _parse_or(tokens)
+    if rest:
+        raise ValueError("Unbalanced ')' in query")
+    return node
+
+
+def _parse_or(tokens: list[Any]) -> tuple[Node, list[Any]]:
+    parts = []
+    while True:
+        node, tokens = _parse_and(tokens)
+        parts.append(node)
+        if not tokens or tokens[0] != "OR":
+            break
+        tokens = tokens[1:]
+    return (parts[0] if len(parts) == 1 else Or(parts)), tokens
+
+
+def _parse_and(tokens: list[Any]) -> tuple[Node, list[Any]]:
+    parts: list[Node] = []
+    while tokens and tokens[0] not in ("OR", ")"):
+        tok, tokens = tokens[0], tokens[1:]
+        if tok == "(":
+            node, tokens = _parse_or(tokens)
+            if not tokens or tokens[0] != ")":
+                raise ValueError("Missing ')' in query")
+            tokens = tokens[1:]
+            parts.append(node)
+        else:
+            parts.append(tok)
+    if not parts:
+        raise ValueError("Empty query" if not tokens else f"Nothing before {tokens[0]!r}")
+    return (parts[0] if len(parts) == 1 else And(parts)), tokens
+
+
+def has_fields(text: str) -> bool:
+    """True when ``text`` uses field terms, so a parse error is worth reporting."""
+    return bool(_FIELD.search(text))
+
+
+def is_structured(node: Node) -> bool:
+    """False for plain words only, which keep plain find's looser matching."""
+    if isinstance(node, And):
+        return any(is_structured(c) for c in node.children)
+    return not (isinstance(node, Text) and not node.name_only)
+
+
+def plan(node: Node, ctx: _Ctx) -> tuple[list[int], list[tuple[str, str, int, int]]]:
+    """Evaluate ``node``: (matching positions, steps as (action, predicate, estimate, remaining))."""
+    children = node.children if isinstance(node, And) else [node]
+    costed = sorted(((c.estimate(ctx), i, c) for i, c in enumerate(children)), key=lambda t: t[:2])
+    driver = next((t for t in costed if not isinstance(t[2], Not)), None)
+    steps: list[tuple[str, str, int, int]] = []
+    if driver is None:
+        candidates = list(range(ctx.size))
+        steps.append(("scan", "all records", ctx.size, ctx.size))
+    else:
+        est, _, first = driver
+        candidates = search.positions(first.bitmap(ctx), ctx.size).tolist()
+        steps.append(("index", str(first), est, len(candidates)))
+    for est, _, c in costed:
+        if driver is not None and c is driver[2]:
+            continue
+        if not candidates:
+            steps.append(("skip", str(c), est, 0))
+            continue
+        if len(candidates) <= VERIFY_LIMIT:
+            items = ctx.items
+            candidates = [p for p in candidates if c.matches(items[p])]
+            steps.append(("filter", str(c), est, len(candidates)))
+        else:
+            mask = search._bitmap(candidates, ctx.size) & c.bitmap(ctx)
+            candidates = search.positions(mask, ctx.size).tolist()
+            steps.append(("index", str(c), est, len(candidates)))
+    return candidates, steps
+
+
+def run(query: str | Node) -> tuple[list[dict[str, Any]], list[tuple[str, str, int, int]]]:
+    """Records matching the query (text or a parsed tree) in catalog order, plus the plan steps."""
+    node = parse(query) if isinstance(query, str) else query
+
+    def compute() -> tuple[tuple[int, ...], tuple[tuple[str, str, int, int], ...]]:
+        hits, steps = plan(node, _Ctx())
+        return tuple(hits), tuple(steps)
+
+    # str(node) is the normalised form: spacing, field aliases and quoting
+    hits, steps = resultcache.cached(("query", str(node)), compute)
+    items = search._indexes()["items"]
+    return [dict(items[p]) for p in hits], list(steps)
@@ -0,0 +1,245 @@
+"""Turn a models.UserProfile into ranked perfume recommendations.
+
+The whole catalog is scored as array operations over the interned note
+postings from similarity.NoteVectors: one bincount gives every record's
+overlap with the profile's preferred notes, ratings add a boost, and
+avoided allergens become a boolean mask from the allergen bitsets that
+storage maintains on every write.
+Top-k comes from argpartition, so nothing sorts the full catalog.
+
+batch() does the same for many profiles at once, a chunk of profile rows
+at a time: chunks are sized to a memory budget that also counts the
+postings, and can be spread over a process pool.
+"""
+
+from __future__ import annotations
+
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Any
+
+import numpy as np
+
+import resultcache
+import search
+import similarity
+import storage
+from models import UserProfile
+from textnorm import fold
+
+# score = NOTE_WEIGHT * share of preferred notes matched + RATING_WEIGHT * rating / 5
+NOTE_WEIGHT = 0.8
+RATING_WEIGHT = 0.2
+
+Profile = UserProfile | dict[str, Any]
+
+
+def _terms(profile: Profile) -> tuple[tuple[str, ...], tuple[str, ...]]:
+    """(preferred notes, avoided allergens), folded, de-duplicated and sorted.
+
+    A single string counts as a one-item list; raises ValueError for anything
+    else that is not a list of strings, and for a profile that is not an object.
+    """
+    if isinstance(profile, UserProfile):
+        notes, avoid = profile.preferred_notes, profile.avoid_allergens
+    elif not isinstance(profile, dict):
+        raise ValueError(f"Profile must be an object, got {type(profile).__name__}")
+    else:
+        notes, avoid = profile.get("preferred_notes"), profile.get("avoid_allergens")
+
+    def clean(name: str, values: Any) -> tuple[str, ...]:
+        if isinstance(values, str):
+            values = [values]
+        if not isinstance(values, (list, tuple)) and values is not None:
+            raise ValueError(f"{name} must be a list of strings")
+        if any(not isinstance(v, str) for v in values or []):
+            raise ValueError(f"{name} must be a list of strings")
+        return tuple(sorted({fold(v) for v in values or []} - {""}))
+
+    return clean("preferred_notes", notes), clean("avoid_allergens", avoid)
+
+
+def _ratings() -> np.ndarray:
+    cache = search._indexes()
+    if "ratings" not in cache:
+        value_at = search._index("sorted:rating").value_at
+        cache["ratings"] = np.array([v or 0.0 for v in value_at], dtype=np.float64)
+    return cache["ratings"]
+
+
+def scores(notes: tuple[str, ...], avoid: tuple[str, ...]) -> np.ndarray:
+    """Score for every record (-inf where excluded); notes/avoid as from _terms()."""
+    vectors = similarity._vectors()
+    score = RATING_WEIGHT * np.clip(_ratings(), 0, 5) / 5.0
+    if notes:
+        ids = [vectors.vocab[n] for n in notes if n in vectors.vocab]
+        rows = [vectors.note_rows[vectors.note_ptr[n] : vectors.note_ptr[n + 1]] for n in ids]
+        overlap = (
+            np.bincount(np.concatenate(rows), minlength=vectors.size)
+            if rows
+            else np.zeros(vectors.size)
+        )
+        score = score + NOTE_WEIGHT * overlap / len(notes)
+        score[overlap == 0] = -np.inf  # a profile with notes only wants perfumes sharing one
+    if avoid:
+        score[search.bits(storage.allergen_mask(avoid), vectors.size)] = -np.inf
+    return score
+
+
+def top_k(score: np.ndarray, k: int) -> list[tuple[int, float]]:
+    """(position, score) of the ``k`` best finite scores, best first; no full sort."""
+    k = min(k, len(score))
+    if k <= 0:
+        return []
+    top = np.argpartition(-score, k - 1)[:k]
+    top = top[np.isfinite(score[top])]
+    top = top[np.lexsort((top, -score[top]))]  # best first, catalog order among ties
+    return [(int(j), round(float(score[j]), 3)) for j in top]
+
+
+def recommend(
+    profile: Profile, k: int = 10, exclude_allergens: Iterable[str] = ()
+) -> list[dict[str, Any]]:
+    """The ``k`` best perfumes for ``profile``, each with "score" and "matched_notes".
+
+    ``exclude_allergens`` are avoided on top of the profile's own avoid_allergens.
+    """
+    notes, avoid = _terms(profile)
+    if exclude_allergens:
+        avoid = tuple(sorted(set(avoid) | ({fold(a) for a in exclude_allergens} - {""})))
+    hits = resultcache.cached(
+        ("recommend", notes, avoid, k), lambda: tuple(top_k(scores(notes, avoid), k))
+    )
+    items = search._indexes()["items"]
+    wanted = set(notes)
+    out = []
+    for j, score in hits:
+        item = dict(items[j])
+        item["score"] = score
+        item["matched_notes"] = [n for n in item.get("notes") or [] if fold(n) in wanted]
+        out.append(item)
+    return out
+
+
+class _Postings:
+    """Which perfumes carry each note and each allergen, plus the rating boost.
+
+    The sparse transpose from similarity.NoteVectors rather than a dense
+    note x perfume matrix, so it costs one int32 per catalog note entry
+    (plus the allergen positions) and stays small enough to count against
+    batch()'s memory budget and to hand each pool worker once, through its
+    initializer. Self-contained, so workers need no catalog of their own.
+    """
+
+    def __init__(self) -> None:
+        vectors = similarity._vectors()
+        allergens, _ = storage.allergen_bitsets()
+        self.size = vectors.size
+        self.notes = dict(vectors.vocab)
+        self.note_rows, self.note_ptr = vectors.note_rows, vectors.note_ptr
+        self.allergens = {key: search.positions(m, self.size) for key, m in allergens.items()}
+        self.boost = RATING_WEIGHT * np.clip(_ratings(), 0, 5) / 5.0
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [self.note_rows, self.note_ptr, self.boost, *self.allergens.values()]
+        return sum(a.nbytes for a in arrays)
+
+    def score(self, notes: tuple[str, ...], avoid: tuple[str, ...], out: np.ndarray) -> None:
+        """Write scores() for one profile into ``out``, in the same operation order."""
+        out[:] = self.boost
+        if notes:
+            ids = [self.notes[n] for n in notes if n in self.notes]
+            rows = [self.note_rows[self.note_ptr[n] : self.note_ptr[n + 1]] for n in ids]
+            overlap = (
+                np.bincount(np.concatenate(rows), minlength=self.size)
+                if rows
+                else np.zeros(self.size)
+            )
+            out += NOTE_WEIGHT * overlap / len(notes)
+            out[overlap == 0] = -np.inf
+        for a in avoid:
+            if a in self.allergens:
+                out[self.allergens[a]] = -np.inf
+
+    def top(
+        self, chunk: list[tuple[tuple[str, ...], tuple[str, ...]]], k: int
+    ) -> list[list[tuple[int, float]]]:
+        """Per profile, top_k() of its scores; temporaries stay at one catalog row."""
+        score = np.empty((len(chunk), self.size), dtype=np.float64)
+        for r, (notes, avoid) in enumerate(chunk):
+            self.score(notes, avoid, score[r])
+        return [top_k(row, k) for row in score]
+
+
+_WORKER: dict[str, Any] = {}
+
+
+def _init_worker(postings: _Postings) -> None:
+    _WORKER["postings"] = postings
+
+
+def _worker_top(chunk, k):
+    return _WORKER["postings"].top(chunk, k)
+
+
+def _profile_id(profile: Profile) -> str | None:
+    return profile.id if isinstance(profile, UserProfile) else profile.get("id")
+
+
+def batch(
+    profiles: Iterable[Profile], k: int = 10, memory_mb: int = 256, workers: int = 0
+) -> Iterator[tuple[str | None, list[dict[str, Any]]]]:
+    """Yield (profile id, top-k [{id, name, brand, score}]) for each profile, in input order.
+
+    Profiles are consumed lazily in chunks whose score rows, together with
+    the note and allergen postings, fit in about ``memory_mb``; ``workers`` > 1
+    scores chunks in a process pool, each worker holding its own copy.
+    """
+    items = search._indexes()["items"]
+    postings = _Postings()
+    copies = max(1, workers)
+    budget = (memory_mb << 20) - copies * postings.nbytes
+    # per profile row: float64 scores; scoring and top_k() add about four rows
+    # of temporaries (bincount, weighted overlap, negated scores, partition)
+    rows = max(1, budget // max(1, copies * postings.size * 8) - 4)
+    it = iter(profiles)
+
+    def chunks() -> (
+        Iterator[tuple[list[str | None], list[tuple[tuple[str, ...], tuple[str, ...]]]]]
+    ):
+        while True:
+            part = list(islice(it, rows))
+            if not part:
+                return
+            terms = [_terms(p) for p in part]  # validates each record first
+            yield [_profile_id(p) for p in part], terms
+
+    def emit(ids, results):
+        for pid, hits in zip(ids, results):
+            yield pid, [
+                {
+                    "id": items[j].get("id"),
+                    "name": items[j].get("name"),
+                    "brand": items[j].get("brand"),
+                    "score": sc,
+                }
+                for j, sc in hits
+            ]
+
+    if workers <= 1:
+        for ids, terms in chunks():
+            yield from emit(ids, postings.top(terms, k))
+        return
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(postings,)) as pool:
+        pending: deque = deque()
+        for ids, terms in chunks():
+            pending.append((ids, pool.submit(_worker_top, terms, k)))
+            if len(pending) >= 2 * workers:  # bounded: never read far ahead of the output
+                ids_, fut = pending.popleft()
+                yield from emit(ids_, fut.result())
+        while pending:
+            ids_, fut = pending.popleft()
+            yield from emit(ids_, fut.result())
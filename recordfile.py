@@ -0,0 +1,107 @@
+"""Read-optimised binary record file for large catalogs.
+
+Layout (little-endian)::
+
+    header  magic "AVREC001", count, table offset, source (mtime_ns, size, inode)
+    records count x (u32 length, compact JSON bytes)
+    table   count x (u64 id hash, u64 record offset), sorted by hash
+
+Readers mmap the file and binary-search the fixed-width table, so a point
+lookup decodes exactly one record instead of parsing the whole catalog.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import mmap
+import struct
+from collections.abc import Iterable
+from pathlib import Path
+from typing import Any
+
+MAGIC = b"AVREC001"
+_HEADER = struct.Struct("<8sQQqQQ")
+_LEN = struct.Struct("<I")
+_ENTRY = struct.Struct("<QQ")
+
+
+def id_hash(pid: str) -> int:
+    # stable across processes, unlike hash()
+    return int.from_bytes(hashlib.blake2b(pid.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def write(
+    path: Path, items: Iterable[dict[str, Any]], source_sig: tuple[int, int, int] | None
+) -> int:
+    """Write ``items`` to ``path`` atomically; returns the number of records.
+
+    Records are streamed; only the 16-byte table entries are held in memory.
+    """
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    entries = []
+    with tmp.open("wb") as f:
+        f.write(b"\0" * _HEADER.size)
+        for item in items:
+            pid = item.get("id")
+            if not pid:
+                continue
+            body = json.dumps(item, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            entries.append((id_hash(str(pid)), f.tell()))
+            f.write(_LEN.pack(len(body)))
+            f.write(body)
+        table_at = f.tell()
+        entries.sort()
+        for entry in entries:
+            f.write(_ENTRY.pack(*entry))
+        mtime, size, ino = source_sig or (0, 0, 0)
+        f.seek(0)
+        f.write(_HEADER.pack(MAGIC, len(entries), table_at, mtime, size, ino))
+    tmp.replace(path)
+    return len(entries)
+
+
+class RecordReader:
+    """mmap-backed point lookups over a record file."""
+
+    def __init__(self, path: Path):
+        self._file = path.open("rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            self._file.close()
+            raise ValueError(f"{path.name} is not a record file")
+        magic, self.count, self._table, mtime, size, ino = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path.name} is not a record file")
+        self.source_sig = (mtime, size, ino)
+
+    def _hash_at(self, i: int) -> int:
+        return _ENTRY.unpack_from(self._map, self._table + i * _ENTRY.size)[0]
+
+    def get(self, pid: str) -> dict[str, Any] | None:
+        h = id_hash(pid)
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._hash_at(mid) < h:
+                lo = mid + 1
+            else:
+                hi = mid
+        # walk the (almost always single) run of equal hashes
+        while lo < self.count:
+            hv, offset = _ENTRY.unpack_from(self._map, self._table + lo * _ENTRY.size)
+            if hv != h:
+                break
+            (length,) = _LEN.unpack_from(self._map, offset)
+            start = offset + _LEN.size
+            item = json.loads(self._map[start : start + length].decode("utf-8"))
+            if item.get("id") == pid:
+                return item
+            lo += 1
+        return None
+
+    def close(self) -> None:
+        self._map.close()
+        self._file.close()
@@ -0,0 +1,105 @@
+"""Bounded LRU/TTL cache for query results.
+
+Keys carry the storage catalog version, so any mutation invalidates every
+cached result at once, in O(1), just by bumping that counter; the stale
+entries are never hit again and age out of the LRU. Callers cache record
+*positions* (or other immutable summaries) and build fresh dicts on each
+call, so a cached result can never be modified through a caller.
+
+Size and lifetime come from AROMAVAULT_CACHE_SIZE (entries, 0 disables)
+and AROMAVAULT_CACHE_TTL (seconds). The cache and its counters belong to
+one process: the web app reports its own at /api/admin/cache, and
+``cache-stats`` in a fresh shell starts from zero.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from typing import Any
+
+import storage
+
+
+class LRUCache:
+    """Least-recently-used mapping with a per-entry time-to-live and hit/miss counters."""
+
+    def __init__(
+        self, maxsize: int = 256, ttl: float = 300.0, clock: Callable[[], float] = time.monotonic
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def get(self, key: Hashable) -> tuple[bool, Any]:
+        """(True, value) on a hit, (False, None) on a miss or an expired entry."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and self._clock() - entry[0] > self.ttl:
+                del self._data[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return True, entry[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (self._clock(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+RESULTS = LRUCache(
+    int(os.environ.get("AROMAVAULT_CACHE_SIZE", "256")),
+    float(os.environ.get("AROMAVAULT_CACHE_TTL", "300")),
+)
+
+
+def cached[T](key: Hashable, compute: Callable[[], T]) -> T:
+    """Return the result for ``key`` at the current catalog version, computing it on a miss.
+
+    ``key`` must already be normalised (e.g. folded query text) and hashable.
+    """
+    full = (storage.catalog_version(), key)
+    found, value = RESULTS.get(full)
+    if found:
+        return value
+    value = compute()
+    RESULTS.put(full, value)
+    return value
+
+
+def stats() -> dict[str, Any]:
+    """Counters of this process's cache (see the module docstring)."""
+    return RESULTS.stats()
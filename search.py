@@ -0,0 +1,1014 @@
+"""Search indexes over the storage catalog.
+
+Indexes are built from storage.catalog_snapshot() the first time they are
+used. When the catalog version changes, the token, trigram and facet
+indexes fold in storage's change feed (storage.changes_since) and the rest
+are rebuilt lazily on next use, so every mutation is reflected on the next
+query without rebuilding everything. Posting lists hold record
+positions in catalog order, which keeps results in the same order as
+``list`` and lets lists be intersected with a linear merge.
+"""
+
+from __future__ import annotations
+
+import base64
+import heapq
+import re
+from bisect import bisect_left, bisect_right
+from collections.abc import Iterable, Sequence
+from heapq import merge
+from typing import Any
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+import resultcache
+import storage
+from textnorm import fold
+
+_WORD = re.compile(r"\w+")
+
+# Fields that feed the token index.
+TEXT_FIELDS = ("name", "brand", "family")
+
+
+def tokenize(text: Any) -> list[str]:
+    return _WORD.findall(fold(text))
+
+
+def record_tokens(item: dict[str, Any]) -> set[str]:
+    tokens: set[str] = set()
+    for field in TEXT_FIELDS:
+        tokens.update(tokenize(item.get(field)))
+    for note in item.get("notes") or []:
+        tokens.update(tokenize(note))
+    return tokens
+
+
+def intersect(a: list[int], b: list[int]) -> list[int]:
+    """Intersect two sorted lists; gallops through the longer one with bisect."""
+    if len(a) > len(b):
+        a, b = b, a
+    out, lo = [], 0
+    for x in a:
+        lo = bisect_left(b, x, lo)
+        if lo == len(b):
+            break
+        if b[lo] == x:
+            out.append(x)
+    return out
+
+
+def union(lists: Iterable[list[int]]) -> list[int]:
+    lists = [p for p in lists if len(p)]
+    if len(lists) <= 1:
+        return list(lists[0]) if lists else []
+    if sum(map(len, lists)) > 4096:  # big unions: sort in numpy, not element by element
+        return np.unique(np.concatenate(lists)).tolist()
+    out: list[int] = []
+    for x in merge(*lists):
+        if not out or out[-1] != x:
+            out.append(x)
+    return out
+
+
+class _Slots:
+    """Stable slot numbers for the records of an incrementally updated index.
+
+    Postings hold slots, which never move. ``live`` maps a catalog position
+    to its slot (the identity until the first removal), so removing a record
+    drops its own postings instead of renumbering every list after it.
+    """
+
+    def __init__(self, size: int):
+        self.live: np.ndarray | None = None
+        self.next = size
+
+    def slot(self, pos: int) -> int:
+        return pos if self.live is None else int(self.live[pos])
+
+    def append(self) -> int:
+        slot, self.next = self.next, self.next + 1
+        if self.live is not None:
+            self.live = np.append(self.live, slot)
+        return slot
+
+    def remove(self, positions: list[int]) -> list[int]:
+        """Forget the records at ``positions`` (ascending); returns their slots."""
+        if self.live is None:
+            self.live = np.arange(self.next, dtype=np.int64)
+        slots = self.live[positions].tolist()
+        self.live = np.delete(self.live, positions)
+        return slots
+
+    def positions(self, slots: list[int]) -> list[int]:
+        """Current catalog positions of sorted, live ``slots`` (still sorted)."""
+        if self.live is None or not slots:
+            return slots
+        return np.searchsorted(self.live, slots).tolist()
+
+
+def _posting_add(postings: dict[str, list[int]], key: str, slot: int) -> bool:
+    """Insert ``slot`` into ``key``'s sorted list; True if the key is new."""
+    bucket = postings.get(key)
+    if bucket is None:
+        postings[key] = [slot]
+        return True
+    if not bucket or bucket[-1] < slot:
+        bucket.append(slot)
+    else:
+        i = bisect_left(bucket, slot)
+        if i == len(bucket) or bucket[i] != slot:
+            bucket.insert(i, slot)
+    return False
+
+
+def _posting_drop(postings: dict[str, list[int]], key: str, slot: int) -> bool:
+    """Remove ``slot`` from ``key``'s list; True if the key is now gone."""
+    bucket = postings.get(key)
+    if bucket is None:
+        return False
+    i = bisect_left(bucket, slot)
+    if i < len(bucket) and bucket[i] == slot:
+        del bucket[i]
+    if bucket:
+        return False
+    del postings[key]
+    return True
+
+
+class TokenIndex:
+    """Inverted index: token -> sorted record slots (see _Slots).
+
+    Substring lookups ("ros" -> "rose", "roses") go through a trigram index
+    over the token vocabulary instead of scanning it. apply() folds storage's
+    change feed in, so a write does not force a rebuild.
+    """
+
+    def __init__(self, items: list[dict[str, Any]]):
+        self.slots = _Slots(len(items))
+        self.postings: dict[str, list[int]] = {}
+        for pos, item in enumerate(items):
+            for token in record_tokens(item):
+                self.postings.setdefault(token, []).append(pos)
+        self.grams: dict[str, set[str]] = {}  # trigram -> tokens containing it
+        self.short: set[str] = set()  # tokens too short to have a trigram
+        for token in self.postings:
+            self._add_token(token)
+
+    def _add_token(self, token: str) -> None:
+        if len(token) < 3:
+            self.short.add(token)
+        for gram in trigrams(token):
+            self.grams.setdefault(gram, set()).add(token)
+
+    def _drop_token(self, token: str) -> None:
+        self.short.discard(token)
+        for gram in trigrams(token):
+            bucket = self.grams.get(gram)
+            if bucket is not None:
+                bucket.discard(token)
+                if not bucket:
+                    del self.grams[gram]
+
+    def _tokens(self, term: str) -> set[str]:
+        """Vocabulary tokens containing ``term``."""
+        if len(term) < 3:
+            found = {t for gram, tokens in self.grams.items() if term in gram for t in tokens}
+            return found | {t for t in self.short if term in t}
+        sets = sorted((self.grams.get(g, set()) for g in trigrams(term)), key=len)
+        candidates = sets[0].intersection(*sets[1:])
+        return {t for t in candidates if term in t}
+
+    def _slots_for(self, term: str) -> list[int]:
+        tokens = self._tokens(term)
+        if len(tokens) == 1:
+            return self.postings[next(iter(tokens))]
+        return union(self.postings[t] for t in tokens)
+
+    def term(self, term: str) -> list[int]:
+        """Positions whose tokens contain ``term`` as a substring (so "ros" finds "rose")."""
+        return self.slots.positions(self._slots_for(term))
+
+    def query(self, text: str, mode: str = "and") -> list[int]:
+        terms = tokenize(text)
+        if not terms:
+            return []
+        lists = [self._slots_for(t) for t in dict.fromkeys(terms)]
+        if mode == "or":
+            return self.slots.positions(union(lists))
+        lists.sort(key=len)  # most selective first keeps every intermediate small
+        hits = lists[0]
+        for other in lists[1:]:
+            if not hits:
+                break
+            hits = intersect(hits, other)
+        return self.slots.positions(hits)
+
+    def _index_record(self, slot: int, item: dict[str, Any]) -> None:
+        for token in record_tokens(item):
+            if _posting_add(self.postings, token, slot):
+                self._add_token(token)
+
+    def _unindex_record(self, slot: int, item: dict[str, Any]) -> None:
+        for token in record_tokens(item):
+            if _posting_drop(self.postings, token, slot):
+                self._drop_token(token)
+
+    def apply(self, ops: list[tuple[Any, ...]]) -> None:
+        """Fold in storage.changes_since() ops."""
+        for op in ops:
+            if op[0] == "put":
+                _, pos, old, new = op
+                if old is None:
+                    self._index_record(self.slots.append(), new)
+                else:
+                    slot = self.slots.slot(pos)
+                    self._unindex_record(slot, old)
+                    self._index_record(slot, new)
+            else:
+                _, positions, removed = op
+                for slot, item in zip(self.slots.remove(positions), removed):
+                    self._unindex_record(slot, item)
+
+
+def trigrams(text: str) -> set[str]:
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+def substring_keys(item: dict[str, Any], names_only: bool = False) -> list[str]:
+    """Folded (see textnorm) strings a substring query is matched against."""
+    keys = [fold(item.get("name"))]
+    if not names_only:
+        keys.append(fold(item.get("brand")))
+        keys.extend(fold(n) for n in item.get("notes") or [])
+    return [k for k in keys if k]
+
+
+class TrigramIndex:
+    """Trigram -> sorted record slots (see _Slots), for substring queries.
+
+    A query's trigrams are intersected to get candidates and only those are
+    verified; queries shorter than three characters are answered from the
+    trigram vocabulary (plus the few keys too short to have a trigram).
+    Kept current through apply(), like TokenIndex.
+    """
+
+    def __init__(self, items: list[dict[str, Any]], names_only: bool = False):
+        self.names_only = names_only
+        self.slots = _Slots(len(items))
+        self.keys: list[list[str]] = []  # by slot; [] once the record is removed
+        self.postings: dict[str, list[int]] = {}
+        self.short: dict[str, list[int]] = {}
+        for slot, item in enumerate(items):
+            keys = substring_keys(item, names_only)
+            self.keys.append(keys)
+            grams, short = self._grams(keys)
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(slot)
+            for key in short:
+                self.short.setdefault(key, []).append(slot)
+
+    def _grams(self, keys: list[str]) -> tuple[set[str], set[str]]:
+        grams: set[str] = set()
+        for key in keys:
+            grams |= trigrams(key)
+        return grams, {k for k in keys if len(k) < 3}
+
+    def _index_record(self, slot: int, item: dict[str, Any]) -> None:
+        keys = substring_keys(item, self.names_only)
+        if slot == len(self.keys):
+            self.keys.append(keys)
+        else:
+            self.keys[slot] = keys
+        grams, short = self._grams(keys)
+        for gram in grams:
+            _posting_add(self.postings, gram, slot)
+        for key in short:
+            _posting_add(self.short, key, slot)
+
+    def _unindex_record(self, slot: int) -> None:
+        grams, short = self._grams(self.keys[slot])
+        for gram in grams:
+            _posting_drop(self.postings, gram, slot)
+        for key in short:
+            _posting_drop(self.short, key, slot)
+        self.keys[slot] = []
+
+    def apply(self, ops: list[tuple[Any, ...]]) -> None:
+        """Fold in storage.changes_since() ops."""
+        for op in ops:
+            if op[0] == "put":
+                _, pos, old, new = op
+                if old is None:
+                    self._index_record(self.slots.append(), new)
+                else:
+                    slot = self.slots.slot(pos)
+                    self._unindex_record(slot)
+                    self._index_record(slot, new)
+            else:
+                for slot in self.slots.remove(op[1]):
+                    self._unindex_record(slot)
+
+    def search(self, text: str) -> list[int]:
+        q = fold(text)
+        if not q:
+            return []
+        if len(q) < 3:
+            lists = [p for g, p in self.postings.items() if q in g]
+            lists += [p for k, p in self.short.items() if q in k]
+            return self.slots.positions(union(lists))
+        lists = sorted((self.postings.get(g, []) for g in trigrams(q)), key=len)
+        candidates = lists[0]
+        for other in lists[1:]:
+            if not candidates:
+                break
+            candidates = intersect(candidates, other)
+        # trigrams can match out of order, so confirm the real substring
+        hits = [slot for slot in candidates if any(q in key for key in self.keys[slot])]
+        return self.slots.positions(hits)
+
+
+class FuzzyIndex:
+    """Normalised "name brand" strings plus word and trigram indexes for candidate selection.
+
+    WRatio is too slow to run over every record of a large catalog, so a query
+    is first narrowed to records sharing a word that is close to one of its
+    words (cheap ``ratio`` over the small word vocabulary), plus records whose
+    whole key is close to the query: about as long and sharing most of its
+    trigrams. Only those candidates get the full score.
+    """
+
+    # a whole-key candidate must share this fraction of the query's trigrams
+    GRAM_SHARE = 0.5
+
+    def __init__(self, items: list[dict[str, Any]]):
+        self.keys: list[str] = []
+        postings: dict[str, list[int]] = {}
+        grams: dict[str, list[int]] = {}
+        for pos, item in enumerate(items):
+            words = tokenize(item.get("name")) + tokenize(item.get("brand"))
+            key = " ".join(words)
+            self.keys.append(key)
+            for word in dict.fromkeys(words):
+                postings.setdefault(word, []).append(pos)
+            for gram in trigrams(key):
+                grams.setdefault(gram, []).append(pos)
+        # arrays so candidate sets are merged in numpy, not element by element
+        self.postings = {w: np.asarray(p, dtype=np.intp) for w, p in postings.items()}
+        self.grams = {g: np.asarray(p, dtype=np.intp) for g, p in grams.items()}
+        self.lengths = np.fromiter(map(len, self.keys), dtype=np.intp, count=len(self.keys))
+        # numbers are matched exactly; only words take part in typo matching
+        self.words = [w for w in self.postings if not w.isdigit()]
+
+    def _near(self, word: str) -> np.ndarray:
+        """Positions of records containing ``word`` or a word within a typo or two of it."""
+        if word.isdigit() or len(word) < 3:
+            similar = [word] if word in self.postings else []
+        else:
+            found = process.extract(
+                word, self.words, scorer=fuzz.ratio, processor=None, score_cutoff=75.0, limit=None
+            )
+            similar = [w for w, _, _ in found]
+        if not similar:
+            return np.empty(0, dtype=np.intp)
+        if len(similar) == 1:
+            return self.postings[similar[0]]
+        return np.unique(np.concatenate([self.postings[w] for w in similar]))
+
+    def _whole(self, query: str, score_cutoff: float) -> np.ndarray:
+        """Records whose whole key could pass QRatio ``score_cutoff`` against ``query``."""
+        wanted = trigrams(query)
+        lists = [self.grams[g] for g in wanted if g in self.grams]
+        if not lists:
+            return np.empty(0, dtype=np.intp)
+        shared = np.bincount(np.concatenate(lists), minlength=len(self.keys))
+        hits = np.flatnonzero(shared >= max(1, int(np.ceil(len(wanted) * self.GRAM_SHARE))))
+        # a ratio is at most 200 * shorter / (shorter + longer)
+        n, m = len(query), self.lengths[hits]
+        return hits[200 * np.minimum(n, m) >= score_cutoff * (n + m)]
+
+    def candidates(self, query: str, score_cutoff: float) -> np.ndarray:
+        per_word = sorted((self._near(w) for w in dict.fromkeys(query.split())), key=len)
+        per_word = [p for p in per_word if len(p)]
+        hits = per_word[0] if per_word else np.empty(0, dtype=np.intp)
+        for other in per_word[1:]:
+            narrowed = np.intersect1d(hits, other, assume_unique=True)
+            if len(narrowed):  # a word that shares no record with the rest is skipped
+                hits = narrowed
+        return np.union1d(hits, self._whole(query, score_cutoff))
+
+
+# Facet name (as used in query strings) -> record field; list fields match any element.
+FACETS = {
+    "brand": "brand",
+    "family": "family",
+    "concentration": "concentration",
+    "note": "notes",
+    "allergen": "allergens",
+}
+
+
+def _bitmap(positions: list[int], size: int) -> int:
+    bits = np.zeros(size, dtype=bool)
+    bits[positions] = True
+    return int.from_bytes(np.packbits(bits, bitorder="little").tobytes(), "little")
+
+
+def bits(mask: int, size: int) -> np.ndarray:
+    """``mask`` as a boolean array of length ``size``."""
+    raw = np.frombuffer(mask.to_bytes((size + 7) // 8, "little"), dtype=np.uint8)
+    return np.unpackbits(raw, bitorder="little")[:size].astype(bool)
+
+
+def positions(mask: int, size: int) -> np.ndarray:
+    """Record positions of the set bits in ``mask``, ascending."""
+    return np.flatnonzero(bits(mask, size))
+
+
+def _facet_keys(item: dict[str, Any], field: str) -> dict[str, str]:
+    """Folded facet value -> its first spelling in ``item``; list fields give several."""
+    value = item.get(field)
+    out: dict[str, str] = {}
+    for v in value if isinstance(value, list) else [value]:
+        key = fold(v)
+        if key:
+            out.setdefault(key, str(v).strip())
+    return out
+
+
+class FacetIndex:
+    """One int bitmap per facet value (bit i = record position i).
+
+    Values are OR-ed within a facet, facets are AND-ed, exclusions are
+    AND-NOT-ed, and counts are popcounts, so no record is visited twice.
+    ``prebuilt`` supplies (bitmaps, labels) for facets kept elsewhere, such as
+    the allergen bitsets that storage maintains on every write.
+    """
+
+    def __init__(
+        self,
+        items: list[dict[str, Any]],
+        prebuilt: dict[str, tuple[dict[str, int], dict[str, str]]] | None = None,
+    ):
+        self.size = len(items)
+        self.all = (1 << self.size) - 1
+        self.bitmaps: dict[str, dict[str, int]] = {}
+        self.labels: dict[str, dict[str, str]] = {}
+        for facet, (maps, labels) in (prebuilt or {}).items():
+            self.bitmaps[facet], self.labels[facet] = maps, labels
+        for facet, field in FACETS.items():
+            if facet in self.bitmaps:
+                continue
+            found: dict[str, list[int]] = {}
+            labels = self.labels[facet] = {}
+            for pos, item in enumerate(items):
+                for key, label in _facet_keys(item, field).items():
+                    labels.setdefault(key, label)
+                    found.setdefault(key, []).append(pos)
+            self.bitmaps[facet] = {k: _bitmap(p, self.size) for k, p in found.items()}
+        self.prebuilt = set(prebuilt or ())
+
+    def _mark(self, pos: int, item: dict[str, Any], on: bool) -> None:
+        bit = 1 << pos
+        for facet, field in FACETS.items():
+            if facet in self.prebuilt:
+                continue
+            maps, labels = self.bitmaps[facet], self.labels[facet]
+            for key, label in _facet_keys(item, field).items():
+                if on:
+                    labels.setdefault(key, label)
+                    maps[key] = maps.get(key, 0) | bit
+                elif maps.get(key, 0) & ~bit:
+                    maps[key] &= ~bit
+                else:
+                    maps.pop(key, None)
+
+    def apply(
+        self,
+        ops: list[tuple[Any, ...]],
+        prebuilt: dict[str, tuple[dict[str, int], dict[str, str]]] | None = None,
+    ) -> None:
+        """Fold in storage.changes_since() ops; ``prebuilt`` facets are replaced outright."""
+        for op in ops:
+            if op[0] == "put":
+                _, pos, old, new = op
+                if old is None:
+                    self.size += 1
+                else:
+                    self._mark(pos, old, False)
+                self._mark(pos, new, True)
+            else:
+                positions = op[1]
+                for facet, maps in self.bitmaps.items():
+                    if facet in self.prebuilt:
+                        continue
+                    for key in list(maps):
+                        mask = storage._drop_bits(maps[key], positions)
+                        if mask:
+                            maps[key] = mask
+                        else:
+                            del maps[key]
+                self.size -= len(positions)
+        self.all = (1 << self.size) - 1
+        for facet, (maps, labels) in (prebuilt or {}).items():
+            self.bitmaps[facet], self.labels[facet] = maps, labels
+
+    def bitmap(self, facet: str, values: Iterable[str]) -> int:
+        if facet not in FACETS:
+            raise ValueError(f"Unknown facet {facet!r}; use one of {', '.join(FACETS)}")
+        maps = self.bitmaps[facet]
+        mask = 0
+        for v in values:
+            mask |= maps.get(fold(v), 0)
+        return mask
+
+    def select(
+        self,
+        include: dict[str, list[str]],
+        exclude: dict[str, list[str]],
+        skip: str | None = None,
+        within: int | None = None,
+    ) -> int:
+        mask = self.all if within is None else within
+        for facet, values in include.items():
+            if values and facet != skip:
+                mask &= self.bitmap(facet, values)
+        for facet, values in exclude.items():
+            if values:
+                mask &= ~self.bitmap(facet, values)
+        return mask
+
+    def counts(
+        self,
+        include: dict[str, list[str]],
+        exclude: dict[str, list[str]],
+        within: int | None = None,
+    ) -> dict[str, dict[str, int]]:
+        """Per-facet value counts, most frequent first.
+
+        Each facet is counted against the other facets' filters only, so a
+        sidebar still shows how many records picking another value would add.
+        """
+        out: dict[str, dict[str, int]] = {}
+        base = self.select(include, exclude, within=within)
+        for facet, maps in self.bitmaps.items():
+            if include.get(facet):
+                mask = self.select(include, exclude, skip=facet, within=within)
+            else:
+                mask = base
+            counted = ((self.labels[facet][k], (bm & mask).bit_count()) for k, bm in maps.items())
+            out[facet] = dict(sorted((c for c in counted if c[1]), key=lambda c: (-c[1], c[0])))
+        return out
+
+
+# Numeric fields with a sorted index, and the direction ``sort=`` uses by default.
+SORTABLE = {"price": False, "rating": True, "stock": True}
+
+
+def _number(value: Any) -> float | None:
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class SortedIndex:
+    """Record positions ordered by one numeric field (records without it are left out).
+
+    Ranges are two bisects into ``values``; the slice of ``order`` between
+    them is the answer, already in field order.
+    """
+
+    def __init__(self, items: list[dict[str, Any]], field: str):
+        self.field = field
+        self.value_at = [_number(it.get(field)) for it in items]
+        pairs = sorted((v, pos) for pos, v in enumerate(self.value_at) if v is not None)
+        self.values = [v for v, _ in pairs]
+        self.order = [pos for _, pos in pairs]
+
+    def span(self, lo: float | None = None, hi: float | None = None) -> list[int]:
+        """Positions with ``lo <= value <= hi`` (either bound may be None), ascending by value."""
+        i = 0 if lo is None else bisect_left(self.values, lo)
+        j = len(self.values) if hi is None else bisect_right(self.values, hi)
+        return self.order[i:j]
+
+    def top(self, candidates: Iterable[int] | None, k: int | None, descending: bool) -> list[int]:
+        """The first ``k`` of ``candidates`` (all records if None) in field order.
+
+        Unfiltered requests are a slice of the index; filtered ones use a
+        k-sized heap instead of sorting every candidate. Records without the
+        field come last, in catalog order.
+        """
+        value_at = self.value_at
+        if candidates is None:
+            ranked = self.order[::-1] if descending else self.order
+            if k is None or k > len(ranked):
+                missing = [pos for pos, v in enumerate(value_at) if v is None]
+                ranked = ranked + missing
+            return ranked[:k] if k is not None else ranked
+        sign = -1.0 if descending else 1.0
+
+        def key(pos: int) -> tuple[int, float, int]:
+            v = value_at[pos]
+            return (1, 0.0, pos) if v is None else (0, sign * v, pos)
+
+        if k is None:
+            return sorted(candidates, key=key)
+        return heapq.nsmallest(k, candidates, key=key)
+
+
+class IdIndex:
+    """Record ids in sorted order, for keyset pagination.
+
+    A page starts just after the last id the client saw, so inserts and
+    deletes elsewhere never shift it the way an offset would.
+    """
+
+    def __init__(self, items: list[dict[str, Any]]):
+        pairs = sorted((str(it["id"]), pos) for pos, it in enumerate(items) if it.get("id"))
+        self.ids = [pid for pid, _ in pairs]
+        self.order = [pos for _, pos in pairs]
+
+    def start(self, after: str | None) -> int:
+        return 0 if after is None else bisect_right(self.ids, after)
+
+
+def encode_cursor(pid: str) -> str:
+    return base64.urlsafe_b64encode(pid.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> str:
+    try:
+        raw = base64.b64decode(cursor + "=" * (-len(cursor) % 4), altchars=b"-_", validate=True)
+        return raw.decode("utf-8")
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError(f"Invalid cursor {cursor!r}") from None
+
+
+class SuggestIndex:
+    """Completions for names, brands and notes: a sorted key array plus bisect.
+
+    Every word start of a value is a key ("velvet amber" is found by "am"),
+    scored by the summed rating of the records carrying the value, so a
+    popular, well-rated brand beats a one-off name. Top lists for the
+    shortest prefixes, whose key ranges are huge, are built up front; longer
+    prefixes take the best of their range with argpartition.
+    """
+
+    PRECOMPUTED = 2
+
+    def __init__(self, items: list[dict[str, Any]], k: int = 10):
+        self.k = k
+        weight: dict[tuple[str, str], float] = {}
+        label: dict[tuple[str, str], str] = {}
+        for item in items:
+            score = (_number(item.get("rating")) or 0.0) + 1.0  # unrated records still count
+            values = [("name", item.get("name")), ("brand", item.get("brand"))]
+            values += [("note", n) for n in dict.fromkeys(item.get("notes") or [])]
+            for kind, value in values:
+                key = (kind, fold(value))
+                if key[1]:
+                    weight[key] = weight.get(key, 0.0) + score
+                    label.setdefault(key, str(value).strip())
+        # best first, so every list built below is already ranked
+        ranked = sorted(weight.items(), key=lambda kv: (-kv[1], label[kv[0]]))
+        self.entries = [(label[key], key[0], round(w, 1)) for key, w in ranked]
+        self.top: dict[str, list[int]] = {}
+        pairs = []
+        for e, ((_, folded), _) in enumerate(ranked):
+            words = folded.split(" ")
+            seen = set()
+            for i, word in enumerate(words):
+                if word.isdigit():
+                    continue  # "No. 5" is not worth completing on "5"
+                pairs.append((" ".join(words[i:]), e))
+                for n in range(1, min(self.PRECOMPUTED, len(word)) + 1):
+                    seen.add(word[:n])
+            for prefix in seen:
+                best = self.top.setdefault(prefix, [])
+                if len(best) < k:
+                    best.append(e)
+        pairs.sort()
+        self.keys = [key for key, _ in pairs]
+        self.owner = np.fromiter((e for _, e in pairs), dtype=np.intp, count=len(pairs))
+
+    def complete(self, prefix: str, limit: int = 10) -> list[dict[str, Any]]:
+        p = fold(prefix)
+        if not p or limit <= 0:
+            return []
+        best = self.top.get(p) if limit <= self.k else None
+        if best is None:
+            lo = bisect_left(self.keys, p)
+            hi = bisect_left(self.keys, p + "\U0010ffff", lo)
+            # entries are numbered best first, so the smallest owners win; a few
+            # spare picks absorb values matched at more than one word start
+            owners = self.owner[lo:hi]
+            if len(owners) > 2 * limit:
+                owners = owners[np.argpartition(owners, 2 * limit - 1)[: 2 * limit]]
+            best = sorted(set(owners.tolist()))
+        return [
+            {"text": text, "kind": kind, "score": score}
+            for text, kind, score in (self.entries[e] for e in best[:limit])
+        ]
+
+
+_CACHE: dict[str, Any] = {"version": None, "items": None}
+
+# Indexes that follow storage's change feed instead of being rebuilt, and the
+# most records a feed may touch before rebuilding is cheaper than catching up.
+INCREMENTAL = ("tokens", "trigrams", "name_trigrams", "facets")
+DELTA_LIMIT = 2048
+
+
+def _prebuilt_facets() -> dict[str, tuple[dict[str, int], dict[str, str]]]:
+    return {"allergen": storage.allergen_bitsets()}
+
+
+def _indexes() -> dict[str, Any]:
+    version, items = storage.catalog_snapshot()
+    if _CACHE["version"] != version:
+        kept: dict[str, Any] = {}
+        ops = storage.changes_since(_CACHE["version"]) if _CACHE["version"] is not None else None
+        touched = sum(1 if op[0] == "put" else len(op[1]) for op in ops or ())
+        if ops is not None and touched <= DELTA_LIMIT:
+            for name in INCREMENTAL:
+                index = _CACHE.get(name)
+                if index is None:
+                    continue
+                if name == "facets":
+                    index.apply(ops, _prebuilt_facets())
+                else:
+                    index.apply(ops)
+                kept[name] = index
+        # everything else is rebuilt lazily by _index() on first use
+        _CACHE.clear()
+        _CACHE.update(version=version, items=items, **kept)
+    return _CACHE
+
+
+def _index(name: str) -> Any:
+    """Build the named index at most once per catalog version."""
+    cache = _indexes()
+    if name not in cache:
+        items = cache["items"]
+        if name == "tokens":
+            cache[name] = TokenIndex(items)
+        elif name == "trigrams":
+            cache[name] = TrigramIndex(items)
+        elif name == "name_trigrams":
+            cache[name] = TrigramIndex(items, names_only=True)
+        elif name == "fuzzy":
+            cache[name] = FuzzyIndex(items)
+        elif name == "facets":
+            cache[name] = FacetIndex(items, _prebuilt_facets())
+        elif name == "suggest":
+            cache[name] = SuggestIndex(items)
+        elif name == "ids":
+            cache[name] = IdIndex(items)
+        elif name.startswith("sorted:"):
+            cache[name] = SortedIndex(items, name.partition(":")[2])
+    return cache[name]
+
+
+def _without_allergens(hits: Sequence[int], allergens: Iterable[str]) -> Sequence[int]:
+    """``hits`` minus the records listing any of ``allergens``, from storage's bitsets."""
+    allergens = list(allergens)
+    if not allergens or not hits:
+        return hits
+    banned = storage.allergen_mask(allergens)
+    if not banned:
+        return hits
+    flags = bits(banned, len(_indexes()["items"]))
+    return [p for p in hits if not flags[p]]
+
+
+def find(
+    query: str, mode: str = "and", exclude_allergens: Iterable[str] = ()
+) -> list[dict[str, Any]]:
+    """Records matching every (``mode="and"``) or any (``"or"``) query term.
+
+    In "and" mode a record whose name, brand or a note contains the whole
+    query as a substring (e.g. "se du" -> "Rose Dusk") also matches.
+    Records listing any of ``exclude_allergens`` are dropped.
+    """
+
+    def compute() -> tuple[int, ...]:
+        hits = _index("tokens").query(query, mode)
+        if mode != "or":
+            hits = union([hits, _index("trigrams").search(query)])
+        return tuple(hits)
+
+    hits = resultcache.cached(("find", mode, fold(query)), compute)
+    hits = _without_allergens(hits, exclude_allergens)
+    items = _indexes()["items"]
+    return [dict(items[i]) for i in hits]
+
+
+def name_contains(text: str) -> list[dict[str, Any]]:
+    """Records whose name contains ``text`` (case-insensitive), in catalog order."""
+    items = _indexes()["items"]
+    return [dict(items[i]) for i in _index("name_trigrams").search(text)]
+
+
+def fuzzy(
+    query: str, limit: int = 10, score_cutoff: float = 60.0, exclude_allergens: Iterable[str] = ()
+) -> list[tuple[dict[str, Any], float]]:
+    """Typo-tolerant match of ``query`` against name + brand, best first.
+
+    Candidates are scored (0-100, WRatio) in one batched ``cdist`` call spread
+    over all cores; anything under ``score_cutoff`` is dropped inside RapidFuzz.
+    The cost follows the number of candidates rather than the catalog size, so
+    a single common word costs more than a rarer multi-word query. Repeats are
+    cached.
+    Records listing any of ``exclude_allergens`` never take up one of the
+    ``limit`` places.
+    """
+    q = " ".join(tokenize(query))
+    if not q or limit <= 0:
+        return []
+    avoid = tuple(sorted({fold(a) for a in exclude_allergens} - {""}))
+    scored = resultcache.cached(
+        ("fuzzy", q, limit, score_cutoff, avoid), lambda: _fuzzy(q, limit, score_cutoff, avoid)
+    )
+    items = _indexes()["items"]
+    return [(dict(items[pos]), score) for pos, score in scored]
+
+
+def _fuzzy(
+    q: str, limit: int, score_cutoff: float, avoid: tuple[str, ...] = ()
+) -> tuple[tuple[int, float], ...]:
+    index = _index("fuzzy")
+    if not index.keys:
+        return ()
+    pool = index.candidates(q, score_cutoff)
+    if avoid and len(pool):
+        pool = pool[bits(storage.safe_mask(avoid), len(index.keys))[pool]]
+    if not len(pool):
+        return ()
+    scores = process.cdist(
+        [q],
+        [index.keys[i] for i in pool],
+        scorer=fuzz.WRatio,
+        processor=None,
+        score_cutoff=score_cutoff,
+        dtype=np.float32,
+        workers=-1,
+    )[0]
+    top = np.flatnonzero(scores)
+    if len(top) > limit:
+        # everything above the limit-th best score, then ties in catalog order
+        # (pool is sorted) until the limit is filled
+        kth = np.partition(scores[top], len(top) - limit)[len(top) - limit]
+        above, tied = top[scores[top] > kth], top[scores[top] == kth]
+        top = np.concatenate((above, tied[: limit - len(above)]))
+    # best score first, catalog order among ties
+    top = top[np.lexsort((pool[top], -scores[top]))]
+    return tuple((int(pool[i]), round(float(scores[i]), 1)) for i in top)
+
+
+def _filter_key(
+    include: dict[str, list[str]],
+    exclude: dict[str, list[str]],
+    ranges: dict[str, tuple[float | None, float | None]],
+) -> tuple[Any, ...]:
+    """Order- and case-insensitive cache key for a set of filters."""
+
+    def facets(spec: dict[str, list[str]]) -> tuple[Any, ...]:
+        return tuple(
+            sorted((f, tuple(sorted({fold(v) for v in vals}))) for f, vals in spec.items() if vals)
+        )
+
+    bounds = tuple(
+        sorted((f, lo, hi) for f, (lo, hi) in ranges.items() if lo is not None or hi is not None)
+    )
+    return facets(include), facets(exclude), bounds
+
+
+def _filter(
+    include: dict[str, list[str]],
+    exclude: dict[str, list[str]],
+    ranges: dict[str, tuple[float | None, float | None]],
+) -> tuple[int | None, list[int] | None]:
+    """(range bitmap or None, matching positions or None when nothing filters)."""
+    for field in ranges:
+        if field not in SORTABLE:
+            raise ValueError(f"Unknown numeric field {field!r}; use one of {', '.join(SORTABLE)}")
+    facet_index = _index("facets")
+    within = None
+    for field, (lo, hi) in ranges.items():
+        if lo is None and hi is None:
+            continue
+        span = _bitmap(_index(f"sorted:{field}").span(lo, hi), facet_index.size)
+        within = span if within is None else within & span
+    if not (include or exclude) and within is None:
+        return None, None
+    mask = facet_index.select(include, exclude, within=within)
+    return within, positions(mask, facet_index.size).tolist()
+
+
+def browse(
+    include: dict[str, list[str]] | None = None,
+    exclude: dict[str, list[str]] | None = None,
+    ranges: dict[str, tuple[float | None, float | None]] | None = None,
+    sort: str | None = None,
+    descending: bool | None = None,
+    limit: int | None = None,
+    facets: bool = False,
+) -> tuple[int, list[dict[str, Any]], dict[str, dict[str, int]] | None]:
+    """Filter, sort and truncate the catalog from the indexes: (total, items, counts).
+
+    ``include={"brand": ["Dior"], "family": ["Floral"]}`` keeps Dior florals;
+    ``exclude={"allergen": ["linalool"]}`` then drops any containing linalool.
+    Facet matching ignores case and accents; unknown facets raise ValueError.
+    ``ranges={"price": (40, 80)}`` bounds numeric fields inclusively (None =
+    open); ``sort`` is one of SORTABLE, in its default direction unless
+    ``descending`` says otherwise. ``total`` counts matches before ``limit``;
+    with ``facets`` true, ``counts`` maps each facet to its value counts among
+    the matches, ignoring that facet's own filter so the other values stay
+    visible; otherwise it is None.
+    """
+    include, exclude, ranges = include or {}, exclude or {}, ranges or {}
+    if sort and sort not in SORTABLE:
+        raise ValueError(f"Unknown numeric field {sort!r}; use one of {', '.join(SORTABLE)}")
+    desc = (SORTABLE[sort] if descending is None else descending) if sort else None
+
+    def compute() -> tuple[int, tuple[int, ...], dict[str, dict[str, int]] | None]:
+        size = len(_indexes()["items"])
+        within, candidates = _filter(include, exclude, ranges)
+        total = len(candidates) if candidates is not None else size
+        if sort:
+            chosen = _index(f"sorted:{sort}").top(candidates, limit, desc)
+        else:
+            chosen = (candidates if candidates is not None else range(size))[:limit]
+        counts = _index("facets").counts(include, exclude, within=within) if facets else None
+        return total, tuple(chosen), counts
+
+    key = ("browse", _filter_key(include, exclude, ranges), sort, desc, limit, facets)
+    total, chosen, counts = resultcache.cached(key, compute)
+    items = _indexes()["items"]
+    if counts is not None:
+        counts = {f: dict(c) for f, c in counts.items()}
+    return total, [dict(items[i]) for i in chosen], counts
+
+
+def page(
+    limit: int,
+    after: str | None = None,
+    include: dict[str, list[str]] | None = None,
+    exclude: dict[str, list[str]] | None = None,
+    ranges: dict[str, tuple[float | None, float | None]] | None = None,
+) -> tuple[int, list[dict[str, Any]], str | None]:
+    """One keyset page in id order: (total matches, items, next cursor or None).
+
+    ``after`` is a cursor from a previous page. A page costs one bisect plus
+    a walk of ``limit`` ids; with filters, ids that do not match are skipped
+    on the way.
+    """
+    include, exclude, ranges = include or {}, exclude or {}, ranges or {}
+    start = decode_cursor(after) if after else None
+    key = ("page", _filter_key(include, exclude, ranges), start, limit)
+    total, chosen, cursor = resultcache.cached(
+        key, lambda: _page(limit, start, include, exclude, ranges)
+    )
+    items = _indexes()["items"]
+    return total, [dict(items[pos]) for pos in chosen], cursor
+
+
+def _page(
+    limit: int,
+    after: str | None,
+    include: dict[str, list[str]],
+    exclude: dict[str, list[str]],
+    ranges: dict[str, tuple[float | None, float | None]],
+) -> tuple[int, tuple[int, ...], str | None]:
+    items = _indexes()["items"]
+    ids = _index("ids")
+    _, candidates = _filter(include, exclude, ranges)
+    keep = None
+    if candidates is not None:
+        keep = np.zeros(len(items), dtype=bool)
+        keep[candidates] = True
+    start = ids.start(after)
+    chosen: list[int] = []
+    i = start
+    while i < len(ids.order) and len(chosen) < limit:
+        pos = ids.order[i]
+        if keep is None or keep[pos]:
+            chosen.append(pos)
+        i += 1
+    # a full page always gets a cursor; at worst the page it leads to is empty
+    full = limit > 0 and len(chosen) == limit
+    cursor = encode_cursor(ids.ids[i - 1]) if full and i < len(ids.order) else None
+    total = len(candidates) if candidates is not None else len(ids.ids)
+    return total, tuple(chosen), cursor
+
+
+def suggest(prefix: str, limit: int = 10) -> list[dict[str, Any]]:
+    """Top completions of ``prefix`` among names, brands and notes, best first.
+
+    Each is {"text", "kind" ("name"/"brand"/"note"), "score"}.
+    """
+    return _index("suggest").complete(prefix, limit)
@@ -0,0 +1,118 @@
+""" "More like this": note-vector similarity over the whole catalog.
+
+Notes are interned into a vocabulary and stored twice, CSR-style: per
+record (``indptr``/``indices``) and per note (``note_ptr``/``note_rows``).
+Scoring one perfume against every other is then a handful of NumPy calls -
+a bincount over the postings of its notes gives every intersection size at
+once - instead of a Python loop over record pairs. Built once per catalog
+version alongside the search indexes.
+"""
+
+from __future__ import annotations
+
+from typing import Any
+
+import numpy as np
+
+import resultcache
+import search
+from textnorm import fold
+
+# score = weighted Jaccard over notes + exact family / concentration matches
+NOTE_WEIGHT = 0.7
+FAMILY_WEIGHT = 0.2
+CONCENTRATION_WEIGHT = 0.1
+
+
+def _codes(values: list[str]) -> np.ndarray:
+    """Intern ``values``; "" (missing) gets -1 so it never counts as a match."""
+    vocab: dict[str, int] = {}
+    return np.fromiter(
+        (vocab.setdefault(v, len(vocab)) if v else -1 for v in values),
+        dtype=np.int32,
+        count=len(values),
+    )
+
+
+class NoteVectors:
+    def __init__(self, items: list[dict[str, Any]]):
+        self.size = len(items)
+        self.vocab: dict[str, int] = {}
+        self.pos = {str(it["id"]): i for i, it in enumerate(items) if it.get("id")}
+        indices: list[int] = []
+        indptr = [0]
+        for item in items:
+            ids = {
+                self.vocab.setdefault(k, len(self.vocab))
+                for k in map(fold, item.get("notes") or [])
+                if k
+            }
+            indices.extend(sorted(ids))
+            indptr.append(len(indices))
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.lengths = np.diff(self.indptr)
+        # transpose: which records carry each note
+        order = np.argsort(self.indices, kind="stable")
+        self.note_rows = np.repeat(np.arange(self.size, dtype=np.int32), self.lengths)[order]
+        self.note_ptr = np.searchsorted(self.indices[order], np.arange(len(self.vocab) + 1))
+        self.family = _codes([fold(it.get("family")) for it in items])
+        self.concentration = _codes([fold(it.get("concentration")) for it in items])
+
+    def notes_of(self, i: int) -> np.ndarray:
+        return self.indices[self.indptr[i] : self.indptr[i + 1]]
+
+    def scores(self, i: int) -> np.ndarray:
+        """Similarity of record ``i`` to every record (itself included), in [0, 1]."""
+        mine = self.notes_of(i)
+        rows = [self.note_rows[self.note_ptr[n] : self.note_ptr[n + 1]] for n in mine]
+        shared = (
+            np.bincount(np.concatenate(rows), minlength=self.size) if rows else np.zeros(self.size)
+        )
+        union = self.lengths + len(mine) - shared
+        jaccard = np.divide(shared, union, out=np.zeros(self.size), where=union > 0)
+        score = NOTE_WEIGHT * jaccard
+        if self.family[i] >= 0:
+            score += FAMILY_WEIGHT * (self.family == self.family[i])
+        if self.concentration[i] >= 0:
+            score += CONCENTRATION_WEIGHT * (self.concentration == self.concentration[i])
+        return score
+
+
+def _vectors() -> NoteVectors:
+    cache = search._indexes()
+    if "notes" not in cache:
+        cache["notes"] = NoteVectors(cache["items"])
+    return cache["notes"]
+
+
+def _top(pid: str, k: int) -> tuple[tuple[int, float], ...] | None:
+    vectors = _vectors()
+    i = vectors.pos.get(pid)
+    if i is None:
+        return None
+    score = vectors.scores(i)
+    score[i] = -1.0  # never recommend the perfume itself
+    k = min(k, vectors.size - 1)
+    if k <= 0:
+        return ()
+    top = np.argpartition(-score, k - 1)[:k]
+    top = top[np.lexsort((top, -score[top]))]  # best first, catalog order among ties
+    return tuple((int(j), round(float(score[j]), 3)) for j in top if score[j] > 0)
+
+
+def similar(pid: str, k: int = 10) -> list[dict[str, Any]] | None:
+    """The ``k`` perfumes most like ``pid``, best first, each with a "score" and its
+    "shared_notes"; None if there is no perfume with that id."""
+    hits = resultcache.cached(("similar", pid, k), lambda: _top(pid, k))
+    if hits is None:
+        return None
+    items = search._indexes()["items"]
+    mine = {fold(n) for n in items[_vectors().pos[pid]].get("notes") or []}
+    out = []
+    for j, score in hits:
+        item = dict(items[j])
+        item["score"] = score
+        item["shared_notes"] = [n for n in item.get("notes") or [] if fold(n) in mine]
+        out.append(item)
+    return out
@@ -1,17 +1,90 @@
 from __future__ import annotations
 
+import builtins
 import json
+import os
+import random
 import uuid
+from bisect import insort
+from collections import deque
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any
+
+import recordfile
+import storage_sqlite
+from io_utils import detect_format, iter_records, read_json, write_records
+from textnorm import fold
+from validators import non_empty_list_str, non_empty_str, positive_float_or_none
 
 # Test/CI monkeypatches this path sometimes; keep the name.
 DEFAULT_DB = Path("db.json")
 
+# Curated reference catalog; seed_n draws brands, families and notes from it.
+CATALOG_JSON = Path(__file__).resolve().parent / "data" / "catalog.json"
+
+# "json" (db.json, the default) or "sqlite". The SQLite file defaults to
+# db.sqlite3 next to DEFAULT_DB; AROMAVAULT_SQLITE overrides the location.
+BACKEND = os.environ.get("AROMAVAULT_BACKEND", "json").strip().lower()
+SQLITE_DB = os.environ.get("AROMAVAULT_SQLITE") or None
+
+# On-disk format for db.json (see io_utils.FORMATS), e.g. "json", "ndjson.gz".
+# Reads sniff the format, so when this is unset a rewrite keeps whatever
+# format the file already has (pretty JSON for a new file).
+FORMAT = os.environ.get("AROMAVAULT_FORMAT") or None
+
+# Journaled writes: mutations are appended to "<db>.log" (one line per write,
+# a multi-record write as a single "batch" line) instead of rewriting the whole
+# snapshot. Reads always replay a log if one exists, so switching the flag off
+# is safe; compaction folds the log back into the snapshot.
+JOURNAL = os.environ.get("AROMAVAULT_JOURNAL", "").strip().lower() in {"1", "true", "yes", "on"}
+JOURNAL_MAX_RECORDS = 1000
+JOURNAL_MAX_BYTES = 1 << 20
+
+# In-process catalog cache. It is keyed on the db path plus the (mtime_ns, size,
+# inode) of the snapshot and its journal, so a write from another process or
+# gunicorn worker is picked up on the next read, while repeated reads skip the parse.
+_CACHE: dict[str, Any] = {"path": None, "sig": None, "items": None, "log_records": 0, "index": None}
+_VERSION = 0
+
+# Change feed for derived indexes (see changes_since): the ops of each recent
+# version applied in place to the cached list, since the last full (re)load.
+_HISTORY: deque[tuple[int, list[tuple[Any, ...]]]] = deque(maxlen=64)
+_CHAIN_START = 0
+
+# Open reader for an exported db.rec (see recordfile), keyed on its stat signature.
+_RECORDS: dict[str, Any] = {"key": None, "reader": None}
 
-def _load_db() -> List[Dict[str, Any]]:
+Sig = tuple[int, int, int] | None
+
+
+def _file_sig(path: Path) -> Sig:
     try:
-        data = json.loads(DEFAULT_DB.read_text(encoding="utf-8"))
+        st = path.stat()
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def _sqlite_path() -> Path:
+    return Path(SQLITE_DB) if SQLITE_DB else Path(DEFAULT_DB).with_suffix(".sqlite3")
+
+
+def _sqlite():
+    """This thread's SQLite connection when that backend is selected, else None."""
+    if BACKEND != "sqlite":
+        return None
+    return storage_sqlite.connect(_sqlite_path())
+
+
+def _journal_path(path: Path) -> Path:
+    return path.with_name(path.name + ".log")
+
+
+def _read_db_file(path: Path) -> list[dict[str, Any]]:
+    try:
+        data = read_json(path)
         return data if isinstance(data, list) else []
     except FileNotFoundError:
         return []
@@ -19,50 +92,959 @@ def _load_db() -> List[Dict[str, Any]]:
         return []
 
 
-def _save_db(items: List[Dict[str, Any]]) -> None:
-    DEFAULT_DB.write_text(json.dumps(items, ensure_ascii=False, indent=2), encoding="utf-8")
+def _read_journal(path: Path) -> list[dict[str, Any]]:
+    try:
+        text = path.read_text(encoding="utf-8")
+    except FileNotFoundError:
+        return []
+    # only newline-terminated lines were fully written; a last line without one
+    # is torn even if it parses, and the next append will cut it (_trim_torn_tail)
+    lines = text.split("\n")[:-1]
+    records = []
+    for line in lines:
+        try:
+            rec = json.loads(line)
+        except ValueError:
+            # torn tail from a crash mid-append; everything before it is intact
+            continue
+        if isinstance(rec, dict) and rec.get("op") == "batch":
+            records.extend(rec.get("records") or [])
+        else:
+            records.append(rec)
+    return records
+
+
+def _name_key(name: Any) -> str:
+    return fold(name)
+
+
+def _allergen_keys(item: dict[str, Any]) -> dict[str, str]:
+    """Folded allergen -> its first spelling in ``item``."""
+    out: dict[str, str] = {}
+    for v in item.get("allergens") or []:
+        key = fold(v)
+        if key:
+            out.setdefault(key, str(v).strip())
+    return out
+
+
+def _bits(positions: Iterable[int]) -> int:
+    """Int bitset with bit p set for each p in ``positions``."""
+    positions = list(positions)
+    if not positions:
+        return 0
+    buf = bytearray(max(positions) // 8 + 1)
+    for p in positions:
+        buf[p >> 3] |= 1 << (p & 7)
+    return int.from_bytes(buf, "little")
+
+
+def _drop_bits(mask: int, gone: list[int]) -> int:
+    """``mask`` without the bits at positions ``gone`` (ascending); higher bits shift down."""
+    if len(gone) <= 16:
+        for j in reversed(gone):
+            mask = (mask & ((1 << j) - 1)) | ((mask >> (j + 1)) << j)
+        return mask
+    # many positions: one pass over the binary digits instead of a shift per position
+    text = format(mask, "b")[::-1]
+    kept = "".join(text[a + 1 : b] for a, b in zip([-1] + gone, gone + [len(text)]))
+    return int(kept[::-1] or "0", 2)
+
+
+class _Index:
+    """Hash indexes over one catalog list: id -> position, folded name -> positions,
+    and folded allergen -> int bitset of positions (bit i = record i).
+
+    Kept in step with the list by put()/remove() so point lookups never scan
+    and allergen bitsets are never rebuilt from scratch on a write.
+    Name position lists stay sorted so the first hit is the first in file order.
+    Every put()/remove() is also logged in ``ops`` for changes_since().
+    """
+
+    def __init__(self, items: list[dict[str, Any]]):
+        self.ids: dict[str, int] = {}
+        self.names: dict[str, list[int]] = {}
+        self.allergen_labels: dict[str, str] = {}
+        self.size = len(items)
+        found: dict[str, list[int]] = {}
+        for i, it in enumerate(items):
+            self._add(i, it, bits=False)
+            for key, label in _allergen_keys(it).items():
+                self.allergen_labels.setdefault(key, label)
+                found.setdefault(key, []).append(i)
+        self.allergens: dict[str, int] = {k: _bits(p) for k, p in found.items()}
+        self.ops: list[tuple[Any, ...]] = []
+
+    def _add(self, i: int, item: dict[str, Any], bits: bool = True) -> None:
+        if item.get("id"):
+            self.ids.setdefault(str(item["id"]), i)
+        insort(self.names.setdefault(_name_key(item.get("name")), []), i)
+        if bits:
+            for key, label in _allergen_keys(item).items():
+                self.allergen_labels.setdefault(key, label)
+                self.allergens[key] = self.allergens.get(key, 0) | (1 << i)
+
+    def _drop(self, i: int, item: dict[str, Any], bits: bool = True) -> None:
+        if item.get("id") and self.ids.get(str(item["id"])) == i:
+            del self.ids[str(item["id"])]
+        key = _name_key(item.get("name"))
+        bucket = self.names.get(key)
+        if bucket and i in bucket:
+            bucket.remove(i)
+            if not bucket:
+                del self.names[key]
+        if bits:
+            for key in _allergen_keys(item):
+                left = self.allergens.get(key, 0) & ~(1 << i)
+                if left:
+                    self.allergens[key] = left
+                else:
+                    self.allergens.pop(key, None)
+
+    def put(self, items: list[dict[str, Any]], item: dict[str, Any]) -> None:
+        i = self.ids.get(str(item.get("id")))
+        if i is None:
+            items.append(item)
+            self.size = len(items)
+            self._add(len(items) - 1, item)
+            self.ops.append(("put", len(items) - 1, None, item))
+        else:
+            self._drop(i, items[i])
+            self.ops.append(("put", i, items[i], item))
+            items[i] = item
+            self._add(i, item)
+
+    def remove(self, items: list[dict[str, Any]], positions: Iterable[int]) -> None:
+        # only the tail after the first removed row shifts, so only it is re-indexed
+        gone = set(positions)
+        if not gone:
+            return
+        start = min(gone)
+        order = sorted(gone)
+        self.ops.append(("remove", order, [items[j] for j in order]))
+        for j in range(start, len(items)):
+            self._drop(j, items[j], bits=False)
+        items[start:] = [it for j, it in enumerate(items[start:], start) if j not in gone]
+        for j in range(start, len(items)):
+            self._add(j, items[j], bits=False)
+        for key in list(self.allergens):
+            mask = _drop_bits(self.allergens[key], order)
+            if mask:
+                self.allergens[key] = mask
+            else:
+                del self.allergens[key]
+        self.size = len(items)
+
+
+def _replay(
+    items: list[dict[str, Any]], records: Iterable[dict[str, Any]], index: _Index | None = None
+) -> None:
+    """Apply journal records to ``items`` (and its index) in place. Records are idempotent."""
+    index = index or _Index(items)
+    doomed: list[int] = []
+    for rec in records:
+        op = rec.get("op")
+        if op == "put":
+            if doomed:
+                index.remove(items, doomed)
+                doomed = []
+            index.put(items, rec.get("item") or {})
+        elif op == "del":
+            i = index.ids.get(str(rec.get("id")))
+            if i is not None and i not in doomed:
+                doomed.append(i)
+    index.remove(items, doomed)
+
+
+def _set_cache(
+    path: Path,
+    sig: Any,
+    items: list[dict[str, Any]],
+    log_records: int = 0,
+    index: _Index | None = None,
+) -> None:
+    global _VERSION, _CHAIN_START
+    same = index is not None and index is _CACHE["index"] and items is _CACHE["items"]
+    index = index or _Index(items)
+    _CACHE.update(path=path, sig=sig, items=items, log_records=log_records, index=index)
+    _VERSION += 1
+    if same:
+        _HISTORY.append((_VERSION, index.ops))
+    else:
+        _HISTORY.clear()
+        _CHAIN_START = _VERSION
+    index.ops = []
+
+
+def changes_since(version: int) -> list[tuple[Any, ...]] | None:
+    """The in-place edits that turned the catalog at ``version`` into the current one.
+
+    Ops are ("put", position, old item or None if appended, new item) and
+    ("remove", ascending positions, removed items), in order. None when the
+    catalog was reloaded or rewritten since (or the feed no longer reaches
+    back that far): callers must then rebuild from catalog_snapshot().
+    """
+    current = catalog_version()
+    if version == current:
+        return []
+    if version < _CHAIN_START or version > current:
+        return None
+    if not _HISTORY or _HISTORY[0][0] > version + 1:
+        return None
+    return [op for v, ops in _HISTORY if v > version for op in ops]
+
+
+def _catalog() -> list[dict[str, Any]]:
+    """Return the cached catalog list, reloading it only if the files changed.
+
+    The list and its dicts are shared; callers must not mutate them.
+    """
+    conn = _sqlite()
+    if conn is not None:
+        path, sig = _sqlite_path(), ("sqlite", storage_sqlite.version(conn))
+        if _CACHE["items"] is None or _CACHE["path"] != path or _CACHE["sig"] != sig:
+            _set_cache(path, sig, storage_sqlite.load_all(conn))
+        return _CACHE["items"]
+    path = Path(DEFAULT_DB)
+    log = _journal_path(path)
+    # stat before reading: if a file changes in between we merely reload once
+    # more next time, never keep stale data under a fresh signature.
+    sig = (_file_sig(path), _file_sig(log))
+    if _CACHE["items"] is not None and _CACHE["path"] == path and _CACHE["sig"] == sig:
+        return _CACHE["items"]
+    items = _read_db_file(path)
+    records = _read_journal(log) if sig[1] is not None else []
+    index = _Index(items)
+    _replay(items, records, index)
+    _set_cache(path, sig, items, len(records), index)
+    return items
 
 
-def list_perfumes() -> List[Dict[str, Any]]:
+def _index() -> _Index:
+    _catalog()
+    return _CACHE["index"]
+
+
+def catalog_snapshot() -> tuple[int, list[dict[str, Any]]]:
+    """(version, items) for read-only consumers such as the search indexes.
+
+    The list is the shared cache: do not mutate it or its records.
+    """
+    items = _catalog()
+    return _VERSION, items
+
+
+def catalog_version() -> int:
+    """Monotonic counter bumped whenever the cached catalog changes."""
+    _catalog()
+    return _VERSION
+
+
+def allergen_bitsets() -> tuple[dict[str, int], dict[str, str]]:
+    """(folded allergen -> bitset of catalog positions, folded allergen -> label).
+
+    Bit i refers to record i of catalog_snapshot() at the same version.
+    Both dicts are copies; the bitsets are maintained incrementally on writes.
+    """
+    index = _index()
+    return dict(index.allergens), dict(index.allergen_labels)
+
+
+def allergen_mask(allergens: Iterable[Any]) -> int:
+    """Bitset of perfumes listing any of ``allergens`` (one OR per allergen)."""
+    bitsets = _index().allergens
+    mask = 0
+    for key in {fold(a) for a in allergens}:
+        mask |= bitsets.get(key, 0)
+    return mask
+
+
+def safe_mask(allergens: Iterable[Any]) -> int:
+    """Bitset of perfumes listing none of ``allergens``: the complement of allergen_mask()."""
+    return ((1 << _index().size) - 1) & ~allergen_mask(allergens)
+
+
+def _load_db() -> list[dict[str, Any]]:
+    # Fresh, mutable copies so callers can edit records before _save_db.
+    return [dict(it) for it in _catalog()]
+
+
+def _save_db(items: list[dict[str, Any]], index: _Index | None = None) -> None:
+    """Rewrite the snapshot with ``items``.
+
+    With ``index`` (already in step with ``items``) the list itself becomes
+    the cache; otherwise it is copied and indexed afresh.
+    """
+    conn = _sqlite()
+    if conn is not None:
+        storage_sqlite.replace_all(conn, items)
+        return
+    path = Path(DEFAULT_DB)
+    # temp file + rename; the rename keeps inode and mtime, so the stat returned
+    # for the temp file is exactly the signature readers will see
+    st = write_records(path, items, FORMAT or detect_format(path) or "json-pretty")
+    # The snapshot now holds everything; a crash before this unlink is harmless
+    # because replaying the old log over the new snapshot is idempotent.
+    _journal_path(path).unlink(missing_ok=True)
+    sig = ((st.st_mtime_ns, st.st_size, st.st_ino), None)
+    if index is None:
+        _set_cache(path, sig, [dict(it) for it in items])
+    else:
+        _set_cache(path, sig, items, 0, index)
+
+
+def _trim_torn_tail(f: Any) -> int:
+    """Cut a partial last line left by a crash mid-append; returns the new end offset.
+
+    Without this the next record would be glued onto the torn fragment and
+    dropped with it on replay.
+    """
+    end = f.seek(0, os.SEEK_END)
+    if end == 0:
+        return 0
+    f.seek(end - 1)
+    if f.read(1) == b"\n":
+        return end
+    pos = end
+    while pos > 0:
+        step = min(pos, 1 << 16)
+        pos -= step
+        f.seek(pos)
+        nl = f.read(step).rfind(b"\n")
+        if nl >= 0:
+            f.truncate(pos + nl + 1)
+            return pos + nl + 1
+    f.truncate(0)
+    return 0
+
+
+def _journal_append(records: list[dict[str, Any]]) -> None:
+    items = _catalog()
+    path = Path(DEFAULT_DB)
+    snap_sig, log_sig = _CACHE["sig"]
+    # several records go on one "batch" line: a crash mid-append tears the whole
+    # line, which replay and _trim_torn_tail then drop as one, never half of it
+    line = records[0] if len(records) == 1 else {"op": "batch", "records": records}
+    payload = json.dumps(line, ensure_ascii=False, separators=(",", ":")) + "\n"
+    with _journal_path(path).open("a+b") as f:
+        start = _trim_torn_tail(f)
+        f.write(payload.encode("utf-8"))
+        f.flush()
+        st = os.fstat(f.fileno())
+    if start != (log_sig[1] if log_sig else 0) or _file_sig(path) != snap_sig:
+        # someone else wrote in the meantime; let the next read replay from disk
+        _CACHE["items"] = None
+        return
+    _replay(items, records, _CACHE["index"])
+    _set_cache(
+        path,
+        (snap_sig, (st.st_mtime_ns, st.st_size, st.st_ino)),
+        items,
+        _CACHE["log_records"] + len(records),
+        _CACHE["index"],
+    )
+    if _CACHE["log_records"] > JOURNAL_MAX_RECORDS or st.st_size > JOURNAL_MAX_BYTES:
+        compact()
+
+
+def _apply(records: list[dict[str, Any]]) -> None:
+    """Persist put/del records: append to the journal or rewrite the snapshot."""
+    # records for id-less legacy rows can't be replayed, so they force a rewrite
+    keyed = all((r.get("item") or r).get("id") for r in records)
+    conn = _sqlite()
+    if conn is not None and keyed:
+        storage_sqlite.apply(conn, records)
+        return
+    if JOURNAL and keyed:
+        _journal_append(records)
+        return
+    if conn is not None:
+        items = _load_db()
+        _replay(items, records)
+        _save_db(items)
+        return
+    # like the journal path: apply to the cached list and index in place, so
+    # a write costs the snapshot rewrite but never an index rebuild
+    items, index = _catalog(), _CACHE["index"]
+    try:
+        _replay(items, records, index)
+        _save_db(items, index)
+    except BaseException:
+        _CACHE["items"] = None  # the cache no longer matches the files; reload
+        raise
+
+
+def compact() -> int:
+    """Fold the journal into a fresh snapshot. Returns the number of records.
+
+    SQLite has no journal to fold; there this only vacuums the database file.
+    """
+    conn = _sqlite()
+    if conn is not None:
+        return storage_sqlite.vacuum(conn)
+    items = _catalog()
+    _save_db(items, _CACHE["index"])
+    if _records_path().exists():
+        # keep an exported record file in step with the new snapshot
+        export_records()
+    return len(items)
+
+
+def _records_path() -> Path:
+    return Path(DEFAULT_DB).with_suffix(".rec")
+
+
+def _record_reader() -> recordfile.RecordReader | None:
+    """Reader for db.rec, but only if it was exported from the current snapshot."""
+    path = _records_path()
+    key = (path, _file_sig(path))
+    if key[1] is None:
+        return None
+    if _RECORDS["key"] != key:
+        if _RECORDS["reader"] is not None:
+            _RECORDS["reader"].close()
+        try:
+            reader = recordfile.RecordReader(path)
+        except (OSError, ValueError):
+            reader = None
+        _RECORDS.update(key=key, reader=reader)
+    reader = _RECORDS["reader"]
+    db = Path(DEFAULT_DB)
+    if reader is None or reader.source_sig != _file_sig(db):
+        return None
+    if _file_sig(_journal_path(db)) is not None:
+        return None
+    return reader
+
+
+def export_records() -> int:
+    """Write db.rec, an mmap-able id-indexed copy of the catalog. Returns the record count.
+
+    A pending journal is compacted first so the record file matches the snapshot.
+    """
+    if _sqlite() is not None:
+        raise ValueError("record files are exported from the JSON store")
+    db = Path(DEFAULT_DB)
+    if _file_sig(_journal_path(db)) is not None:
+        _save_db(_catalog())
+    return recordfile.write(_records_path(), iter_perfumes(), _file_sig(db))
+
+
+def migrate_to_sqlite(source: Path | None = None) -> int:
+    """One-shot import of a JSON db (and any pending journal) into the SQLite file."""
+    src = Path(source or DEFAULT_DB)
+    items = _read_db_file(src)
+    _replay(items, _read_journal(_journal_path(src)))
+    for it in items:
+        it.setdefault("id", str(uuid.uuid4()))
+    return storage_sqlite.replace_all(storage_sqlite.connect(_sqlite_path()), items)
+
+
+def _find(
+    ident: str,
+    ignore_case: bool = False,
+    items: list[dict[str, Any]] | None = None,
+    index: _Index | None = None,
+) -> list[int]:
+    """Positions of records whose id or name equals ``ident``, via the hash indexes.
+
+    Defaults to the cached catalog; a transaction passes its own working copy.
+    """
+    if items is None or index is None:
+        items, index = _catalog(), _CACHE["index"]
+    key = (ident or "").strip() if ignore_case else ident
+    if not key:
+        return []
+    hits = set()
+    for k in {key, key.lower()} if ignore_case else {key}:
+        if k in index.ids:
+            hits.add(index.ids[k])
+    for j in index.names.get(_name_key(key), ()):
+        if ignore_case or items[j].get("name") == key:
+            hits.add(j)
+    return sorted(hits)
+
+
+def find_perfume(identifier: str) -> dict[str, Any] | None:
+    """Look up by exact id or exact name, ignoring case and accents."""
+    hits = _find(identifier, ignore_case=True)
+    return dict(_catalog()[hits[0]]) if hits else None
+
+
+def _cache_fresh() -> bool:
+    """True if the cached catalog still matches the files on disk (stat only)."""
+    if _CACHE["items"] is None or _CACHE["path"] != Path(DEFAULT_DB):
+        return False
+    path = Path(DEFAULT_DB)
+    return _CACHE["sig"] == (_file_sig(path), _file_sig(_journal_path(path)))
+
+
+def iter_perfumes() -> Iterator[dict[str, Any]]:
+    """Yield perfumes one at a time without materialising the whole catalog.
+
+    Served from the cache when it is warm; otherwise db.json is parsed
+    incrementally and any pending journal is merged in on the fly, so memory
+    stays bounded by the journal rather than the catalog.
+    """
+    conn = _sqlite()
+    if conn is not None:
+        yield from storage_sqlite.iter_all(conn)
+        return
+    if _cache_fresh():
+        for it in _CACHE["items"]:
+            yield dict(it)
+        return
+    path = Path(DEFAULT_DB)
+    yield from _with_journal(_lenient(iter_records(path)), path)
+
+
+def _lenient(records: Iterator[Any]) -> Iterator[Any]:
+    # same leniency as _read_db_file: a missing or corrupt snapshot reads as empty
+    try:
+        yield from records
+    except (FileNotFoundError, ValueError):
+        return
+
+
+def load_perfumes() -> list[dict[str, Any]]:
+    """Every perfume from a single parse of the files, for one-shot readers.
+
+    Unlike list_perfumes() this neither builds nor keeps the catalog cache and
+    its indexes, which a short-lived process (a CLI listing) never uses; the
+    journal is merged in as in iter_perfumes().
+    """
+    conn = _sqlite()
+    if conn is not None:
+        return list(storage_sqlite.iter_all(conn))
+    if _cache_fresh():
+        return [dict(it) for it in _CACHE["items"]]
+    path = Path(DEFAULT_DB)
+    items = _read_db_file(path)
+    if _file_sig(_journal_path(path)) is None:
+        return [it for it in items if isinstance(it, dict)]
+    return list(_with_journal(items, path))
+
+
+def _with_journal(snapshot: Iterable[Any], path: Path) -> Iterator[dict[str, Any]]:
+    """``snapshot`` records with ``path``'s pending journal applied, in catalog order."""
+    # final state per journalled id; "moved" rows were deleted and re-added,
+    # which (as in _replay) sends them to the end of the catalog
+    final: dict[str, tuple[dict[str, Any] | None, bool]] = {}
+    for rec in _read_journal(_journal_path(path)):
+        if rec.get("op") == "put":
+            item = rec.get("item") or {}
+            pid = str(item.get("id"))
+            prev = final.get(pid)
+            if prev is not None and prev[0] is None:
+                del final[pid]
+                final[pid] = (item, True)
+            else:
+                final[pid] = (item, prev[1] if prev else False)
+        elif rec.get("op") == "del":
+            pid = str(rec.get("id"))
+            final.pop(pid, None)
+            final[pid] = (None, True)
+    seen = set()
+    for it in snapshot:
+        pid = str(it.get("id")) if isinstance(it, dict) else None
+        if pid in final:
+            item, moved = final[pid]
+            seen.add(pid)
+            if item is not None and not moved:
+                yield item
+            continue
+        if isinstance(it, dict):
+            yield it
+    for pid, (item, moved) in final.items():
+        if item is not None and (moved or pid not in seen):
+            yield item
+
+
+def count_perfumes() -> int:
+    conn = _sqlite()
+    if conn is not None:
+        return storage_sqlite.count(conn)
+    if _cache_fresh():
+        return len(_CACHE["items"])
+    return sum(1 for _ in iter_perfumes())
+
+
+def convert(fmt: str, output: Path | None = None) -> int:
+    """Rewrite the catalog in another on-disk format; returns the record count.
+
+    With no ``output`` db.json is converted in place (folding in any journal),
+    and later full rewrites keep the new format unless FORMAT says otherwise.
+    """
+    count = 0
+
+    def counted() -> Iterator[dict[str, Any]]:
+        nonlocal count
+        for it in iter_perfumes():
+            count += 1
+            yield it
+
+    path = Path(DEFAULT_DB)
+    write_records(Path(output) if output else path, counted(), fmt)
+    if not output:
+        _journal_path(path).unlink(missing_ok=True)
+        _CACHE["items"] = None
+    return count
+
+
+def list_perfumes() -> list[dict[str, Any]]:
     return _load_db()
 
 
-def get_perfume(pid: str) -> Optional[Dict[str, Any]]:
-    for it in _load_db():
-        if it.get("id") == pid or it.get("name") == pid:
-            return it
-    return None
+def get_perfume(pid: str) -> dict[str, Any] | None:
+    conn = _sqlite()
+    if conn is not None:
+        return storage_sqlite.get(conn, pid)
+    if not _cache_fresh():
+        # cold process: decode just the one record from db.rec if it's current
+        reader = _record_reader()
+        hit = reader.get(pid) if reader is not None else None
+        if hit is not None:
+            return hit
+    hits = _find(pid)
+    return dict(_catalog()[hits[0]]) if hits else None
 
 
-def add_perfume(item: Dict[str, Any]) -> Dict[str, Any]:
-    items = _load_db()
+def add_perfume(item: dict[str, Any]) -> dict[str, Any]:
     if not item.get("id"):
         item["id"] = str(uuid.uuid4())
-    items.append(item)
-    _save_db(items)
+    _apply([{"op": "put", "item": dict(item)}])
     return item
 
 
-def update_perfume(pid: str, patch: Dict[str, Any]) -> bool:
-    items = _load_db()
-    ok = False
-    for it in items:
-        if it.get("id") == pid or it.get("name") == pid:
-            it.update(patch)
-            ok = True
-            break
-    if ok:
+def update_perfume(pid: str, patch: dict[str, Any]) -> bool:
+    hits = _find(pid)
+    if not hits:
+        return False
+    it = _catalog()[hits[0]]
+    if it.get("id"):
+        _apply([{"op": "put", "item": {**it, **patch}}])
+    else:
+        items = _load_db()
+        items[hits[0]].update(patch)
         _save_db(items)
-    return ok
+    return True
 
 
 def delete_perfume(pid: str) -> bool:
-    items = _load_db()
-    new_items = [it for it in items if it.get("id") != pid and it.get("name") != pid]
-    changed = len(new_items) != len(items)
-    if changed:
-        _save_db(new_items)
-    return changed
+    conn = _sqlite()
+    if conn is not None:
+        return storage_sqlite.delete_matching(conn, pid) > 0
+    items = _catalog()
+    hits = [items[i] for i in _find(pid)]
+    if not hits:
+        return False
+    if all(it.get("id") for it in hits):
+        _apply([{"op": "del", "id": it["id"]} for it in hits])
+    else:
+        _save_db([it for it in items if it.get("id") != pid and it.get("name") != pid])
+    return True
+
+
+def _normalise(fields: dict[str, Any], partial: bool = False) -> dict[str, Any]:
+    """Validate and clean one record (or, with ``partial``, one patch). Raises ValueError."""
+    out = dict(fields)
+    if not partial or "name" in out:
+        out["name"] = non_empty_str(out.get("name"), "name")
+    if not partial or "brand" in out:
+        out["brand"] = str(out.get("brand") or "").strip()
+    if not partial or "price" in out:
+        out["price"] = positive_float_or_none(out.get("price"), "price")
+        if out["price"] is None:
+            raise ValueError("price must be a number.")
+    for key in ("notes", "allergens"):
+        if key in out or not partial:
+            values = out.get(key) or []
+            if isinstance(values, str):
+                values = values.split(",")
+            if not isinstance(values, list):
+                raise ValueError(f"{key} must be a list or comma-separated string.")
+            out[key] = non_empty_list_str(values)
+    if "rating" in out or not partial:
+        rating = positive_float_or_none(out.get("rating") or 0, "rating")
+        if rating > 5:
+            raise ValueError("rating must be between 0.0 and 5.0.")
+        out["rating"] = rating
+    if "stock" in out or not partial:
+        try:
+            out["stock"] = int(out.get("stock") or 0)
+        except (TypeError, ValueError):
+            raise ValueError("stock must be an integer.")
+        if out["stock"] < 0:
+            raise ValueError("stock must be >= 0.")
+    return out
+
+
+def add_perfumes(items: Iterable[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Validate and add many perfumes with a single write.
+
+    Returns one result per input, in order: {"index", "ok", "id"} or {"index", "ok", "error"}.
+    Invalid items are reported and skipped; the valid ones are still stored.
+    """
+    results: list[dict[str, Any]] = []
+    records: list[dict[str, Any]] = []
+    for n, raw in enumerate(items):
+        try:
+            item = _normalise(raw)
+        except (ValueError, AttributeError) as e:
+            results.append({"index": n, "ok": False, "error": str(e)})
+            continue
+        item["id"] = str(item.get("id") or uuid.uuid4())
+        records.append({"op": "put", "item": item})
+        results.append({"index": n, "ok": True, "id": item["id"]})
+    if records:
+        _apply(records)
+    return results
+
+
+def update_perfumes(changes: dict[str, dict[str, Any]]) -> list[dict[str, Any]]:
+    """Apply ``{id: patch}`` updates with a single write. Returns per-id results."""
+    items = _catalog()
+    index = _index()
+    pending: dict[str, dict[str, Any]] = {}
+    results: list[dict[str, Any]] = []
+    for pid, patch in (changes or {}).items():
+        pid = str(pid)
+        i = index.ids.get(pid)
+        if i is None:
+            results.append({"id": pid, "ok": False, "error": "not found"})
+            continue
+        try:
+            clean = _normalise({k: v for k, v in (patch or {}).items() if k != "id"}, partial=True)
+        except (ValueError, AttributeError) as e:
+            results.append({"id": pid, "ok": False, "error": str(e)})
+            continue
+        pending[pid] = {**pending.get(pid, items[i]), **clean}
+        results.append({"id": pid, "ok": True})
+    if pending:
+        _apply([{"op": "put", "item": item} for item in pending.values()])
+    return results
+
+
+def delete_perfumes(ids: Iterable[str]) -> list[dict[str, Any]]:
+    """Delete many perfumes by exact id with a single write. Returns per-id results."""
+    index = _index()
+    seen: dict[str, None] = {}
+    results: list[dict[str, Any]] = []
+    for pid in ids:
+        pid = str(pid)
+        if pid in seen:
+            results.append({"id": pid, "ok": False, "error": "duplicate"})
+        elif pid not in index.ids:
+            results.append({"id": pid, "ok": False, "error": "not found"})
+        else:
+            results.append({"id": pid, "ok": True})
+        seen.setdefault(pid)
+    records = [{"op": "del", "id": r["id"]} for r in results if r["ok"]]
+    if records:
+        _apply(records)
+    return results
+
+
+def apply_bulk(batch: Any) -> dict[str, list[dict[str, Any]]]:
+    """Run the "add" / "update" / "delete" parts of a bulk payload, one write per part.
+
+    A bare list is treated as {"add": [...]}. Raises ValueError, before
+    writing anything, if the payload does not have that shape, has any other
+    key, or is empty.
+    """
+    if isinstance(batch, list):
+        batch = {"add": batch}
+    if not isinstance(batch, dict):
+        raise ValueError('Bulk payload must be an object {"add", "update", "delete"} or a list')
+    unknown = sorted(map(str, set(batch) - {"add", "update", "delete"}))
+    if unknown:
+        raise ValueError(f"Unknown bulk key(s) {', '.join(unknown)}; use add, update, delete")
+    if not any(batch.values()):
+        raise ValueError("Bulk payload is empty")
+    add, update, delete = (
+        batch.get("add") or [],
+        batch.get("update") or {},
+        batch.get("delete") or [],
+    )
+    if not isinstance(add, list) or not all(isinstance(it, dict) for it in add):
+        raise ValueError('"add" must be a list of perfume objects')
+    if not isinstance(update, dict) or not all(isinstance(p, dict) for p in update.values()):
+        raise ValueError('"update" must map perfume ids to patch objects')
+    if not isinstance(delete, list) or not all(isinstance(pid, str) for pid in delete):
+        raise ValueError('"delete" must be a list of perfume ids')
+    out: dict[str, list[dict[str, Any]]] = {}
+    if batch.get("add"):
+        out["add"] = add_perfumes(batch["add"])
+    if batch.get("update"):
+        out["update"] = update_perfumes(batch["update"])
+    if batch.get("delete"):
+        out["delete"] = delete_perfumes(batch["delete"])
+    return out
+
+
+class Transaction:
+    """Unit of work over one in-memory copy of the catalog; see transaction()."""
+
+    def __init__(self) -> None:
+        self._items = _load_db()
+        self._index = _Index(self._items)
+        self._records: list[dict[str, Any]] = []
+        # deleting id-less legacy rows can't be expressed as a record
+        self._rewrite = False
+
+    def _find(self, ident: str) -> builtins.list[int]:
+        return _find(ident, items=self._items, index=self._index)
+
+    def get(self, ident: str) -> dict[str, Any] | None:
+        hits = self._find(ident)
+        return dict(self._items[hits[0]]) if hits else None
+
+    def list(self) -> builtins.list[dict[str, Any]]:
+        return [dict(it) for it in self._items]
+
+    def add(self, item: dict[str, Any]) -> dict[str, Any]:
+        if not item.get("id"):
+            item["id"] = str(uuid.uuid4())
+        rec = {"op": "put", "item": dict(item)}
+        self._index.put(self._items, rec["item"])
+        self._records.append(rec)
+        return item
+
+    def update(self, ident: str, patch: dict[str, Any]) -> bool:
+        hits = self._find(ident)
+        if not hits:
+            return False
+        item = {**self._items[hits[0]], **patch}
+        if item.get("id"):
+            self._index.put(self._items, item)
+            self._records.append({"op": "put", "item": item})
+        else:
+            self._items[hits[0]] = item
+            self._rewrite = True
+        return True
+
+    def delete(self, ident: str) -> bool:
+        hits = self._find(ident)
+        for i in hits:
+            pid = self._items[i].get("id")
+            if pid:
+                self._records.append({"op": "del", "id": pid})
+            else:
+                self._rewrite = True
+        self._index.remove(self._items, hits)
+        return bool(hits)
+
+    def commit(self) -> None:
+        if self._rewrite:
+            _save_db(self._items)
+        elif self._records:
+            _apply(self._records)
+        self._records, self._rewrite = [], False
+
+
+@contextmanager
+def transaction() -> Iterator[Transaction]:
+    """Batch any mix of get/add/update/delete into one read and one atomic write.
+
+    Nothing is persisted if the block raises.
+    """
+    tx = Transaction()
+    yield tx
+    tx.commit()
+
+
+# Common EU-labelled fragrance allergens, keyed by the notes that usually carry them.
+_NOTE_ALLERGENS = {
+    "lavender": ["linalool", "coumarin"],
+    "bergamot": ["limonene", "linalool"],
+    "orange": ["limonene"],
+    "grapefruit": ["limonene", "citral"],
+    "neroli": ["linalool", "geraniol"],
+    "orange blossom": ["linalool", "farnesol"],
+    "rose": ["geraniol", "citronellol", "eugenol"],
+    "geranium": ["geraniol", "citronellol"],
+    "jasmine": ["benzyl benzoate", "linalool"],
+    "jasmine sambac": ["benzyl benzoate", "linalool"],
+    "tuberose": ["benzyl benzoate", "isoeugenol"],
+    "tonka": ["coumarin"],
+    "vanilla": ["coumarin"],
+    "pepper": ["limonene"],
+    "magnolia": ["linalool"],
+}
+_ADJECTIVES = [
+    "Velvet",
+    "Midnight",
+    "Golden",
+    "Wild",
+    "Secret",
+    "Silk",
+    "Crystal",
+    "Smoked",
+    "Electric",
+    "Quiet",
+    "Solar",
+    "Noir",
+    "Blush",
+    "Absolute",
+    "Ivory",
+    "Sacred",
+]
+_CONCENTRATION_PRICE = {"EDP": 95.0, "EDT": 70.0, "Cologne": 55.0, "Body Spray": 18.0}
+
+
+def _synthetic_perfumes(count: int, seed: int) -> Iterator[dict[str, Any]]:
+    """Deterministically generate ``count`` realistic perfumes, one at a time."""
+    ref = json.loads(CATALOG_JSON.read_text(encoding="utf-8"))
+    brands = sorted({r["brand"] for r in ref})
+    families = sorted({r["family"] for r in ref})
+    concentrations = sorted({r["concentration"] for r in ref})
+    rng = random.Random(seed)
+    notes = sorted({n.strip().lower() for r in ref for n in r["notes"]})
+    # Zipf-distributed note popularity: the k-th most popular note has weight 1/k^1.1
+    rng.shuffle(notes)
+    cum, total = [], 0.0
+    for rank in range(1, len(notes) + 1):
+        total += 1.0 / rank**1.1
+        cum.append(total)
+    brand_tier = {b: rng.uniform(0.6, 1.6) for b in brands}
+
+    for i in range(count):
+        draws = rng.choices(notes, cum_weights=cum, k=rng.randint(2, 5))
+        picked = list(dict.fromkeys(draws))
+        allergens = sorted(
+            {a for n in picked for a in _NOTE_ALLERGENS.get(n, ()) if rng.random() < 0.8}
+        )
+        brand = rng.choice(brands)
+        conc = rng.choice(concentrations)
+        price = _CONCENTRATION_PRICE.get(conc, 60.0) * brand_tier[brand] * rng.uniform(0.8, 1.25)
+        yield {
+            "id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            "name": f"{rng.choice(_ADJECTIVES)} {picked[0].title()} No. {i + 1}",
+            "brand": brand,
+            "family": rng.choice(families),
+            "concentration": conc,
+            "price": round(price, 2),
+            "notes": picked,
+            "allergens": allergens,
+            "rating": round(min(5.0, max(1.0, rng.gauss(4.0, 0.45))), 1),
+            "stock": int(rng.expovariate(1 / 12)),
+        }
+
+
+def seed_n(count: int, seed: int = 0) -> int:
+    """Overwrite the DB with ``count`` synthetic perfumes, streamed straight to disk.
+
+    The same ``seed`` always produces the same catalog, so load tests are reproducible.
+    """
+    items = _synthetic_perfumes(count, seed)
+    conn = _sqlite()
+    if conn is not None:
+        return storage_sqlite.replace_all(conn, items)
+    path = Path(DEFAULT_DB)
+    write_records(path, items, FORMAT or detect_format(path) or "json-pretty")
+    _journal_path(path).unlink(missing_ok=True)
+    _CACHE["items"] = None
+    return count
 
 
 def seed_minimal() -> int:
@@ -112,7 +1094,7 @@ def seed_30() -> int:
         ["cedar", "sage"],
         ["jasmine", "pear"],
     ]
-    items: List[Dict[str, Any]] = []
+    items: list[dict[str, Any]] = []
     for i in range(30):
         name = f"Scent {i+1:02d}"
         brand = brands[i % len(brands)]
@@ -983,6 +1965,9 @@ def seed_30() -> int:
             "stock": 7,
         },
     ]
+    # Journal records and lookups are keyed by id, so seeded rows need one too.
+    for it in items:
+        it.setdefault("id", str(uuid.uuid4()))
     try:
         _save_db(items)  # uses your existing helper
         return len(items)
@@ -1024,29 +2009,17 @@ def _read_all():
 
 
 def _write_all(items):
-    # If you have a dedicated writer, call it; else write JSON directly
-    try:
-        # some projects expose save/commit; if not, the except will handle it
-        _ = save_perfumes  # type: ignore  # noqa: F401
-    except Exception:
-        p = _db_path()
-        p.write_text(json.dumps(items, indent=2), encoding="utf-8")
-        return
-    # Fallback is above; if you DO have a function called save_perfumes, call it here:
-    try:
-        save_perfumes(items)  # type: ignore
-    except Exception:
-        p = _db_path()
-        p.write_text(json.dumps(items, indent=2), encoding="utf-8")
+    # Go through _save_db so the write is atomic and the catalog cache stays in step.
+    _save_db(items)
 
 
 def _match_exact_identifier(identifier: str, item: dict) -> bool:
-    ident = (identifier or "").strip().lower()
+    ident = fold(identifier)
     if not ident:
         return False
-    if (item.get("id") or "").lower() == ident:
+    if fold(item.get("id")) == ident:
         return True
-    if (item.get("name") or "").lower() == ident:
+    if fold(item.get("name")) == ident:
         return True
     return False
 
@@ -1057,15 +2030,12 @@ def update_perfume(identifier: str, **updates) -> dict:
     Only applies fields provided in **updates.
     Returns the updated perfume dict; raises ValueError if not found.
     """
-    items = _read_all()
+    items = _load_db()
     if not items:
         raise ValueError("Database is empty")
 
-    idx = None
-    for i, it in enumerate(items):
-        if _match_exact_identifier(identifier, it):
-            idx = i
-            break
+    hits = _find(identifier, ignore_case=True)
+    idx = hits[0] if hits else None
 
     if idx is None:
         raise ValueError(f"No perfume found with id or exact name: {identifier}")
@@ -1125,7 +2095,10 @@ def update_perfume(identifier: str, **updates) -> dict:
             target[k] = v
 
     items[idx] = target
-    _write_all(items)
+    if target.get("id"):
+        _apply([{"op": "put", "item": target}])
+    else:
+        _save_db(items)
     return target
 
 
@@ -1136,18 +2109,12 @@ def update_perfume(perfume_id: str, changes: dict) -> bool:
         True if updated and saved, False if not found or no changes applied.
     """
     allowed = {"name", "brand", "price", "notes", "allergens", "rating", "stock"}
-    data = read_db()
-    updated = False
-    for item in data:
-        if str(item.get("id")) == str(perfume_id):
-            for k, v in (changes or {}).items():
-                if k in allowed:
-                    item[k] = v
-                    updated = True
-            break
-    if updated:
-        write_db(data)
-    return updated
+    i = _index().ids.get(str(perfume_id))
+    patch = {k: v for k, v in (changes or {}).items() if k in allowed}
+    if i is None or not patch:
+        return False
+    _apply([{"op": "put", "item": {**_catalog()[i], **patch}}])
+    return True
 
 
 def update_perfume(perfume_id: str, changes: dict) -> bool:
@@ -1160,15 +2127,15 @@ def update_perfume(perfume_id: str, changes: dict) -> bool:
         True if updated & saved, False if not found or no valid changes.
     """
     allowed = {"name", "brand", "price", "notes", "allergens", "rating", "stock"}
-    data = read_db()
-    updated = False
-    for item in data:
-        if str(item.get("id")) == str(perfume_id):
-            for k, v in (changes or {}).items():
-                if k in allowed:
-                    item[k] = v
-                    updated = True
-            break
-    if updated:
-        write_db(data)
-    return updated
+    patch = {k: v for k, v in (changes or {}).items() if k in allowed}
+    if not patch:
+        return False
+    conn = _sqlite()
+    if conn is not None:
+        # partial-row UPDATE of just the patched columns
+        return storage_sqlite.update(conn, str(perfume_id), patch)
+    i = _index().ids.get(str(perfume_id))
+    if i is None:
+        return False
+    _apply([{"op": "put", "item": {**_catalog()[i], **patch}}])
+    return True
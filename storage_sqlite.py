@@ -0,0 +1,278 @@
+"""SQLite backend for storage.
+
+Perfumes live in one row each, notes in a join table. Both the lower-cased
+name/brand and the notes are indexed, the database runs in WAL mode so
+gunicorn workers can read while another one writes, and every mutation
+touches only the affected rows. A ``meta.version`` counter is bumped in the
+same transaction as each write so readers can cheaply tell when to reload.
+"""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from typing import Any
+
+# Columns stored natively; anything else on a record goes into the "extra" JSON blob.
+COLUMNS = ("id", "name", "brand", "price", "rating", "stock", "allergens")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS perfumes (
+    seq       INTEGER PRIMARY KEY AUTOINCREMENT,
+    id        TEXT NOT NULL UNIQUE,
+    name      TEXT NOT NULL DEFAULT '',
+    name_key  TEXT NOT NULL DEFAULT '',
+    brand     TEXT NOT NULL DEFAULT '',
+    brand_key TEXT NOT NULL DEFAULT '',
+    price     REAL,
+    rating    REAL,
+    stock     INTEGER,
+    allergens TEXT NOT NULL DEFAULT '[]',
+    extra     TEXT NOT NULL DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS perfumes_name_key ON perfumes(name_key);
+CREATE INDEX IF NOT EXISTS perfumes_brand_key ON perfumes(brand_key);
+CREATE TABLE IF NOT EXISTS perfume_notes (
+    perfume_id TEXT NOT NULL REFERENCES perfumes(id) ON DELETE CASCADE,
+    pos        INTEGER NOT NULL,
+    note       TEXT NOT NULL,
+    note_key   TEXT NOT NULL,
+    PRIMARY KEY (perfume_id, pos)
+);
+CREATE INDEX IF NOT EXISTS perfume_notes_key ON perfume_notes(note_key);
+CREATE TABLE IF NOT EXISTS meta (
+    k TEXT PRIMARY KEY,
+    v INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (k, v) VALUES ('version', 0);
+"""
+
+_local = threading.local()
+
+
+def connect(path: Path) -> sqlite3.Connection:
+    """Return this thread's connection to ``path``, creating the schema once."""
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    key = str(Path(path).resolve())
+    conn = conns.get(key)
+    if conn is None:
+        conn = sqlite3.connect(key, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.executescript(SCHEMA)
+        conns[key] = conn
+    return conn
+
+
+def version(conn: sqlite3.Connection) -> int:
+    return conn.execute("SELECT v FROM meta WHERE k = 'version'").fetchone()[0]
+
+
+def _bump(conn: sqlite3.Connection) -> None:
+    conn.execute("UPDATE meta SET v = v + 1 WHERE k = 'version'")
+
+
+def _row_values(item: dict[str, Any]) -> dict[str, Any]:
+    extra = {k: v for k, v in item.items() if k not in COLUMNS and k != "notes"}
+    return {
+        "id": str(item["id"]),
+        "name": str(item.get("name") or ""),
+        "name_key": str(item.get("name") or "").lower(),
+        "brand": str(item.get("brand") or ""),
+        "brand_key": str(item.get("brand") or "").lower(),
+        "price": item.get("price"),
+        "rating": item.get("rating"),
+        "stock": item.get("stock"),
+        "allergens": json.dumps(item.get("allergens") or [], ensure_ascii=False),
+        "extra": json.dumps(extra, ensure_ascii=False),
+    }
+
+
+def _write_notes(conn: sqlite3.Connection, pid: str, notes: Iterable[Any]) -> None:
+    conn.execute("DELETE FROM perfume_notes WHERE perfume_id = ?", (pid,))
+    conn.executemany(
+        "INSERT INTO perfume_notes (perfume_id, pos, note, note_key) VALUES (?, ?, ?, ?)",
+        [(pid, i, str(n), str(n).lower()) for i, n in enumerate(notes or [])],
+    )
+
+
+def _upsert(conn: sqlite3.Connection, item: dict[str, Any]) -> None:
+    row = _row_values(item)
+    conn.execute(
+        """
+        INSERT INTO perfumes (id, name, name_key, brand, brand_key, price, rating, stock,
+                              allergens, extra)
+        VALUES (:id, :name, :name_key, :brand, :brand_key, :price, :rating, :stock,
+                :allergens, :extra)
+        ON CONFLICT(id) DO UPDATE SET
+            name = excluded.name, name_key = excluded.name_key,
+            brand = excluded.brand, brand_key = excluded.brand_key,
+            price = excluded.price, rating = excluded.rating, stock = excluded.stock,
+            allergens = excluded.allergens, extra = excluded.extra
+        """,
+        row,
+    )
+    _write_notes(conn, row["id"], item.get("notes") or [])
+
+
+def _to_dicts(conn: sqlite3.Connection, rows: list[sqlite3.Row]) -> list[dict[str, Any]]:
+    if not rows:
+        return []
+    ids = [r["id"] for r in rows]
+    notes: dict[str, list[str]] = {pid: [] for pid in ids}
+    # chunk the IN list to stay under SQLite's bound-parameter limit
+    for i in range(0, len(ids), 500):
+        chunk = ids[i : i + 500]
+        marks = ",".join("?" * len(chunk))
+        for n in conn.execute(
+            f"SELECT perfume_id, note FROM perfume_notes WHERE perfume_id IN ({marks}) "
+            "ORDER BY perfume_id, pos",
+            chunk,
+        ):
+            notes[n["perfume_id"]].append(n["note"])
+    out = []
+    for r in rows:
+        item: dict[str, Any] = {
+            "id": r["id"],
+            "name": r["name"],
+            "brand": r["brand"],
+            "price": r["price"],
+            "notes": notes[r["id"]],
+            "allergens": json.loads(r["allergens"]),
+            "rating": r["rating"],
+            "stock": r["stock"],
+        }
+        item.update(json.loads(r["extra"]))
+        out.append(item)
+    return out
+
+
+def load_all(conn: sqlite3.Connection) -> list[dict[str, Any]]:
+    rows = conn.execute("SELECT * FROM perfumes ORDER BY seq").fetchall()
+    return _to_dicts(conn, rows)
+
+
+def iter_all(conn: sqlite3.Connection, batch: int = 500) -> Iterator[dict[str, Any]]:
+    """Stream the catalog in insertion order, ``batch`` rows at a time."""
+    last = 0
+    while True:
+        rows = conn.execute(
+            "SELECT * FROM perfumes WHERE seq > ? ORDER BY seq LIMIT ?", (last, batch)
+        ).fetchall()
+        if not rows:
+            return
+        last = rows[-1]["seq"]
+        yield from _to_dicts(conn, rows)
+
+
+def count(conn: sqlite3.Connection) -> int:
+    return conn.execute("SELECT COUNT(*) FROM perfumes").fetchone()[0]
+
+
+def get(conn: sqlite3.Connection, ident: str) -> dict[str, Any] | None:
+    """Look up by exact id, then by exact name (via the lower-cased name index)."""
+    row = conn.execute("SELECT * FROM perfumes WHERE id = ?", (ident,)).fetchone()
+    if row is None:
+        row = conn.execute(
+            "SELECT * FROM perfumes WHERE name_key = ? AND name = ? ORDER BY seq LIMIT 1",
+            (ident.lower(), ident),
+        ).fetchone()
+    found = _to_dicts(conn, [row] if row else [])
+    return found[0] if found else None
+
+
+def apply(conn: sqlite3.Connection, records: Iterable[dict[str, Any]]) -> None:
+    """Apply storage put/del records in a single transaction."""
+    with _transaction(conn):
+        for rec in records:
+            if rec.get("op") == "put":
+                _upsert(conn, rec["item"])
+            elif rec.get("op") == "del":
+                conn.execute("DELETE FROM perfumes WHERE id = ?", (rec.get("id"),))
+        _bump(conn)
+
+
+def update(conn: sqlite3.Connection, pid: str, patch: dict[str, Any]) -> bool:
+    """Partial-row update: only the columns named in ``patch`` are written."""
+    with _transaction(conn):
+        row = conn.execute("SELECT extra FROM perfumes WHERE id = ?", (pid,)).fetchone()
+        if row is None:
+            return False
+        sets: dict[str, Any] = {}
+        extra = None
+        for k, v in patch.items():
+            if k in ("name", "brand"):
+                sets[k] = str(v or "")
+                sets[f"{k}_key"] = str(v or "").lower()
+            elif k == "allergens":
+                sets[k] = json.dumps(v or [], ensure_ascii=False)
+            elif k in COLUMNS and k != "id":
+                sets[k] = v
+            elif k == "notes":
+                _write_notes(conn, pid, v or [])
+            elif k != "id":
+                extra = extra if extra is not None else json.loads(row["extra"])
+                extra[k] = v
+        if extra is not None:
+            sets["extra"] = json.dumps(extra, ensure_ascii=False)
+        if sets:
+            cols = ", ".join(f"{k} = :{k}" for k in sets)
+            conn.execute(f"UPDATE perfumes SET {cols} WHERE id = :_pid", {**sets, "_pid": pid})
+        _bump(conn)
+    return True
+
+
+def delete_matching(conn: sqlite3.Connection, ident: str) -> int:
+    """Delete rows whose id or exact name equals ``ident``."""
+    with _transaction(conn):
+        cur = conn.execute(
+            "DELETE FROM perfumes WHERE id = ? OR (name_key = ? AND name = ?)",
+            (ident, ident.lower(), ident),
+        )
+        if cur.rowcount:
+            _bump(conn)
+    return cur.rowcount
+
+
+def replace_all(conn: sqlite3.Connection, items: Iterable[dict[str, Any]]) -> int:
+    """Replace the whole catalog in one transaction (seeding and migration)."""
+    n = 0
+    with _transaction(conn):
+        conn.execute("DELETE FROM perfume_notes")
+        conn.execute("DELETE FROM perfumes")
+        for item in items:
+            _upsert(conn, item)
+            n += 1
+        _bump(conn)
+    return n
+
+
+def vacuum(conn: sqlite3.Connection) -> int:
+    """Fold the WAL into the main file and reclaim free pages; returns the row count.
+
+    The data itself is untouched, so the catalog version is not bumped.
+    """
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("VACUUM")
+    return count(conn)
+
+
+class _transaction:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK on an autocommit connection."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
@@ -3,6 +3,8 @@ import importlib.util
 import pathlib
 import sys
 
+import pytest
+
 ROOT = pathlib.Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
@@ -19,3 +21,24 @@ sys.modules["cli_app"] = cli_app
 
 # Tiny debug line (you can delete later)
 print(f"DEBUG conftest: cli_app loaded from {getattr(cli_app, '__file__', 'unknown')}")
+
+
+@pytest.fixture
+def seeded(tmp_path, monkeypatch):
+    """Point storage at a fresh db in tmp_path and fill it, returning the records.
+
+    ``seeded()`` loads the 30 sample perfumes, ``seeded(n, seed=...)`` n generated
+    ones; ``journal`` switches storage.JOURNAL for the test when given.
+    """
+
+    def seed(n=None, seed=0, journal=None):
+        monkeypatch.setattr(storage, "DEFAULT_DB", tmp_path / "db.json")
+        if journal is not None:
+            monkeypatch.setattr(storage, "JOURNAL", journal)
+        if n is None:
+            storage.seed_30()
+        else:
+            storage.seed_n(n, seed=seed)
+        return storage.list_perfumes()
+
+    return seed
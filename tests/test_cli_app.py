@@ -0,0 +1,104 @@
+from click.testing import CliRunner
+
+import cli_app
+import storage
+
+runner = CliRunner()
+
+
+def test_find_structured_terms_as_separate_args(seeded):
+    seeded()
+    storage.add_perfume(
+        {"name": "Citral Rose", "brand": "X", "notes": ["rose"], "allergens": ["citral"]}
+    )
+
+    res = runner.invoke(cli_app.app, ["find", "notes:rose", "-allergen:citral", "--explain"])
+    assert res.exit_code == 0, res.output
+    assert "Plan for:" in res.output and "Rose Dusk" in res.output
+    assert "Citral Rose" not in res.output
+
+
+def test_find_exclusions_may_contain_quotes(seeded):
+    seeded()
+    storage.add_perfume(
+        {"name": "Quoted Rose", "brand": "X", "notes": ["rose"], "allergens": ['oak "moss"']}
+    )
+
+    argv = ["find", "notes:rose", "OR", "brand:X", "--exclude-allergen", 'oak "moss"']
+    res = runner.invoke(cli_app.app, argv)
+    assert res.exit_code == 0 and "Rose Dusk" in res.output
+    assert "Quoted Rose" not in res.output
+    assert "Quoted Rose" in runner.invoke(cli_app.app, argv[:4]).output
+
+
+def test_find_falls_back_for_plain_words(seeded):
+    seeded()
+
+    for argv in (["find", "rose)"], ["find", '"rose'], ["find", "rose", "OR"]):
+        res = runner.invoke(cli_app.app, argv)
+        assert res.exit_code == 0, (argv, res.output)
+    assert "Rose Dusk" in runner.invoke(cli_app.app, ["find", "(rose"]).output
+
+    res = runner.invoke(cli_app.app, ["find", "colour:red"])
+    assert res.exit_code == 1 and "Invalid query" in res.output
+
+
+def test_similar_cmd(seeded):
+    seeded()
+
+    res = runner.invoke(cli_app.app, ["similar", "rose dusk", "-k", "3"])
+    assert res.exit_code == 0 and len(res.output.splitlines()) == 3
+    assert "Rose Dusk" not in res.output
+    assert runner.invoke(cli_app.app, ["similar", "no such perfume"]).output.strip() == "Not found"
+
+
+def test_recommend_cmd(tmp_path, seeded):
+    seeded()
+    by_flag = runner.invoke(cli_app.app, ["recommend", "--notes", "rose", "-k", "3"])
+    assert by_flag.exit_code == 0 and "Rose Dusk" in by_flag.output
+
+    profile = tmp_path / "profile.json"
+    profile.write_text('{"preferred_notes": "rose"}', encoding="utf-8")
+    by_file = runner.invoke(cli_app.app, ["recommend", "--profile", str(profile), "-k", "3"])
+    assert by_file.output == by_flag.output
+
+    for body, message in (
+        ("[1]", "expected a JSON object"),
+        ("{", "Invalid JSON"),
+        ('{"avoid_allergens": [1]}', "list of strings"),
+    ):
+        profile.write_text(body, encoding="utf-8")
+        res = runner.invoke(cli_app.app, ["recommend", "--profile", str(profile)])
+        assert res.exit_code == 1 and message in res.output, (body, res.output)
+    res = runner.invoke(cli_app.app, ["recommend", "--user", "nope"])
+    assert res.exit_code == 1 and "Profile not found" in res.output
+
+
+def test_cache_stats_cmd():
+    res = runner.invoke(cli_app.app, ["cache-stats"])
+    assert res.exit_code == 0
+    assert {line.split(":")[0] for line in res.output.splitlines()} >= {"size", "hits", "misses"}
+
+
+def test_list_parses_the_db_once(monkeypatch, seeded):
+    seeded()
+    storage._CACHE["items"] = None  # a fresh CLI process starts cold
+    reads = []
+    real = storage.read_json
+    monkeypatch.setattr(storage, "read_json", lambda path: reads.append(path) or real(path))
+    monkeypatch.setattr(storage, "iter_records", lambda *a, **kw: reads.append(a) or iter(()))
+
+    res = runner.invoke(cli_app.app, ["list"])
+    assert res.output.startswith("Perfumes (30)\n") and res.output.count("\n") == 31
+    assert len(reads) == 1
+
+
+def test_recommend_batch_rejects_non_object_profiles(tmp_path, seeded):
+    seeded()
+    profiles = tmp_path / "profiles.json"
+    out = tmp_path / "out.ndjson"
+
+    for body in ("[1, 2]", '[{"preferred_notes": ["rose"]}, "rose"]', '{"id": "a"}\n[]\n'):
+        profiles.write_text(body, encoding="utf-8")
+        res = runner.invoke(cli_app.app, ["recommend-batch", str(profiles), "--output", str(out)])
+        assert res.exit_code == 1 and "Profile must be an object" in res.output, (body, res)
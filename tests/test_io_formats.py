@@ -0,0 +1,67 @@
+import json
+from pathlib import Path
+
+import pytest
+
+import io_utils
+import storage
+
+ITEMS = [{"id": "a", "name": "Lancôme", "notes": ["iris"]}, {"id": "b", "name": "B", "price": 1.5}]
+
+
+@pytest.mark.parametrize("fmt", ["json-pretty", "json", "ndjson", "json.gz", "ndjson.gz"])
+def test_write_then_detect_and_read(tmp_path, fmt):
+    path = tmp_path / "db.json"
+    io_utils.write_records(path, iter(ITEMS), fmt)
+
+    assert io_utils.detect_format(path) == fmt
+    assert io_utils.read_json(path) == ITEMS
+    assert list(io_utils.iter_records(path, chunk_size=5)) == ITEMS
+
+
+@pytest.mark.parametrize("batch", [1, 2, 4096])
+def test_pretty_matches_json_dump(tmp_path, monkeypatch, batch):
+    monkeypatch.setattr(io_utils, "WRITE_BATCH", batch)
+    items = ITEMS * 3
+    path = tmp_path / "db.json"
+    io_utils.write_records(path, iter(items), "json-pretty")
+    assert path.read_text(encoding="utf-8") == json.dumps(items, ensure_ascii=False, indent=2)
+    io_utils.write_records(path, iter(items), "json")
+    compact = json.dumps(items, ensure_ascii=False, separators=(",", ":"))
+    assert path.read_text(encoding="utf-8") == compact
+
+
+def test_format_for_path():
+    assert io_utils.format_for_path(Path("x.ndjson.gz")) == "ndjson.gz"
+    assert io_utils.format_for_path(Path("x.json")) == "json-pretty"
+    with pytest.raises(ValueError):
+        io_utils.parse_format("xml")
+
+
+def test_convert_in_place_keeps_format(tmp_path, monkeypatch):
+    db = tmp_path / "db.json"
+    monkeypatch.setattr(storage, "DEFAULT_DB", db)
+    storage.seed_30()
+
+    assert storage.convert("ndjson.gz") == 30
+    assert io_utils.detect_format(db) == "ndjson.gz"
+    assert len(storage.list_perfumes()) == 30
+
+    storage.add_perfume({"name": "After", "brand": "X", "price": 2.0})
+    assert io_utils.detect_format(db) == "ndjson.gz"
+    assert storage.list_perfumes()[-1]["name"] == "After"
+
+
+def test_emptied_store_stays_pretty(tmp_path, monkeypatch):
+    db = tmp_path / "db.json"
+    monkeypatch.setattr(storage, "DEFAULT_DB", db)
+    monkeypatch.setattr(storage, "FORMAT", None)
+    storage.seed_30()
+    storage.delete_perfumes([p["id"] for p in storage.list_perfumes()])
+    assert json.loads(db.read_text(encoding="utf-8")) == []
+    assert io_utils.detect_format(db) is None
+
+    storage.add_perfume({"name": "Back Again", "brand": "B", "price": 1.0})
+    assert io_utils.detect_format(db) == "json-pretty"
+    io_utils.write_records(db, iter([]), "json.gz")
+    assert io_utils.detect_format(db) == "json-pretty.gz"
@@ -0,0 +1,68 @@
+import json
+
+import profiles
+import storage
+from models import UserProfile
+
+
+def _store(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DEFAULT_DB", tmp_path / "db.json")
+    monkeypatch.setattr(profiles, "PROFILES_DB", None)
+    return tmp_path / "profiles.json"
+
+
+def test_profiles_persist_next_to_db(tmp_path, monkeypatch):
+    path = _store(tmp_path, monkeypatch)
+    p = profiles.add_profile("Ana", ["Rose", "oud"], ["Linalool"])
+
+    on_disk = json.loads(path.read_text(encoding="utf-8"))
+    assert on_disk == [
+        {
+            "id": p.id,
+            "name": "Ana",
+            "preferred_notes": ["rose", "oud"],
+            "avoid_allergens": ["linalool"],
+        }
+    ]
+    profiles._CACHE["profiles"] = None  # cold read
+    assert profiles.get_profile(p.id) == p
+    assert profiles.list_profiles() == [p]
+
+
+def test_to_notify_uses_notes_and_allergens(tmp_path, monkeypatch):
+    _store(tmp_path, monkeypatch)
+    rose = profiles.add_profile("Ana", ["rose"], [])
+    oud = profiles.add_profile("Ben", ["Oud"], ["citral"])
+    profiles.add_profile("Cat", ["vanilla"], [])
+
+    perfume = {"notes": ["Rose", "oud"], "allergens": ["Citral"]}
+    assert profiles.to_notify(perfume) == [rose]
+    assert profiles.to_notify({"notes": ["oud"], "allergens": []}) == [oud]
+    assert profiles.profiles_for_notes(["ROSE", "oud"]) == [rose, oud]
+    assert profiles.profiles_avoiding(["citral"]) == [oud]
+
+
+def test_indexes_follow_updates_and_deletes(tmp_path, monkeypatch):
+    _store(tmp_path, monkeypatch)
+    p = profiles.add_profile("Ana", ["rose"], [])
+    profiles.save_profile(UserProfile(p.id, "Ana", ["oud"], ["citral"]))
+
+    assert profiles.profiles_for_notes(["rose"]) == []
+    assert [q.id for q in profiles.profiles_for_notes(["oud"])] == [p.id]
+    assert profiles._index().notes == {"oud": {p.id}}
+
+    assert profiles.delete_profile(p.id)
+    assert not profiles.delete_profile(p.id)
+    assert profiles.profiles_avoiding(["citral"]) == []
+    assert profiles._index().notes == {} and profiles._index().allergens == {}
+
+
+def test_external_write_is_picked_up(tmp_path, monkeypatch):
+    path = _store(tmp_path, monkeypatch)
+    profiles.add_profile("Ana", ["rose"], [])
+    path.write_text(
+        json.dumps([{"id": "x1", "name": "Zed", "preferred_notes": ["amber"]}]), encoding="utf-8"
+    )
+
+    assert [p.id for p in profiles.profiles_for_notes(["amber"])] == ["x1"]
+    assert profiles.profiles_for_notes(["rose"]) == []
@@ -0,0 +1,94 @@
+import pytest
+
+import query
+import search
+import storage
+
+
+def test_parse_tree():
+    node = query.parse('notes:rose brand:"Tom Ford" price<120 -allergen:citral')
+    assert isinstance(node, query.And)
+    assert [str(c) for c in node.children] == [
+        'note:"rose"',
+        'brand:"Tom Ford"',
+        "price<120",
+        '-allergen:"citral"',
+    ]
+    assert isinstance(query.parse("(a OR b) c"), query.And)
+    assert not query.is_structured(query.parse("rose musk"))
+    for bad in ("colour:red", "price<cheap", "(rose", "rose)", "OR rose", "brand>3"):
+        with pytest.raises(ValueError):
+            query.parse(bad)
+
+
+def test_plan_matches_brute_force(seeded):
+    items = seeded(600, seed=11)
+    brand = items[0]["brand"]
+    text = f'brand:"{brand}" price<120 rating>=4 -allergen:linalool'
+
+    hits, steps = query.run(text)
+    expected = [
+        p
+        for p in items
+        if p["brand"] == brand
+        and p["price"] < 120
+        and p["rating"] >= 4
+        and "linalool" not in p["allergens"]
+    ]
+    assert [p["id"] for p in hits] == [p["id"] for p in expected]
+    # the most selective positive predicate drives the plan
+    assert steps[0][:2] == ("index", f'brand:"{brand}"')
+    assert steps[-1][3] == len(hits)
+
+
+def test_or_and_text_predicates(seeded):
+    items = seeded(600, seed=11)
+    fams = sorted({p["family"] for p in items})[:2]
+
+    hits, _ = query.run(f'(family:"{fams[0]}" OR family:"{fams[1]}") amber stock>=10')
+    expected = [
+        p
+        for p in items
+        if p["family"] in fams
+        and p["stock"] >= 10
+        and any("amber" in t for t in search.record_tokens(p))
+    ]
+    assert [p["id"] for p in hits] == [p["id"] for p in expected]
+
+
+def test_plan_looks_each_predicate_up_once(monkeypatch, seeded):
+    seeded(600, seed=11)
+    calls = []
+    lookup = query.Range._lookup
+    monkeypatch.setattr(query.Range, "_lookup", lambda self: calls.append(self) or lookup(self))
+    monkeypatch.setattr(query, "VERIFY_LIMIT", 0)  # build every bitmap
+
+    node = query.parse("price<500 rating>=1 stock>=0")
+    hits, steps = query.plan(node, query._Ctx())
+    assert len(calls) == 3 and [s[0] for s in steps] == ["index"] * 3
+    assert len(hits) == steps[-1][3]
+
+
+@pytest.mark.parametrize("text", ["eau-de", "rose", '"se du"', 'name:"de r"', "de", 'name:""'])
+def test_text_verify_agrees_with_index(seeded, text):
+    seeded()
+    storage.add_perfume({"name": "Eau de Rose", "brand": "Floral", "notes": ["rose"]})
+    storage.add_perfume({"name": "Eau-de-Vie", "brand": "Floral", "notes": ["pear"]})
+    node, ctx = query.parse(text), query._Ctx()
+
+    indexed = sorted(node._positions(ctx))
+    verified = [i for i, item in enumerate(ctx.items) if node.matches(item)]
+    assert indexed == verified
+    if text == "eau-de":  # several tokens: a substring match, so not "Eau de Rose"
+        assert [ctx.items[i]["name"] for i in verified] == ["Eau-de-Vie"]
+
+
+def test_node_subclass_must_implement_predicates():
+    class Partial(query.Node):
+        def bitmap(self, ctx):
+            return 0
+
+    with pytest.raises(TypeError, match="matches"):
+        Partial()
+    with pytest.raises(TypeError):
+        query.Node()
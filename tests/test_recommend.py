@@ -0,0 +1,73 @@
+import pytest
+
+import recommend
+from models import UserProfile
+
+
+def _expected(items, notes, avoid, k):
+    scored = []
+    for i, p in enumerate(items):
+        if set(p["allergens"]) & set(avoid):
+            continue
+        overlap = len(set(p["notes"]) & set(notes))
+        if overlap:
+            score = recommend.NOTE_WEIGHT * overlap / len(notes)
+            score += recommend.RATING_WEIGHT * p["rating"] / 5
+            scored.append((-round(score, 3), i, p["id"]))
+    return [pid for _, _, pid in sorted(scored)[:k]]
+
+
+def test_recommend_matches_brute_force(seeded):
+    items = seeded(400, seed=9)
+    profile = UserProfile.new("Sam", ["Rose", "amber", "vanilla"], ["Linalool"])
+
+    hits = recommend.recommend(profile, k=12)
+    assert [p["id"] for p in hits] == _expected(
+        items, ["rose", "amber", "vanilla"], ["linalool"], 12
+    )
+    assert all("linalool" not in p["allergens"] and p["matched_notes"] for p in hits)
+
+
+def test_profile_without_notes_ranks_by_rating(seeded):
+    items = seeded(400, seed=9)
+
+    hits = recommend.recommend({"avoid_allergens": ["citral"]}, k=5)
+    assert [p["rating"] for p in hits] == sorted(
+        (p["rating"] for p in items if "citral" not in p["allergens"]), reverse=True
+    )[:5]
+    assert recommend.recommend({"preferred_notes": ["no such note"]}) == []
+
+
+def test_batch_agrees_with_single_profiles(seeded):
+    items = seeded(400, seed=9)
+    notes = sorted({n for p in items for n in p["notes"]})
+    profiles = [
+        {"id": "a", "preferred_notes": notes[:3], "avoid_allergens": ["linalool"]},
+        {"id": "b", "preferred_notes": [], "avoid_allergens": ["citral", "eugenol"]},
+        {"id": "c", "preferred_notes": ["unknown note", notes[5]]},
+        UserProfile.new("Dee", notes[7:9], []),
+    ]
+
+    # a tiny budget forces one profile per chunk
+    out = list(recommend.batch(iter(profiles), k=6, memory_mb=1))
+    assert [pid for pid, _ in out] == ["a", "b", "c", profiles[3].id]
+    for profile, (_, hits) in zip(profiles, out):
+        single = recommend.recommend(profile, k=6)
+        assert [(h["id"], h["score"]) for h in hits] == [(h["id"], h["score"]) for h in single]
+    # workers receive the postings once, through the pool initializer
+    assert list(recommend.batch(iter(profiles), k=6, memory_mb=1, workers=2)) == out
+
+
+def test_profile_fields_are_checked(seeded):
+    seeded(400, seed=9)
+
+    one = recommend.recommend({"preferred_notes": "rose"}, k=5)
+    assert [p["id"] for p in one] == [
+        p["id"] for p in recommend.recommend({"preferred_notes": ["rose"]}, k=5)
+    ]
+    for bad in ({"preferred_notes": 3}, {"avoid_allergens": ["ok", 1]}, {"preferred_notes": {}}):
+        with pytest.raises(ValueError, match="list of strings"):
+            recommend.recommend(bad, k=5)
+    for bad in (1, ["rose"], None):
+        with pytest.raises(ValueError, match="must be an object"):
+            list(recommend.batch([{"id": "a"}, bad], k=5))
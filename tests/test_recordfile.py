@@ -0,0 +1,40 @@
+import recordfile
+import storage
+
+
+def test_record_file_point_lookup(tmp_path):
+    path = tmp_path / "db.rec"
+    items = [{"id": f"id-{i}", "name": f"Scent {i}", "notes": ["rose"]} for i in range(500)]
+    assert recordfile.write(path, iter(items), (1, 2, 3)) == 500
+
+    reader = recordfile.RecordReader(path)
+    try:
+        assert reader.source_sig == (1, 2, 3)
+        assert reader.get("id-123") == items[123]
+        assert reader.get("missing") is None
+    finally:
+        reader.close()
+
+
+def test_get_perfume_uses_fresh_record_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DEFAULT_DB", tmp_path / "db.json")
+    storage.seed_30()
+    target = storage.list_perfumes()[7]
+    assert storage.export_records() == 30
+
+    # a cold process must not parse db.json for an id lookup
+    storage._CACHE["items"] = None
+    monkeypatch.setattr(storage, "_read_db_file", lambda p: 1 / 0)
+    assert storage.get_perfume(target["id"]) == target
+
+
+def test_stale_record_file_is_ignored(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DEFAULT_DB", tmp_path / "db.json")
+    storage.seed_30()
+    target = storage.list_perfumes()[7]
+    storage.export_records()
+    storage.update_perfume(target["id"], {"stock": 77})
+
+    storage._CACHE["items"] = None
+    assert storage._record_reader() is None
+    assert storage.get_perfume(target["id"])["stock"] == 77
@@ -0,0 +1,40 @@
+import resultcache
+import search
+import storage
+
+
+def test_lru_ttl_and_counters():
+    now = [0.0]
+    cache = resultcache.LRUCache(maxsize=2, ttl=10, clock=lambda: now[0])
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == (True, 1)
+    cache.put("c", 3)  # evicts "b", the least recently used
+    assert cache.get("b") == (False, None)
+    now[0] = 11
+    assert cache.get("a") == (False, None)
+    assert cache.stats() == {
+        "size": 1,
+        "maxsize": 2,
+        "ttl": 10,
+        "hits": 1,
+        "misses": 2,
+        "evictions": 1,
+        "expirations": 1,
+    }
+
+
+def test_results_follow_catalog_version(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DEFAULT_DB", tmp_path / "db.json")
+    monkeypatch.setattr(resultcache, "RESULTS", resultcache.LRUCache(maxsize=16))
+    storage.seed_30()
+
+    first = search.find("rose")
+    first[0]["name"] = "mutated by caller"
+    again = search.find("ROSE")
+    assert resultcache.stats()["hits"] == 1
+    assert again[0]["name"] != "mutated by caller"
+
+    added = storage.add_perfume({"name": "Rose Late", "brand": "X", "price": 1.0})
+    assert added["id"] in {p["id"] for p in search.find("rose")}
+    assert resultcache.stats()["misses"] == 2
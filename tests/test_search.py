@@ -0,0 +1,81 @@
+import search
+import storage
+
+
+def test_intersect_and_union():
+    assert search.intersect([1, 3, 5, 9], [0, 3, 4, 9, 12]) == [3, 9]
+    assert search.union([[1, 4], [2, 4, 8], []]) == [1, 2, 4, 8]
+
+
+def test_find_and_or(seeded):
+    seeded()
+
+    assert {p["name"] for p in search.find("rose")} == {"Rose Dusk", "Oud Mirage"}
+    assert [p["name"] for p in search.find("rose saffron")] == ["Oud Mirage"]
+    assert len(search.find("rose jasmine", mode="or")) == 4
+    # substring of a token still matches, as the old find did
+    assert {p["name"] for p in search.find("ROS")} == {"Rose Dusk", "Oud Mirage"}
+    assert search.find("") == []
+
+
+def test_index_follows_mutations(seeded):
+    seeded()
+    assert search.find("tuberose") == []
+
+    added = storage.add_perfume({"name": "Night Bloom", "brand": "X", "notes": ["tuberose"]})
+    assert [p["id"] for p in search.find("tuberose")] == [added["id"]]
+    storage.delete_perfume(added["id"])
+    assert search.find("tuberose") == []
+
+
+def test_trigram_substring(seeded):
+    seeded()
+
+    assert [p["name"] for p in search.find("se du")] == ["Rose Dusk"]
+    assert [p["name"] for p in search.name_contains("AL SHA")] == ["Sandal Shadow"]
+    assert {p["name"] for p in search.name_contains("oud")} == {"Oud Mirage"}
+    # queries shorter than a trigram still work
+    assert {p["name"] for p in search.name_contains("us")} == {
+        "Rose Dusk",
+        "Citrus Aurora",
+        "Musk Noon",
+    }
+    assert search.name_contains("zzz") == []
+
+
+def test_fuzzy_tolerates_typos(seeded):
+    seeded()
+
+    hits = search.fuzzy("sandle shadw", limit=3)
+    assert hits[0][0]["name"] == "Sandal Shadow"
+    assert len(hits) <= 3
+    assert [s for _, s in hits] == sorted((s for _, s in hits), reverse=True)
+    assert search.fuzzy("qqqqxxzz", score_cutoff=90) == []
+    assert search.fuzzy("") == []
+
+
+def test_fuzzy_whole_key_and_ties(seeded):
+    seeded()
+
+    # no query word is near a catalog word; the whole-key trigram pass finds it
+    assert search.fuzzy("sandalshadw", limit=1)[0][0]["name"] == "Sandal Shadow"
+    first = storage.add_perfume({"name": "Twin Peak", "brand": "Same"})
+    storage.add_perfume({"name": "Twin Peak", "brand": "Same"})
+    # equal scores: the earlier record takes the only place
+    assert [p["id"] for p, _ in search.fuzzy("twin peek same", limit=1)] == [first["id"]]
+
+
+def test_suggest_word_prefixes_ranked(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DEFAULT_DB", tmp_path / "db.json")
+    storage.seed_n(300, seed=2)
+
+    top = search.suggest("am", 5)
+    assert top and all(any(w.startswith("am") for w in s["text"].lower().split()) for s in top)
+    assert [s["score"] for s in top] == sorted((s["score"] for s in top), reverse=True)
+    # word starts inside a name complete too, and the long path agrees
+    names = [s["text"] for s in search.suggest("velvet am", 50) if s["kind"] == "name"]
+    assert names and all(n.startswith("Velvet Am") for n in names)
+    assert search.suggest("zzq") == []
+    assert search.suggest("amber", 3) == search.SuggestIndex(storage.list_perfumes()).complete(
+        "amber", 3
+    )
@@ -0,0 +1,37 @@
+import pytest
+
+import search
+
+
+def test_bitmap_positions_roundtrip():
+    mask = search._bitmap([0, 3, 9, 64], 70)
+    assert mask == (1 << 0) | (1 << 3) | (1 << 9) | (1 << 64)
+    assert search.positions(mask, 70).tolist() == [0, 3, 9, 64]
+
+
+def test_filters_combine_like_a_scan(seeded):
+    items = seeded(300, seed=3)
+    pick = next(p for p in items if p["notes"] and "linalool" not in p["allergens"])
+    brands, note = [pick["brand"], "Chanel"], pick["notes"][0]
+
+    total, hits, counts = search.browse(
+        {"brand": [b.upper() for b in brands], "note": [note]},
+        {"allergen": ["linalool"]},
+        facets=True,
+    )
+    expected = [
+        p
+        for p in items
+        if p["brand"] in brands and note in p["notes"] and "linalool" not in p["allergens"]
+    ]
+    assert hits and [p["id"] for p in hits] == [p["id"] for p in expected]
+    assert total == len(expected)
+    # brand counts ignore the brand filter itself but honour the others
+    assert counts["brand"][pick["brand"]] == sum(p["brand"] == pick["brand"] for p in expected)
+    assert sum(counts["concentration"].values()) == len(hits)
+
+
+def test_unknown_facet(seeded):
+    seeded(300, seed=3)
+    with pytest.raises(ValueError, match="colour"):
+        search.browse({"colour": ["red"]})
@@ -0,0 +1,70 @@
+import random
+
+import pytest
+
+import search
+import storage
+
+QUERIES = ["rose", "ros", "o", "amber wood", "vanilla", "noir", "zz"]
+
+
+def _fresh(name):
+    items = storage._catalog()
+    if name == "facets":
+        return search.FacetIndex(items, search._prebuilt_facets())
+    if name == "tokens":
+        return search.TokenIndex(items)
+    return search.TrigramIndex(items, names_only=name == "name_trigrams")
+
+
+def _same(name, live, fresh):
+    if name == "facets":
+
+        def strip(maps):
+            return {f: {k: v for k, v in m.items() if v} for f, m in maps.items()}
+
+        assert strip(live.bitmaps) == strip(fresh.bitmaps)
+        assert live.all == fresh.all
+    elif name == "tokens":
+        for q in QUERIES:
+            assert live.query(q) == fresh.query(q), q
+            assert live.query(q, "or") == fresh.query(q, "or"), q
+    else:
+        for q in QUERIES:
+            assert live.search(q) == fresh.search(q), q
+
+
+@pytest.mark.parametrize("journal", [True, False])
+def test_indexes_follow_writes_without_rebuild(tmp_path, monkeypatch, journal):
+    monkeypatch.setattr(storage, "DEFAULT_DB", tmp_path / "db.json")
+    monkeypatch.setattr(storage, "JOURNAL", journal)
+    monkeypatch.setattr(storage, "JOURNAL_MAX_RECORDS", 10_000)
+    storage.seed_n(120, seed=2)
+    warm = {name: search._index(name) for name in search.INCREMENTAL}
+    rng = random.Random(5)
+
+    for step in range(25):
+        items = storage.list_perfumes()
+        roll = rng.random()
+        if roll < 0.3:
+            storage.add_perfume(
+                {
+                    "name": f"Rose Noir {step}",
+                    "brand": "Zz",
+                    "price": 5.0,
+                    "notes": ["rose"],
+                    "allergens": ["citral"],
+                    "family": "Amber",
+                }
+            )
+        elif roll < 0.6:
+            victim = rng.choice(items)
+            storage.update_perfume(victim["id"], {"name": f"Vanilla {step}", "notes": ["wood"]})
+        elif roll < 0.9:
+            storage.delete_perfume(rng.choice(items)["id"])
+        else:
+            storage.delete_perfumes([p["id"] for p in rng.sample(items, 5)])
+
+        for name, index in warm.items():
+            assert search._index(name) is index  # caught up, not rebuilt
+            _same(name, index, _fresh(name))
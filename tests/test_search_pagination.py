@@ -0,0 +1,44 @@
+import pytest
+
+import search
+import storage
+
+
+def _walk(limit, **filters):
+    seen, cursor = [], None
+    while True:
+        total, items, cursor = search.page(limit, cursor, **filters)
+        seen.extend(items)
+        if cursor is None:
+            return total, seen
+
+
+def test_pages_cover_catalog_once_in_id_order(seeded):
+    seeded(120, seed=7)
+
+    total, seen = _walk(25)
+    ids = [p["id"] for p in seen]
+    assert total == 120
+    assert ids == sorted(p["id"] for p in storage.list_perfumes())
+
+
+def test_cursor_stable_under_inserts(seeded):
+    seeded(120, seed=7)
+    _, first, cursor = search.page(30)
+
+    storage.add_perfumes([{"name": f"Late {i}", "brand": "X", "price": 1.0} for i in range(10)])
+    _, second, _ = search.page(30, cursor)
+    # nothing from the first page comes back and the next page starts after it
+    assert not {p["id"] for p in first} & {p["id"] for p in second}
+    assert second[0]["id"] > first[-1]["id"]
+
+
+def test_filtered_pages_and_bad_cursor(seeded):
+    seeded(120, seed=7)
+    cheap = sorted(p["id"] for p in storage.list_perfumes() if p["price"] <= 90)
+
+    total, seen = _walk(7, ranges={"price": (None, 90)})
+    assert total == len(cheap)
+    assert [p["id"] for p in seen] == cheap
+    with pytest.raises(ValueError):
+        search.page(10, "%%%")
@@ -0,0 +1,35 @@
+import search
+
+
+def test_price_range_sorted_by_rating(seeded):
+    items = seeded(400, seed=5)
+
+    total, hits, _ = search.browse(ranges={"price": (40, 80)}, sort="rating", limit=20)
+    in_range = [p for p in items if 40 <= p["price"] <= 80]
+    expected = sorted(in_range, key=lambda p: -p["rating"])
+    assert total == len(in_range)
+    assert [p["rating"] for p in hits] == [p["rating"] for p in expected[:20]]
+    assert all(40 <= p["price"] <= 80 for p in hits)
+
+
+def test_unfiltered_top_k_and_direction(seeded):
+    items = seeded(400, seed=5)
+
+    total, cheapest, _ = search.browse(sort="price", limit=5)
+    assert total == len(items)
+    assert [p["price"] for p in cheapest] == sorted(p["price"] for p in items)[:5]
+    _, dearest, _ = search.browse(sort="price", descending=True, limit=3)
+    assert [p["price"] for p in dearest] == sorted((p["price"] for p in items), reverse=True)[:3]
+
+
+def test_range_combines_with_facets(seeded):
+    items = seeded(400, seed=5)
+    brand = items[0]["brand"]
+
+    total, hits, counts = search.browse(
+        {"brand": [brand]}, ranges={"price": (None, 100)}, sort="stock", facets=True
+    )
+    expected = [p for p in items if p["brand"] == brand and p["price"] <= 100]
+    assert total == len(hits) == len(expected)
+    assert [p["stock"] for p in hits] == sorted((p["stock"] for p in expected), reverse=True)
+    assert counts["brand"][brand] == total
@@ -0,0 +1,29 @@
+import storage
+
+
+def test_seed_n_is_deterministic_and_realistic(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DEFAULT_DB", tmp_path / "db.json")
+    assert storage.seed_n(200, seed=7) == 200
+    first = storage.list_perfumes()
+
+    storage.seed_n(200, seed=7)
+    assert storage.list_perfumes() == first
+    storage.seed_n(200, seed=8)
+    assert storage.list_perfumes() != first
+
+    assert len({p["id"] for p in first}) == 200
+    for p in first:
+        assert p["brand"] and p["family"] and p["concentration"]
+        assert 1 <= len(p["notes"]) <= 5
+        assert 1.0 <= p["rating"] <= 5.0 and p["stock"] >= 0 and p["price"] > 0
+
+
+def test_seed_n_note_popularity_is_skewed(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DEFAULT_DB", tmp_path / "db.json")
+    storage.seed_n(2000, seed=1)
+    counts = {}
+    for p in storage.iter_perfumes():
+        for n in p["notes"]:
+            counts[n] = counts.get(n, 0) + 1
+    ranked = sorted(counts.values(), reverse=True)
+    assert ranked[0] > 5 * ranked[-1]
@@ -0,0 +1,39 @@
+import similarity
+import storage
+
+
+def _brute(items, target):
+    mine = set(target["notes"])
+    out = []
+    for p in items:
+        if p["id"] == target["id"]:
+            continue
+        theirs = set(p["notes"])
+        union = len(mine | theirs)
+        score = similarity.NOTE_WEIGHT * (len(mine & theirs) / union if union else 0)
+        score += similarity.FAMILY_WEIGHT * (p["family"] == target["family"])
+        score += similarity.CONCENTRATION_WEIGHT * (p["concentration"] == target["concentration"])
+        out.append((round(score, 3), p["id"]))
+    return out
+
+
+def test_similar_matches_pairwise_scores(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DEFAULT_DB", tmp_path / "db.json")
+    storage.seed_n(250, seed=4)
+    items = storage.list_perfumes()
+    target = items[10]
+
+    hits = similarity.similar(target["id"], k=8)
+    expected = dict((pid, s) for s, pid in _brute(items, target))
+    assert len(hits) == 8
+    assert target["id"] not in {p["id"] for p in hits}
+    assert all(abs(expected[p["id"]] - p["score"]) < 1e-3 for p in hits)
+    assert hits[0]["score"] == max(expected.values())
+    assert [p["score"] for p in hits] == sorted((p["score"] for p in hits), reverse=True)
+    assert set(hits[0]["shared_notes"]) <= set(target["notes"])
+
+
+def test_unknown_id(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DEFAULT_DB", tmp_path / "db.json")
+    storage.seed_n(5)
+    assert similarity.similar("nope") is None
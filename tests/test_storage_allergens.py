@@ -0,0 +1,61 @@
+import recommend
+import search
+import storage
+from textnorm import fold
+
+
+def _expected(items):
+    out = {}
+    for i, it in enumerate(items):
+        for a in {fold(a) for a in it.get("allergens") or []}:
+            out[a] = out.get(a, 0) | (1 << i)
+    return out
+
+
+def test_bitsets_follow_writes_without_rebuild(seeded):
+    seeded(300, seed=4, journal=True)
+    index = storage._index()
+    items = storage.list_perfumes()
+
+    storage.delete_perfumes([items[3]["id"], items[150]["id"]])
+    storage.update_perfume(items[10]["id"], {"allergens": ["Citral", "Brand New"]})
+    storage.add_perfume({"name": "Last", "brand": "X", "price": 1.0, "allergens": ["linalool"]})
+    storage.delete_perfume(items[0]["id"])
+    storage.delete_perfumes([p["id"] for p in items[200:240:2]])  # many rows at once
+
+    assert storage._index() is index  # journaled writes never rebuilt it
+    assert index.allergens == _expected(storage._catalog())
+    assert index.size == len(storage._catalog()) == 278
+    assert index.allergen_labels["brand new"] == "Brand New"
+
+
+def test_safe_mask_is_complement_of_or(seeded):
+    seeded(300, seed=4, journal=False)
+    items = storage._catalog()
+    avoid = {"linalool", "citral"}
+
+    safe = storage.safe_mask(["Linalool", "CITRAL"])
+    expected = [i for i, it in enumerate(items) if not avoid & {fold(a) for a in it["allergens"]}]
+    assert search.positions(safe, len(items)).tolist() == expected
+    assert storage.allergen_mask([]) == 0
+
+
+def test_exclude_allergens_on_search_and_recommend(seeded):
+    seeded(300, seed=4, journal=True)
+    bad = {"linalool"}
+
+    def clean(hits):
+        return [p for p in hits if not bad & {fold(a) for a in p["allergens"]}]
+
+    hits = search.find("rose")
+    safe = search.find("rose", exclude_allergens=["Linalool"])
+    assert safe and len(safe) < len(hits)
+    assert safe == clean(hits)
+
+    fuzzy = [p for p, _ in search.fuzzy("rose", limit=50, exclude_allergens=["linalool"])]
+    assert fuzzy and fuzzy == clean(fuzzy)
+
+    recs = recommend.recommend({"preferred_notes": ["rose"]}, k=20, exclude_allergens=["linalool"])
+    assert recs == recommend.recommend(
+        {"preferred_notes": ["rose"], "avoid_allergens": ["linalool"]}, k=20
+    )
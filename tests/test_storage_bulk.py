@@ -0,0 +1,39 @@
+import storage
+
+
+def test_bulk_add_validates_and_writes_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DEFAULT_DB", tmp_path / "db.json")
+    writes = []
+    real = storage._save_db
+    monkeypatch.setattr(
+        storage, "_save_db", lambda items, *rest: writes.append(1) or real(items, *rest)
+    )
+
+    results = storage.add_perfumes(
+        [
+            {"name": " Amber Sky ", "brand": "Noctis", "price": "72", "notes": "amber, vanilla"},
+            {"name": "", "brand": "X", "price": 1},
+            {"name": "Cheap", "brand": "X", "price": -1},
+            {"name": "Fine", "brand": "Y", "price": 10, "rating": 4.5},
+        ]
+    )
+
+    assert [r["ok"] for r in results] == [True, False, False, True]
+    assert len(writes) == 1
+    items = storage.list_perfumes()
+    assert items[0]["name"] == "Amber Sky" and items[0]["notes"] == ["amber", "vanilla"]
+    assert items[0]["price"] == 72.0
+
+
+def test_bulk_update_and_delete(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DEFAULT_DB", tmp_path / "db.json")
+    storage.seed_minimal()
+    a, b, c = (p["id"] for p in storage.list_perfumes())
+
+    res = storage.update_perfumes({a: {"stock": 4}, b: {"rating": 9}, "nope": {"stock": 1}})
+    assert [r["ok"] for r in res] == [True, False, False]
+    assert storage.get_perfume(a)["stock"] == 4
+
+    res = storage.apply_bulk({"delete": [a, c, a, "nope"]})
+    assert [r["ok"] for r in res["delete"]] == [True, True, False, False]
+    assert [p["id"] for p in storage.list_perfumes()] == [b]
@@ -0,0 +1,37 @@
+import json
+
+import storage
+
+
+def test_repeated_reads_do_not_reparse(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DEFAULT_DB", tmp_path / "db.json")
+    storage.seed_minimal()
+
+    calls = []
+    real = storage._read_db_file
+    monkeypatch.setattr(storage, "_read_db_file", lambda p: calls.append(p) or real(p))
+
+    assert len(storage.list_perfumes()) == 3
+    assert storage.get_perfume("Rose Dusk")["brand"] == "Floral"
+    assert calls == []
+
+
+def test_external_write_invalidates_cache(tmp_path, monkeypatch):
+    db = tmp_path / "db.json"
+    monkeypatch.setattr(storage, "DEFAULT_DB", db)
+    storage.seed_minimal()
+    before = storage.catalog_version()
+
+    # simulate another process rewriting the file
+    db.write_text(json.dumps([{"id": "x1", "name": "Other", "brand": "B"}]), encoding="utf-8")
+
+    assert [p["name"] for p in storage.list_perfumes()] == ["Other"]
+    assert storage.catalog_version() > before
+
+
+def test_returned_records_are_copies(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DEFAULT_DB", tmp_path / "db.json")
+    storage.seed_minimal()
+
+    storage.list_perfumes()[0]["name"] = "Mutated"
+    assert storage.list_perfumes()[0]["name"] == "Citrus Aurora"
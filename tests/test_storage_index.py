@@ -0,0 +1,52 @@
+import storage
+
+
+def test_lookups_use_hash_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DEFAULT_DB", tmp_path / "db.json")
+    storage.seed_30()
+    items = storage.list_perfumes()
+
+    assert storage.get_perfume(items[5]["id"])["name"] == items[5]["name"]
+    assert storage.get_perfume("Oud Mirage")["brand"] == "Nocturne"
+    assert storage.get_perfume("oud mirage") is None
+    assert storage.find_perfume("  OUD MIRAGE ")["name"] == "Oud Mirage"
+
+
+def test_index_tracks_mutations(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DEFAULT_DB", tmp_path / "db.json")
+    monkeypatch.setattr(storage, "JOURNAL", True)
+    storage.seed_30()
+    first = storage.list_perfumes()[0]
+
+    assert storage.delete_perfume(first["id"])
+    assert storage.update_perfume(storage.list_perfumes()[3]["id"], {"name": "Renamed"})
+    added = storage.add_perfume({"name": "New One", "brand": "X", "price": 1.0})
+
+    index = storage._index()
+    items = storage._catalog()
+    # every indexed position must point back at the right record
+    assert all(items[i]["id"] == pid for pid, i in index.ids.items())
+    assert len(index.ids) == len(items) == 30
+    assert storage.find_perfume("renamed")["id"] == items[3]["id"]
+    assert storage.find_perfume(first["name"]) is None
+    assert storage.get_perfume(added["id"])["name"] == "New One"
+
+
+def test_plain_writes_update_the_cached_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DEFAULT_DB", tmp_path / "db.json")
+    monkeypatch.setattr(storage, "JOURNAL", False)
+    storage.seed_30()
+    index = storage._index()
+
+    added = storage.add_perfume(
+        {"name": "Fresh", "brand": "X", "price": 1.0, "allergens": ["citral"]}
+    )
+    assert storage.update_perfume(added["id"], {"name": "Fresher"})
+    assert storage.delete_perfume(storage.list_perfumes()[0]["id"])
+
+    assert storage._index() is index  # updated in place, never rebuilt
+    storage._CACHE["items"] = None  # cold read agrees with what was cached
+    cold = storage._index()
+    assert cold.ids == index.ids and cold.names == index.names
+    assert cold.allergens == index.allergens
+    assert storage.find_perfume("fresher")["id"] == added["id"]
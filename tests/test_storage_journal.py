@@ -0,0 +1,93 @@
+import storage
+
+
+def _journal_db(tmp_path, monkeypatch):
+    db = tmp_path / "db.json"
+    monkeypatch.setattr(storage, "DEFAULT_DB", db)
+    monkeypatch.setattr(storage, "JOURNAL", True)
+    storage.seed_30()
+    return db, tmp_path / "db.json.log"
+
+
+def test_mutations_append_to_log_not_snapshot(tmp_path, monkeypatch):
+    db, log = _journal_db(tmp_path, monkeypatch)
+    snapshot = db.read_bytes()
+
+    added = storage.add_perfume({"name": "Log Scent", "brand": "J", "price": 10.0})
+    first = storage.list_perfumes()[0]
+    assert storage.update_perfume(first["id"], {"stock": 42})
+    assert storage.delete_perfume(added["id"])
+
+    assert db.read_bytes() == snapshot
+    assert len(log.read_text(encoding="utf-8").splitlines()) == 3
+
+
+def test_reads_replay_log_from_disk(tmp_path, monkeypatch):
+    db, log = _journal_db(tmp_path, monkeypatch)
+    first = storage.list_perfumes()[0]
+    storage.update_perfume(first["id"], {"stock": 42})
+    storage.add_perfume({"name": "Log Scent", "brand": "J", "price": 10.0})
+
+    # drop the in-process cache to force a cold replay
+    storage._CACHE["items"] = None
+    items = storage.list_perfumes()
+    assert len(items) == 31
+    assert items[0]["stock"] == 42
+    assert items[-1]["name"] == "Log Scent"
+
+
+def test_compaction_folds_log_into_snapshot(tmp_path, monkeypatch):
+    db, log = _journal_db(tmp_path, monkeypatch)
+    monkeypatch.setattr(storage, "JOURNAL_MAX_RECORDS", 2)
+
+    for i in range(3):
+        storage.add_perfume({"name": f"Extra {i}", "brand": "J", "price": 1.0})
+
+    assert not log.exists()
+    assert len(storage._read_db_file(db)) == 33
+    assert len(storage.list_perfumes()) == 33
+
+
+def test_append_after_torn_tail_survives_cold_read(tmp_path, monkeypatch):
+    db, log = _journal_db(tmp_path, monkeypatch)
+    first = storage.list_perfumes()[0]
+    storage.update_perfume(first["id"], {"stock": 42})
+    with log.open("a", encoding="utf-8") as f:
+        f.write('{"op":"put","item":{"id":"torn"')  # crash mid-append
+
+    added = storage.add_perfume({"name": "After Crash", "brand": "J", "price": 10.0})
+
+    storage._CACHE["items"] = None
+    items = storage.list_perfumes()
+    assert [it["name"] for it in items].count("After Crash") == 1
+    assert storage.get_perfume(added["id"])["name"] == "After Crash"
+    assert storage.get_perfume("torn") is None
+    assert items[0]["stock"] == 42
+    assert log.read_text(encoding="utf-8").endswith("\n")
+
+
+def test_torn_transaction_is_dropped_whole(tmp_path, monkeypatch):
+    db, log = _journal_db(tmp_path, monkeypatch)
+    items = storage.list_perfumes()
+    storage.update_perfume(items[0]["id"], {"stock": 42})
+    before = log.read_bytes()
+
+    with storage.transaction() as tx:
+        tx.delete(items[1]["id"])
+        tx.delete(items[2]["id"])
+        tx.update(items[3]["id"], {"stock": 7})
+    batch = log.read_bytes()[len(before) :]
+    assert batch.count(b"\n") == 1  # the whole transaction is one journal line
+
+    # crash partway through appending the transaction, at every possible cut
+    for cut in range(1, len(batch)):
+        log.write_bytes(before + batch[:cut])
+        storage._CACHE["items"] = None
+        after = {it["id"]: it for it in storage.list_perfumes()}
+        assert len(after) == 30 and after[items[3]["id"]]["stock"] == items[3]["stock"]
+        assert after[items[0]["id"]]["stock"] == 42
+
+    log.write_bytes(before + batch)
+    storage._CACHE["items"] = None
+    after = {it["id"]: it for it in storage.list_perfumes()}
+    assert len(after) == 28 and after[items[3]["id"]]["stock"] == 7
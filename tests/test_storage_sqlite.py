@@ -0,0 +1,60 @@
+import storage
+import storage_sqlite
+
+
+def _sqlite_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DEFAULT_DB", tmp_path / "db.json")
+    monkeypatch.setattr(storage, "BACKEND", "sqlite")
+
+
+def test_sqlite_backend_roundtrip(tmp_path, monkeypatch):
+    _sqlite_db(tmp_path, monkeypatch)
+    assert storage.seed_minimal() == 3
+
+    stored = storage.add_perfume(
+        {"name": "Oud Test", "brand": "B", "price": 9.0, "notes": ["oud"], "family": "Woody"}
+    )
+    assert storage.get_perfume(stored["id"])["family"] == "Woody"
+    assert storage.get_perfume("Oud Test")["notes"] == ["oud"]
+
+    assert storage.update_perfume(stored["id"], {"price": 12.0, "notes": ["oud", "rose"]})
+    got = storage.get_perfume(stored["id"])
+    assert got["price"] == 12.0 and got["notes"] == ["oud", "rose"] and got["brand"] == "B"
+
+    assert len(storage.list_perfumes()) == 4
+    assert storage.delete_perfume("Oud Test")
+    assert len(storage.list_perfumes()) == 3
+    assert not (tmp_path / "db.json").exists()
+
+
+def test_migrate_json_to_sqlite(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DEFAULT_DB", tmp_path / "db.json")
+    storage.seed_30()
+    names = [p["name"] for p in storage.list_perfumes()]
+
+    assert storage.migrate_to_sqlite() == 30
+    monkeypatch.setattr(storage, "BACKEND", "sqlite")
+    assert [p["name"] for p in storage.list_perfumes()] == names
+
+
+def test_sqlite_uses_indexes(tmp_path):
+    conn = storage_sqlite.connect(tmp_path / "x.sqlite3")
+    plan = " ".join(
+        r[3]
+        for r in conn.execute("EXPLAIN QUERY PLAN SELECT id FROM perfumes WHERE name_key = 'a'")
+    )
+    assert "perfumes_name_key" in plan
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_sqlite_compact_only_vacuums(tmp_path, monkeypatch):
+    _sqlite_db(tmp_path, monkeypatch)
+    storage.seed_30()
+    version = storage.catalog_version()
+
+    def fail(*args, **kwargs):
+        raise AssertionError("compact must not rewrite the table")
+
+    monkeypatch.setattr(storage_sqlite, "replace_all", fail)
+    assert storage.compact() == 30
+    assert storage.catalog_version() == version
@@ -0,0 +1,31 @@
+import json
+
+import storage
+from io_utils import iter_records
+
+
+def test_iter_records_array_small_chunks(tmp_path):
+    data = [{"id": "a", "name": 'x]"[,', "price": 1.5e10}, {"id": "b", "notes": []}, 3]
+    path = tmp_path / "arr.json"
+    path.write_text(json.dumps(data, indent=2), encoding="utf-8")
+
+    assert list(iter_records(path, chunk_size=3)) == data
+
+
+def test_iter_perfumes_cold_merges_journal(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DEFAULT_DB", tmp_path / "db.json")
+    monkeypatch.setattr(storage, "JOURNAL", True)
+    storage.seed_30()
+    items = storage.list_perfumes()
+    storage.delete_perfume(items[0]["id"])
+    storage.update_perfume(items[1]["id"], {"stock": 99})
+    storage.add_perfume({"name": "Tail", "brand": "T", "price": 1.0})
+    expected = storage.list_perfumes()
+
+    storage._CACHE["items"] = None
+    streamed = list(storage.iter_perfumes())
+    assert streamed == expected
+    assert storage._CACHE["items"] is None  # streaming never builds the full list
+    assert storage.count_perfumes() == 30
+    assert storage.load_perfumes() == expected
+    assert storage._CACHE["items"] is None
@@ -0,0 +1,42 @@
+import pytest
+
+import storage
+
+
+def test_transaction_commits_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DEFAULT_DB", tmp_path / "db.json")
+    storage.seed_minimal()
+    writes = []
+    real = storage._save_db
+    monkeypatch.setattr(
+        storage, "_save_db", lambda items, *rest: writes.append(1) or real(items, *rest)
+    )
+
+    with storage.transaction() as tx:
+        added = tx.add({"name": "Tx Scent", "brand": "T", "price": 5.0})
+        assert tx.get("Tx Scent")["id"] == added["id"]
+        assert tx.update("Rose Dusk", {"stock": 9})
+        assert tx.delete("Citrus Aurora")
+        assert not tx.delete("Missing")
+        # nothing is visible outside the transaction until it commits
+        assert len(storage.list_perfumes()) == 3
+
+    assert len(writes) == 1
+    names = [p["name"] for p in storage.list_perfumes()]
+    assert names == ["Rose Dusk", "Vetiver Line", "Tx Scent"]
+    assert storage.get_perfume("Rose Dusk")["stock"] == 9
+
+
+def test_transaction_rolls_back_on_error(tmp_path, monkeypatch):
+    db = tmp_path / "db.json"
+    monkeypatch.setattr(storage, "DEFAULT_DB", db)
+    storage.seed_minimal()
+    before = db.read_bytes()
+
+    with pytest.raises(RuntimeError):
+        with storage.transaction() as tx:
+            tx.delete("Rose Dusk")
+            raise RuntimeError("boom")
+
+    assert db.read_bytes() == before
+    assert storage.get_perfume("Rose Dusk") is not None
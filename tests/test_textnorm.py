@@ -0,0 +1,23 @@
+import search
+import storage
+from textnorm import fold
+
+
+def test_fold():
+    assert fold("Lancôme La Vie Est Belle") == "lancome la vie est belle"
+    assert fold("Dior J’adore Parfum d’eau") == fold("dior jadore parfum d'eau")
+    assert fold("  Eau   de  PARFUM ") == "eau de parfum"
+    assert fold("Straße") == "strasse"
+    assert fold(None) == ""
+
+
+def test_matchers_ignore_accents(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DEFAULT_DB", tmp_path / "db.json")
+    storage.seed_30()
+    added = storage.add_perfume({"name": "J’adore Parfum d’eau", "brand": "Dior", "price": 90.0})
+    storage.add_perfume({"name": "La Vie Est Belle", "brand": "Lancôme", "price": 80.0})
+
+    assert storage.find_perfume("j'adore parfum d'eau")["id"] == added["id"]
+    assert storage._match_exact_identifier("JADORE PARFUM DEAU", added)
+    assert [p["name"] for p in search.find("lancome")] == ["La Vie Est Belle"]
+    assert [p["name"] for p in search.name_contains("jadore")] == ["J’adore Parfum d’eau"]
@@ -0,0 +1,133 @@
+import pytest
+
+import storage
+import web
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DEFAULT_DB", tmp_path / "db.json")
+    storage.seed_30()
+    web.app.config["SEEDED"] = True
+    return web.app.test_client()
+
+
+def test_bulk_applies_parts(client):
+    first = storage.list_perfumes()[0]
+    res = client.post(
+        "/api/admin/bulk",
+        json={
+            "add": [{"name": "Bulk One", "brand": "B", "price": 5}],
+            "update": {first["id"]: {"stock": 9}},
+        },
+    )
+    assert res.status_code == 200 and res.get_json()["ok"]
+    assert storage.get_perfume(first["id"])["stock"] == 9
+    assert storage.find_perfume("bulk one") is not None
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        {"add": [1]},
+        {"add": {"name": "x"}},
+        {"update": [1]},
+        {"update": {"some-id": 3}},
+        {"delete": "abc"},
+        {"delete": [{"id": "x"}]},
+        "add",
+        {"ad": [{"name": "x", "brand": "y"}]},
+        {"add": [], "remove": ["x"]},
+        {},
+        [],
+        {"add": [], "delete": []},
+    ],
+)
+def test_bulk_rejects_bad_shapes(client, payload):
+    before = storage.list_perfumes()
+    res = client.post("/api/admin/bulk", json=payload)
+    assert res.status_code == 400
+    assert "error" in res.get_json()
+    assert storage.list_perfumes() == before
+
+
+def test_bulk_rejects_unparseable_body(client):
+    res = client.post("/api/admin/bulk", data="{not json", content_type="application/json")
+    assert res.status_code == 400 and res.get_json()["error"]
+
+
+def test_search_negative_limit_is_clamped(client):
+    res = client.get("/api/search?q=rose&limit=-1")
+    assert res.status_code == 200
+    body = res.get_json()
+    assert body["total"] == 2 and body["items"] == []
+    assert client.get("/api/search?q=rose&fuzzy=1&limit=-5").get_json()["items"] == []
+
+
+def test_perfumes_limit_zero_is_honoured(client):
+    for query in ("limit=0", "limit=-3"):
+        body = client.get(f"/api/perfumes?{query}").get_json()
+        assert body == {"total": 30, "items": [], "next": None}, query
+    after = client.get("/api/perfumes?limit=2").get_json()["next"]
+    assert client.get(f"/api/perfumes?limit=0&after={after}").get_json()["items"] == []
+    assert len(client.get("/api/perfumes?after=").get_json()["items"]) == 30
+
+
+def test_terminal_find_takes_negated_terms(client):
+    storage.add_perfume(
+        {"name": "Citral Rose", "brand": "X", "notes": ["rose"], "allergens": ["citral"]}
+    )
+    body = client.post("/api/cli", json={"cmd": "find notes:rose -allergen:citral"}).get_json()
+    assert body["ok"] and "Rose Dusk" in body["output"]
+    assert "Citral Rose" not in body["output"]
+    assert client.post("/api/cli", json={"cmd": 'find "rose'}).get_json()["ok"]
+
+
+def test_cache_stats_are_the_web_process_counters(client):
+    before = client.get("/api/admin/cache").get_json()
+    client.get("/api/search?q=zzcachetest")
+    client.get("/api/search?q=zzcachetest")
+    after = client.get("/api/admin/cache").get_json()
+    assert after["hits"] == before["hits"] + 1 and after["misses"] == before["misses"] + 1
+
+    out = client.post("/api/cli", json={"cmd": "cache-stats"}).get_json()["output"]
+    assert f"hits: {after['hits']}" in out
+
+
+def test_similar_endpoint(client):
+    pid = storage.find_perfume("rose dusk")["id"]
+    body = client.get(f"/api/perfumes/{pid}/similar?k=500").get_json()
+    assert body["id"] == pid and 0 < len(body["items"]) <= 100
+    assert pid not in {p["id"] for p in body["items"]}
+    assert client.get("/api/perfumes/nope/similar").status_code == 404
+
+
+def test_recommend_endpoint(client):
+    body = client.post("/api/recommend", json={"preferred_notes": ["rose"], "k": 3}).get_json()
+    assert body["items"] and all("rose" in p["matched_notes"] for p in body["items"][:1])
+    # a lone string is one note, not a list of letters
+    lone = client.post("/api/recommend", json={"preferred_notes": "rose", "k": 3}).get_json()
+    assert lone == body
+    got = client.get("/api/recommend?notes=rose&k=3").get_json()
+    assert got == body
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        ["rose"],
+        "rose",
+        {"preferred_notes": 5},
+        {"avoid_allergens": [1, 2]},
+        {"preferred_notes": ["rose"], "k": "many"},
+    ],
+)
+def test_recommend_rejects_bad_bodies(client, payload):
+    res = client.post("/api/recommend", json=payload)
+    assert res.status_code == 400 and res.get_json()["error"]
+
+
+def test_recommend_rejects_unparseable_body(client):
+    res = client.post("/api/recommend", data="{oops", content_type="application/json")
+    assert res.status_code == 400 and res.get_json()["error"]
+    assert client.post("/api/recommend").status_code == 200  # no body at all is fine
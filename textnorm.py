@@ -0,0 +1,33 @@
+"""Search-key normalisation shared by every matcher.
+
+``fold("Lancôme J’adore")`` -> ``"lancome jadore"``: Unicode compatibility
+decomposition, accents dropped, casefolded, apostrophes removed and
+whitespace collapsed, so user input and stored names compare equal however
+either was typed.
+"""
+
+from __future__ import annotations
+
+import unicodedata
+from functools import lru_cache
+from typing import Any
+
+# straight and typographic apostrophes/primes vanish so "J’adore" == "jadore"
+_DROP = dict.fromkeys(map(ord, "'‘’‛ʼ′`´"))
+
+
+@lru_cache(maxsize=65536)
+def _fold(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.translate(_DROP).casefold().split())
+
+
+def fold(value: Any) -> str:
+    """Normalised, accent- and case-insensitive key for ``value`` ("" for None)."""
+    if value is None:
+        return ""
+    text = str(value)
+    if text.isascii() and "'" not in text and "`" not in text:
+        return " ".join(text.lower().split())  # fast path: nothing to decompose
+    return _fold(text)
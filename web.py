@@ -1,15 +1,22 @@
 from __future__ import annotations
 
+import json
 import shlex
 
 from click.testing import CliRunner
-from flask import Flask, jsonify, render_template_string, request
+from flask import Flask, Response, jsonify, render_template_string, request
 
 import cli_app
+import recommend
+import resultcache
+import search
+import similarity
 import storage
 
 app = Flask(__name__, static_folder="static", template_folder="templates")
 runner = CliRunner()
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
 app.config.setdefault("SEEDED", False)
 
 
@@ -31,9 +38,140 @@ def seed_once():
 
 
 # ---------- JSON API (kept compatible with your app) ----------
+def _facet_args() -> tuple[dict, dict]:
+    # ?brand=Dior&brand=Chanel&exclude_allergen=linalool (comma lists also accepted)
+    def values(key: str) -> list[str]:
+        return [v.strip() for raw in request.args.getlist(key) for v in raw.split(",") if v.strip()]
+
+    include = {f: values(f) for f in search.FACETS if values(f)}
+    exclude = {f: values(f"exclude_{f}") for f in search.FACETS if values(f"exclude_{f}")}
+    if _excluded_allergens():
+        exclude["allergen"] = exclude.get("allergen", []) + _excluded_allergens()
+    return include, exclude
+
+
+def _excluded_allergens() -> list[str]:
+    # ?exclude_allergens=linalool,citral, as accepted by search and recommend too
+    return [
+        v.strip()
+        for raw in request.args.getlist("exclude_allergens")
+        for v in raw.split(",")
+        if v.strip()
+    ]
+
+
 @app.get("/api/perfumes")
 def api_perfumes():
-    return jsonify(storage.list_perfumes())
+    include, exclude = _facet_args()
+    ranges = {
+        f: (request.args.get(f"min_{f}", type=float), request.args.get(f"max_{f}", type=float))
+        for f in search.SORTABLE
+        if f"min_{f}" in request.args or f"max_{f}" in request.args
+    }
+    sort = request.args.get("sort") or None
+    limit = request.args.get("limit", type=int)
+    if not sort and (limit is not None or "after" in request.args):
+        # keyset pagination: ?limit=50 then ?limit=50&after=<next from the previous page>
+        size = PAGE_SIZE if limit is None else max(0, min(limit, MAX_PAGE_SIZE))
+        try:
+            total, items, nxt = search.page(
+                size, request.args.get("after"), include, exclude, ranges
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify({"total": total, "items": items, "next": nxt})
+    if include or exclude or ranges or sort or limit is not None or "facets" in request.args:
+        order = request.args.get("order", "").lower()
+        try:
+            total, items, counts = search.browse(
+                include,
+                exclude,
+                ranges,
+                sort=sort,
+                descending={"asc": False, "desc": True}.get(order),
+                limit=limit,
+                facets=True,
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify({"total": total, "items": items, "facets": counts})
+
+    # Stream the array so the first bytes go out before the catalog is fully read.
+    def generate():
+        yield "["
+        for i, p in enumerate(storage.iter_perfumes()):
+            yield ("," if i else "") + json.dumps(p, ensure_ascii=False)
+        yield "]"
+
+    return Response(generate(), mimetype="application/json")
+
+
+@app.get("/api/search")
+def api_search():
+    q = request.args.get("q", "")
+    limit = request.args.get("limit", type=int)
+    if limit is not None:
+        limit = max(0, limit)
+    if request.args.get("fuzzy", "").lower() in ("1", "true", "yes"):
+        cutoff = request.args.get("cutoff", 60.0, type=float)
+        scored = search.fuzzy(
+            q,
+            limit=10 if limit is None else limit,
+            score_cutoff=cutoff,
+            exclude_allergens=_excluded_allergens(),
+        )
+        items = [dict(p, score=score) for p, score in scored]
+        return jsonify({"query": q, "fuzzy": True, "total": len(items), "items": items})
+    mode = "or" if request.args.get("op", "and").lower() == "or" else "and"
+    hits = search.find(q, mode=mode, exclude_allergens=_excluded_allergens())
+    return jsonify({"query": q, "op": mode, "total": len(hits), "items": hits[:limit]})
+
+
+@app.get("/api/perfumes/<pid>/similar")
+def api_similar(pid: str):
+    k = max(1, min(request.args.get("k", 10, type=int), 100))
+    hits = similarity.similar(pid, k)
+    if hits is None:
+        return jsonify({"error": f"No perfume with id {pid}"}), 404
+    return jsonify({"id": pid, "items": hits})
+
+
+@app.route("/api/recommend", methods=["GET", "POST"])
+def api_recommend():
+    # POST a profile {"preferred_notes": [...], "avoid_allergens": [...], "k": 10},
+    # or GET ?notes=rose,amber&avoid=linalool&k=10; ?exclude_allergens= applies to both
+    exclude = _excluded_allergens()
+    if request.method == "POST":
+        profile = request.get_json(force=True, silent=True)
+        if profile is None:
+            if request.get_data().strip():
+                return jsonify({"error": "Body must be JSON"}), 400
+            profile = {}  # no body: rank on rating alone
+        if not isinstance(profile, dict):
+            return jsonify({"error": "Body must be a JSON object"}), 400
+        k = profile.get("k", 10)
+    else:
+        profile = {
+            "preferred_notes": request.args.get("notes", "").split(","),
+            "avoid_allergens": request.args.get("avoid", "").split(","),
+        }
+        k = request.args.get("k", 10, type=int)
+    try:
+        k = max(1, min(int(k), 100))
+    except (TypeError, ValueError):
+        return jsonify({"error": "k must be a number"}), 400
+    try:
+        items = recommend.recommend(profile, k, exclude_allergens=exclude)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"items": items})
+
+
+@app.get("/api/suggest")
+def api_suggest():
+    q = request.args.get("q", "")
+    limit = max(1, min(request.args.get("limit", 8, type=int), 50))
+    return jsonify({"query": q, "items": search.suggest(q, limit)})
 
 
 @app.post("/api/admin/add")
@@ -51,6 +189,25 @@ def api_admin_add():
     return jsonify({"ok": True, "result": rec})
 
 
+@app.post("/api/admin/bulk")
+def api_admin_bulk():
+    # {"add": [...], "update": {id: {...}}, "delete": [ids]} (or a bare list to add)
+    data = request.get_json(force=True, silent=True)
+    if data is None:
+        return jsonify({"error": "Body must be JSON"}), 400
+    try:
+        results = storage.apply_bulk(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    ok = all(r["ok"] for part in results.values() for r in part)
+    return jsonify({"ok": ok, **results})
+
+
+@app.get("/api/admin/cache")
+def api_admin_cache():
+    return jsonify(resultcache.stats())
+
+
 # ---------- CLI bridge ----------
 @app.post("/api/cli")
 def api_cli():
@@ -58,7 +215,10 @@ def api_cli():
     args = data.get("args") or data.get("cmd") or data.get("command") or ""
     if isinstance(args, str):
         s = args.strip()
-        argv = ["--help"] if s.lower() == "help" else (shlex.split(s) if s else [])
+        try:
+            argv = ["--help"] if s.lower() == "help" else shlex.split(s)
+        except ValueError:  # unbalanced quote: take the words as typed
+            argv = s.split()
     else:
         argv = list(args)
     res = runner.invoke(cli_app.app, argv)
@@ -168,6 +328,7 @@ seed-30</code></pre>
       <button id="btn-seed30">seed-30</button>
       <button id="btn-clear">clear</button>
     </div>
+    <div class="hint" id="suggest"></div>
     <div class="hint">This web terminal invokes the same Click CLI as your local app (server-side).</div>
   </div>
 </main>
@@ -195,8 +356,32 @@ seed-30</code></pre>
     }catch(e){ log('<div class="err">Request failed.</div>\\n'); }
   }
 
+  // completions for the word under the cursor; Tab takes the first one
+  const hint = document.getElementById('suggest');
+  let suggestions = []; let pending = 0;
+  async function suggest(){
+    const word = cmd.value.split(/\s+/).pop();
+    const ticket = ++pending;
+    if (word.length < 2){ suggestions = []; hint.textContent = ''; return; }
+    try{
+      const res = await fetch('/api/suggest?limit=6&q=' + encodeURIComponent(word));
+      const data = await res.json();
+      if (ticket !== pending) return;  // a newer keystroke already answered
+      suggestions = (data.items || []).map(x => x.text);
+      hint.textContent = suggestions.length ? 'Tab: ' + suggestions.join(' · ') : '';
+    }catch(e){ suggestions = []; hint.textContent = ''; }
+  }
+  cmd.addEventListener('input', suggest);
+
   cmd.addEventListener('keydown', (e)=>{
-    if (e.key === 'Enter'){ run(cmd.value); cmd.value=''; }
+    if (e.key === 'Tab' && suggestions.length){
+      e.preventDefault();
+      const words = cmd.value.split(/(\s+)/); words.pop();
+      const pick = suggestions[0];
+      cmd.value = words.join('') + (/\s/.test(pick) ? '"' + pick + '"' : pick) + ' ';
+      suggestions = []; hint.textContent = '';
+    }
+    else if (e.key === 'Enter'){ run(cmd.value); cmd.value=''; suggestions = []; hint.textContent = ''; }
     else if(e.key === 'ArrowUp'){ e.preventDefault(); if(hIndex>0){ hIndex--; cmd.value=history[hIndex]||''; cmd.setSelectionRange(cmd.value.length, cmd.value.length);} }
     else if(e.key === 'ArrowDown'){ e.preventDefault(); if(hIndex<history.length){ hIndex++; cmd.value=history[hIndex]||''; cmd.setSelectionRange(cmd.value.length, cmd.value.length);} }
     else if(e.key.toLowerCase() === 'l' && e.ctrlKey){ e.preventDefault(); out.innerHTML=''; }